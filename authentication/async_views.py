@@ -0,0 +1,280 @@
+"""
+Native async versions of the authentication views, for running under ASGI.
+
+They mirror views.py endpoint for endpoint and return byte-identical JSON, but
+use the async ORM, async cache and httpx, so an in-flight upstream refresh only
+holds a coroutine instead of a worker thread. Enabled with SUPABASE_ASYNC_VIEWS.
+"""
+import functools
+import json
+from typing import Dict, Tuple
+import httpx
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import status
+from authentication.audit import get_audit_log
+from authentication.cache import get_user_cache
+from authentication.metrics import timed
+from authentication.models import AuthAuditEvent, RefreshSession, RefreshTokenInUse, SupabaseUser
+from authentication.policy import public
+from authentication.ratelimit import ratelimit
+from authentication.refresh import get_refresh_coalescer
+from authentication.routers import apin_to_primary
+from authentication.renderers import FastJSONRenderer
+from authentication.revocation import get_revocation_list
+from authentication.serializers import (
+    LoginSerializer,
+    RefreshTokenSerializer,
+    login_user_data,
+    refresh_token_data,
+)
+from authentication.supabase_client import SupabaseUnavailable, get_async_supabase_client
+from authentication.utils import bearer_token, get_jwt_validator
+
+
+_renderer = FastJSONRenderer()
+
+
+def _json_response(data: Dict, status_code: int) -> HttpResponse:
+    """Render data with the same renderer the sync views use."""
+    return HttpResponse(
+        _renderer.render(data),
+        status=status_code,
+        content_type='application/json',
+    )
+
+
+def _post_only(view):
+    """Reject non-POST requests the way DRF's @api_view(['POST']) does."""
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            response = _json_response(
+                {'detail': f'Method "{request.method}" not allowed.'},
+                status.HTTP_405_METHOD_NOT_ALLOWED
+            )
+            response['Allow'] = 'POST, OPTIONS'
+            return response
+        return await view(request, *args, **kwargs)
+    wrapper.csrf_exempt = True
+    return wrapper
+
+
+def _parse_body(request) -> Dict:
+    """
+    Parse the JSON request body like DRF's JSONParser.
+    
+    Raises:
+        ValueError: If the body is not valid JSON
+    """
+    if not request.body:
+        return {}
+    return json.loads(request.body)
+
+
+def _parse_error(exc: ValueError) -> HttpResponse:
+    return _json_response({'detail': f'JSON parse error - {exc}'}, status.HTTP_400_BAD_REQUEST)
+
+
+@public
+@ratelimit('login', '20/m', key='ip')
+@ratelimit('login', '10/m', key='user')
+@_post_only
+async def login_view(request):
+    """
+    Public endpoint to login and save user information.
+    Accepts access_token and refresh_token from Supabase.
+    """
+    try:
+        serializer = LoginSerializer(data=_parse_body(request))
+    except ValueError as exc:
+        return _parse_error(exc)
+    
+    with timed('validate'):
+        is_valid = serializer.is_valid()
+    
+    if not is_valid:
+        return _json_response(
+            {'error': 'Invalid request data', 'details': serializer.errors},
+            status.HTTP_400_BAD_REQUEST
+        )
+    
+    access_token = serializer.validated_data['access_token']
+    refresh_token = serializer.validated_data['refresh_token']
+    
+    # Validate the access token
+    validator = get_jwt_validator()
+    with timed('jwt_decode'):
+        token_payload = await validator.avalidate_token(access_token)
+    
+    if not token_payload:
+        get_audit_log().record(AuthAuditEvent.LOGIN_FAILED, request, detail='Invalid or expired access token')
+        return _json_response(
+            {'error': 'Invalid or expired access token'},
+            status.HTTP_401_UNAUTHORIZED
+        )
+    
+    # Extract user information from token
+    user_id = validator.extract_user_id(token_payload)
+    email = token_payload.get('email') or token_payload.get('user_metadata', {}).get('email', '')
+    
+    if not user_id:
+        get_audit_log().record(AuthAuditEvent.LOGIN_FAILED, request, detail='Invalid token payload')
+        return _json_response(
+            {'error': 'Invalid token payload'},
+            status.HTTP_401_UNAUTHORIZED
+        )
+    
+    device = serializer.validated_data.get('device') or request.META.get('HTTP_USER_AGENT', '')
+    
+    # Pin before writing, so no read in between can put the replica's stale row back in the user cache
+    await apin_to_primary(user_id)
+    
+    # Create or update the user (single upsert, no-op if unchanged) and start a session for this device
+    with timed('db_write'):
+        user, created = await SupabaseUser.objects.aupsert_login(user_id, email)
+        try:
+            await RefreshSession.objects.astart(user, refresh_token, device)
+        except RefreshTokenInUse:
+            get_audit_log().record(AuthAuditEvent.LOGIN_FAILED, request, user_id=user_id, detail='Refresh token belongs to another user')
+            return _json_response(
+                {'error': 'Invalid refresh token'},
+                status.HTTP_401_UNAUTHORIZED
+            )
+    await get_user_cache().ainvalidate(user.supabase_user_id)
+    get_audit_log().record(AuthAuditEvent.LOGIN, request, user_id=user_id)
+    
+    return _json_response(
+        {
+            'message': 'Login successful',
+            'user': login_user_data(user),
+            'created': created
+        },
+        status.HTTP_200_OK
+    )
+
+
+@public
+@_post_only
+async def logout_view(request):
+    """
+    Public endpoint to logout and end the session of a refresh token.
+    Optionally accepts a token in the header to identify the user.
+    """
+    # Revoke the access token so it stops working before it expires
+    access_token = bearer_token(request)
+    user_id = None
+    if access_token:
+        # Identify the user for the audit log while the token is still valid
+        validator = get_jwt_validator()
+        token_payload = await validator.avalidate_token(access_token)
+        user_id = validator.extract_user_id(token_payload) if token_payload else None
+        with timed('db_write'):
+            await get_revocation_list().arevoke(access_token)
+    get_audit_log().record(AuthAuditEvent.LOGOUT, request, user_id=user_id)
+    
+    try:
+        data = _parse_body(request)
+    except ValueError as exc:
+        return _parse_error(exc)
+    
+    # End the session of the given refresh token
+    refresh_token = data.get('refresh_token') if isinstance(data, dict) else None
+    if refresh_token:
+        with timed('db_write'):
+            await RefreshSession.objects.aend(refresh_token)
+        return _json_response({'message': 'Logout successful'}, status.HTTP_200_OK)
+    
+    # Without a refresh token, log the user from the header out of every device
+    if user_id:
+        with timed('db_write'):
+            await RefreshSession.objects.aend_all(user_id)
+    
+    # Logout is idempotent, so always report success
+    return _json_response({'message': 'Logout successful'}, status.HTTP_200_OK)
+
+
+@public
+@ratelimit('refresh', '60/m', key='ip')
+@ratelimit('refresh', '10/m', key='refresh_token')
+@_post_only
+async def refresh_token_view(request):
+    """
+    Public endpoint to refresh access token using refresh token.
+    Exchanges refresh token with Supabase for new access token.
+    Concurrent refreshes of the same token share a single exchange.
+    """
+    try:
+        serializer = RefreshTokenSerializer(data=_parse_body(request))
+    except ValueError as exc:
+        return _parse_error(exc)
+    
+    with timed('validate'):
+        is_valid = serializer.is_valid()
+    
+    if not is_valid:
+        return _json_response(
+            {'error': 'Invalid request data', 'details': serializer.errors},
+            status.HTTP_400_BAD_REQUEST
+        )
+    
+    refresh_token = serializer.validated_data['refresh_token']
+    
+    status_code, data = await get_refresh_coalescer().arun(
+        refresh_token,
+        lambda: _exchange_refresh_token(request, refresh_token)
+    )
+    return _json_response(data, status_code)
+
+
+async def _exchange_refresh_token(request, refresh_token: str) -> Tuple[int, Dict]:
+    """
+    Exchange a refresh token with Supabase and store the rotated token.
+    Coalesced requests share one exchange and so one audit event.
+    
+    Returns:
+        Tuple of (HTTP status code, response data)
+    """
+    # Verify refresh token belongs to an active session
+    try:
+        with timed('db_read'):
+            session = await RefreshSession.objects.aget_active(refresh_token)
+    except RefreshSession.DoesNotExist:
+        get_audit_log().record(AuthAuditEvent.REFRESH_FAILED, request, detail='Invalid refresh token')
+        return status.HTTP_401_UNAUTHORIZED, {'error': 'Invalid refresh token'}
+    user_id = session.user.supabase_user_id
+    
+    # Exchange refresh token with Supabase for new tokens
+    supabase_url = getattr(settings, 'SUPABASE_URL', None)
+    if not supabase_url:
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, {'error': 'Supabase configuration error'}
+    
+    # Call Supabase token refresh endpoint
+    try:
+        with timed('upstream'):
+            response = await get_async_supabase_client().refresh_session(refresh_token)
+    except (httpx.HTTPError, SupabaseUnavailable):
+        get_audit_log().record(
+            AuthAuditEvent.REFRESH_FAILED, request, user_id=user_id, detail='Failed to communicate with Supabase'
+        )
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, {'error': 'Failed to communicate with Supabase'}
+    
+    if response.status_code != 200:
+        get_audit_log().record(
+            AuthAuditEvent.REFRESH_FAILED, request, user_id=user_id, detail='Failed to refresh token with Supabase'
+        )
+        return status.HTTP_401_UNAUTHORIZED, {'error': 'Failed to refresh token with Supabase'}
+    
+    data = response.json()
+    new_access_token = data.get('access_token')
+    new_refresh_token = data.get('refresh_token', refresh_token)  # Fallback to old if not provided
+    
+    # Pin first, so reads right after the rotation can't miss it on a lagging replica
+    await apin_to_primary(user_id)
+    
+    # Store the rotated token on the session
+    with timed('db_write'):
+        await RefreshSession.objects.arotate(session, new_refresh_token)
+    
+    get_audit_log().record(AuthAuditEvent.REFRESH, request, user_id=user_id)
+    return status.HTTP_200_OK, refresh_token_data(new_access_token, new_refresh_token)
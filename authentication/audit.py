@@ -0,0 +1,180 @@
+"""
+Audit log of authentication events.
+
+    get_audit_log().record(AuthAuditEvent.LOGIN, request, user_id=user_id)
+
+record() only appends to a bounded in-memory queue, so it adds no query and
+no blocking to the request. Every AUTH_AUDIT_FLUSH_INTERVAL seconds a
+background thread drains the queue and writes the events with bulk INSERTs of
+up to AUTH_AUDIT_BATCH_SIZE rows.
+
+If the database falls behind and the queue fills up, new events are dropped
+and counted rather than slowing requests down; the counters are exported on
+/metrics. Queued events are flushed when the process exits.
+"""
+import atexit
+import ipaddress
+import logging
+import queue
+import threading
+import uuid
+from typing import Dict, Optional
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+from authentication.models import AuthAuditEvent
+from authentication.ratelimit import client_ip
+
+
+logger = logging.getLogger(__name__)
+
+
+def _uuid_or_none(value) -> Optional[uuid.UUID]:
+    if value is None:
+        return None
+    try:
+        return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _ip_or_none(value: str) -> Optional[str]:
+    # A malformed address would make the whole batch fail on the inet column
+    try:
+        return str(ipaddress.ip_address(value))
+    except ValueError:
+        return None
+
+
+class AuditLog:
+    """Bounded queue of audit events with a background batch writer."""
+    
+    def __init__(self):
+        self.enabled = getattr(settings, 'AUTH_AUDIT_ENABLED', True)
+        self.batch_size = getattr(settings, 'AUTH_AUDIT_BATCH_SIZE', 500)
+        self.flush_interval = getattr(settings, 'AUTH_AUDIT_FLUSH_INTERVAL', 1.0)
+        self.queue = queue.Queue(maxsize=getattr(settings, 'AUTH_AUDIT_QUEUE_SIZE', 10000))
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+    
+    def start(self):
+        """Start the writer thread, once per process."""
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+            thread.start()
+            # Flush what's queued when the worker shuts down
+            atexit.register(self.stop)
+            self._thread = thread
+    
+    def record(self, event: str, request=None, user_id=None, detail: str = ''):
+        """
+        Queue an event without blocking.
+        
+        Args:
+            event: One of the AuthAuditEvent event constants
+            request: The request, for the client IP, User-Agent and path
+            user_id: Supabase user ID, if known
+            detail: Short reason, e.g. why a login failed
+        """
+        if not self.enabled:
+            return
+        if self._stopped.is_set():
+            self.dropped += 1
+            return
+        self.start()
+        
+        fields = {
+            'event': event,
+            'supabase_user_id': user_id,
+            'detail': detail[:255],
+            'created_at': timezone.now(),
+        }
+        if request is not None:
+            fields['ip_address'] = client_ip(request)
+            fields['user_agent'] = request.META.get('HTTP_USER_AGENT', '')[:255]
+            fields['path'] = request.path[:255]
+        
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+    
+    def _run(self):
+        # Wake up once per interval rather than per event, so the writes stay batched
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+        connections.close_all()
+    
+    def flush(self):
+        """Write everything queued so far, batch_size rows per INSERT."""
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if not batch:
+                return
+            self._write(batch)
+    
+    def _write(self, batch):
+        close_old_connections()
+        events = [
+            AuthAuditEvent(
+                event=fields['event'],
+                supabase_user_id=_uuid_or_none(fields['supabase_user_id']),
+                ip_address=_ip_or_none(fields.get('ip_address', '')),
+                user_agent=fields.get('user_agent', ''),
+                path=fields.get('path', ''),
+                detail=fields['detail'],
+                created_at=fields['created_at'],
+            )
+            for fields in batch
+        ]
+        try:
+            AuthAuditEvent.objects.bulk_create(events)
+        except Exception:
+            self.write_errors += 1
+            self.dropped += len(events)
+            logger.exception('Failed to write %d audit events', len(events))
+            return
+        self.written += len(events)
+    
+    def stop(self, timeout: float = 10.0):
+        """Stop accepting events and wait for the queued ones to be written."""
+        self._stopped.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                logger.warning('Audit writer did not finish; %d events not written', self.queue.qsize())
+    
+    def stats(self) -> Dict[str, int]:
+        """Return queue and writer counters."""
+        return {
+            'queued': self.queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'write_errors': self.write_errors,
+        }
+
+
+# Singleton instance
+_audit_log = None
+
+
+def get_audit_log() -> AuditLog:
+    """Get or create the audit log singleton."""
+    global _audit_log
+    if _audit_log is None:
+        _audit_log = AuditLog()
+    return _audit_log
@@ -0,0 +1,258 @@
+"""
+Batched API requests: several sub-requests in one round trip.
+    
+    POST /api/batch/
+    {
+        "parallel": true,
+        "requests": [
+            {"id": "schedule", "method": "GET", "path": "/api/games/?date=2026-03-14"},
+            {"id": "ratings", "method": "GET", "path": "/api/games/ratings/"}
+        ]
+    }
+
+The caller's token is validated once, by the middleware on the batch request
+itself. Each sub-request is then resolved against the URLconf and handed
+straight to its view with the already authenticated user, so it skips the
+CORS, token validation and user lookup work a separate request would repeat.
+Route policies still apply per sub-request: role-restricted routes are checked
+against the caller's role as stored in the database.
+
+Responses come back in request order:
+    
+    {"responses": [{"id": "schedule", "status": 200, "body": {...}}, ...]}
+"""
+import io
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import unquote_to_bytes
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import close_old_connections
+from django.http import Http404, HttpResponse
+from django.urls import Resolver404, get_resolver
+from django.utils.encoding import iri_to_uri
+from authentication.models import SupabaseUser
+from authentication.policy import authenticated, get_route_policies
+from authentication.renderers import FastJSONRenderer
+from authentication.users import database_role
+
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE', 'HEAD', 'OPTIONS')
+
+# Request metadata that describes the batch request itself rather than the caller
+_REQUEST_META = ('PATH_INFO', 'REQUEST_METHOD', 'QUERY_STRING', 'CONTENT_TYPE', 'CONTENT_LENGTH', 'wsgi.input')
+
+_renderer = FastJSONRenderer()
+
+
+def _json_response(data: Dict, status_code: int) -> HttpResponse:
+    return HttpResponse(_renderer.render(data), status=status_code, content_type='application/json')
+
+
+# Singleton instance
+_executor = None
+
+
+def get_batch_executor() -> ThreadPoolExecutor:
+    """
+    Get or create the thread pool parallel sub-requests run on.
+    
+    The pool lives as long as the process, so its threads keep their
+    database connections open between batches like request threads do.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'BATCH_MAX_WORKERS', 4),
+            thread_name_prefix='batch',
+        )
+    return _executor
+
+
+def parse_batch(body: bytes) -> Tuple[List[Dict], bool]:
+    """
+    Validate a batch request body.
+    
+    Returns:
+        Tuple of (sub-requests with method, path and body filled in, parallel flag)
+    
+    Raises:
+        ValueError: With a message for the client if the body is malformed
+    """
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        raise ValueError('Request body must be JSON')
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list) or not data['requests']:
+        raise ValueError('"requests" must be a non-empty list')
+    
+    max_requests = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+    if len(data['requests']) > max_requests:
+        raise ValueError(f'At most {max_requests} requests can be batched')
+    
+    sub_requests = []
+    for index, item in enumerate(data['requests']):
+        if not isinstance(item, dict):
+            raise ValueError(f'Request {index} must be an object')
+        path = item.get('path')
+        if not isinstance(path, str) or not path.startswith('/'):
+            raise ValueError(f'Request {index} needs an absolute "path"')
+        method = str(item.get('method', 'GET')).upper()
+        if method not in METHODS:
+            raise ValueError(f'Request {index} has an unsupported method')
+        sub_requests.append({
+            'id': item.get('id', index),
+            'method': method,
+            'path': path,
+            'body': item.get('body'),
+        })
+    return sub_requests, bool(data.get('parallel', False))
+
+
+def _build_request(request, sub_request: Dict) -> WSGIRequest:
+    """
+    Create the request a sub-request's view sees, carrying over the caller's headers and user.
+    
+    Raises:
+        UnicodeError: If the path can't be encoded as UTF-8 (a lone surrogate)
+    """
+    # Non-ASCII characters are sent percent-encoded, as a browser would
+    path, _, query_string = iri_to_uri(sub_request['path']).partition('?')
+    data = b'' if sub_request['body'] is None else json.dumps(sub_request['body']).encode()
+    
+    environ = {key: value for key, value in request.META.items() if key not in _REQUEST_META}
+    environ.update({
+        # Percent-decoded bytes as Latin-1, like a WSGI server passes it
+        'PATH_INFO': unquote_to_bytes(path).decode('iso-8859-1'),
+        'REQUEST_METHOD': sub_request['method'],
+        'QUERY_STRING': query_string,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(data)),
+        'wsgi.input': io.BytesIO(data),
+    })
+    sub = WSGIRequest(environ)
+    sub.user = request.user
+    sub.auth_policy = get_route_policies().lookup(sub.path_info, sub.method)
+    return sub
+
+
+def _authorize(sub) -> Optional[Tuple[int, Dict]]:
+    """Check the caller's role against a role-restricted sub-request route."""
+    if not sub.auth_policy.roles:
+        return None
+    try:
+        role = database_role(sub.user)
+    except SupabaseUser.DoesNotExist:
+        return 401, {'error': 'User not found in database'}
+    if role not in sub.auth_policy.roles:
+        return 403, {'error': 'Insufficient permissions'}
+    return None
+
+
+def _decode(response) -> object:
+    """The body of a sub-response as JSON data, or as text if it isn't JSON."""
+    content = response.content
+    if not content:
+        return None
+    if response.get('Content-Type', '').startswith('application/json'):
+        try:
+            return json.loads(content)
+        except ValueError:
+            pass
+    return content.decode(response.charset or 'utf-8', errors='replace')
+
+
+def dispatch(request, sub_request: Dict) -> Dict:
+    """Run one sub-request through its view and return its entry in the batch response."""
+    entry = {'id': sub_request['id']}
+    try:
+        sub = _build_request(request, sub_request)
+    except UnicodeError:
+        entry.update(status=400, body={'error': 'Invalid path'})
+        return entry
+    try:
+        match = get_resolver().resolve(sub.path_info)
+    except Resolver404:
+        entry.update(status=404, body={'error': 'Not found'})
+        return entry
+    if match.func is batch_view:
+        entry.update(status=400, body={'error': 'Batch requests cannot be nested'})
+        return entry
+    
+    denied = _authorize(sub)
+    if denied is not None:
+        entry.update(status=denied[0], body=denied[1])
+        return entry
+    sub.resolver_match = match
+    
+    try:
+        view = async_to_sync(match.func) if iscoroutinefunction(match.func) else match.func
+        response = view(sub, *match.args, **match.kwargs)
+        if callable(getattr(response, 'render', None)):
+            # DRF and template responses are rendered by the handler, which is skipped here
+            response = response.render()
+    except Http404:
+        entry.update(status=404, body={'error': 'Not found'})
+        return entry
+    except PermissionDenied:
+        entry.update(status=403, body={'error': 'Insufficient permissions'})
+        return entry
+    except Exception:
+        logger.exception('Batched request to %s failed', sub_request['path'])
+        entry.update(status=500, body={'error': 'Internal server error'})
+        return entry
+    
+    entry.update(status=response.status_code, body=_decode(response))
+    return entry
+
+
+def _dispatch_in_thread(request, sub_request: Dict) -> Dict:
+    # Pool threads manage their own connections, like a request thread does
+    close_old_connections()
+    try:
+        return dispatch(request, sub_request)
+    finally:
+        close_old_connections()
+
+
+@authenticated
+def batch_view(request):
+    """
+    Run a list of sub-requests for the authenticated caller and return all their responses.
+    
+    With "parallel": true the sub-requests run concurrently on a shared thread
+    pool; they must then not depend on each other's side effects. Otherwise
+    they run one after another in the order given.
+    """
+    if request.method != 'POST':
+        response = _json_response({'detail': f'Method "{request.method}" not allowed.'}, 405)
+        response['Allow'] = 'POST, OPTIONS'
+        return response
+    
+    try:
+        sub_requests, parallel = parse_batch(request.body)
+    except ValueError as exc:
+        return _json_response({'error': str(exc)}, 400)
+    
+    if parallel and len(sub_requests) > 1:
+        executor = get_batch_executor()
+        # Each sub-request gets a copy of the context, so its timings land in this request's
+        futures = [
+            executor.submit(copy_context().run, _dispatch_in_thread, request, sub_request)
+            for sub_request in sub_requests
+        ]
+        responses = [future.result() for future in futures]
+    else:
+        responses = [dispatch(request, sub_request) for sub_request in sub_requests]
+    
+    return _json_response({'responses': responses}, 200)
+
+
+batch_view.csrf_exempt = True
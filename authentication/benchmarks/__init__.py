@@ -0,0 +1,5 @@
+"""
+Benchmark helpers for the authentication hot paths.
+
+Used by the benchmark_auth management command; see its help for usage.
+"""
@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+import uuid
+from typing import Optional
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _FakeSupabaseHandler(BaseHTTPRequestHandler):
+    """Answers POST /auth/v1/token?grant_type=refresh_token like Supabase does."""
+    
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            body = {}
+        
+        if server.latency:
+            time.sleep(server.latency)
+        
+        with server.lock:
+            server.calls += 1
+        
+        if server.status_code is not None:
+            # Simulated outage
+            self._send(server.status_code, {'error': 'unavailable'})
+            return
+        
+        if not self.path.startswith('/auth/v1/token') or not body.get('refresh_token'):
+            self._send(400, {'error': 'invalid_request'})
+            return
+        
+        # Rotate the refresh token the way Supabase does
+        self._send(200, {
+            'access_token': uuid.uuid4().hex,
+            'token_type': 'bearer',
+            'expires_in': 3600,
+            'refresh_token': uuid.uuid4().hex,
+        })
+    
+    def _send(self, status_code, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        try:
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out and hung up
+            self.close_connection = True
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSupabaseServer:
+    """
+    Local stand-in for the Supabase Auth token endpoint.
+    
+    Runs a threaded HTTP server on 127.0.0.1 with keep-alive support and an
+    optional artificial latency, and counts the calls it receives. Set
+    status_code (e.g. 503) to answer every call with that error instead.
+    
+    Usage:
+        with FakeSupabaseServer(latency=0.02) as fake:
+            client = SupabaseClient(base_url=fake.url)
+    """
+    
+    def __init__(self, latency: float = 0.0, status_code: Optional[int] = None):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), _FakeSupabaseHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.status_code = status_code
+        self.httpd.calls = 0
+        self.httpd.lock = threading.Lock()
+        self._thread = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    @property
+    def calls(self) -> int:
+        return self.httpd.calls
+    
+    @property
+    def status_code(self) -> Optional[int]:
+        return self.httpd.status_code
+    
+    @status_code.setter
+    def status_code(self, value: Optional[int]):
+        self.httpd.status_code = value
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
@@ -0,0 +1,157 @@
+import math
+from contextlib import ExitStack
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = math.ceil(pct / 100.0 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+def summarize(name: str, latencies: List[float], wall_time: float, errors: int = 0,
+              queries: Optional[int] = None, concurrency: int = 1) -> Dict:
+    """Build the result record for one scenario (latencies in seconds, reported in ms)."""
+    ordered = sorted(latencies)
+    count = len(ordered)
+    return {
+        'name': name,
+        'requests': count,
+        'concurrency': concurrency,
+        'errors': errors,
+        'throughput_rps': round(count / wall_time, 1) if wall_time else 0.0,
+        'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+        'queries_per_request': round(queries / count, 2) if queries is not None and count else None,
+    }
+
+
+def run_in_process(name: str, iterations: int, request_fn: Callable[[int], int],
+                   expected_status: int = 200) -> Dict:
+    """
+    Call request_fn(i) sequentially in this thread, counting SQL queries per call.
+    
+    request_fn returns the response status code; anything other than
+    expected_status is counted as an error.
+    """
+    latencies = []
+    errors = 0
+    queries = 0
+    started = time.perf_counter()
+    for i in range(iterations):
+        # Every alias, so reads routed to a replica are counted too
+        with ExitStack() as stack:
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            t0 = time.perf_counter()
+            status_code = request_fn(i)
+            latencies.append(time.perf_counter() - t0)
+        queries += sum(len(context) for context in captured)
+        if status_code != expected_status:
+            errors += 1
+    return summarize(name, latencies, time.perf_counter() - started, errors, queries)
+
+
+def run_concurrent(name: str, iterations: int, concurrency: int, request_fn: Callable[[int], int],
+                   expected_status: int = 200) -> Dict:
+    """
+    Call request_fn(i) from `concurrency` threads until `iterations` calls are done.
+    
+    Query counts are not tracked here because they can't be attributed to a
+    single request when several run at once.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    
+    def task(i):
+        t0 = time.perf_counter()
+        try:
+            status_code = request_fn(i)
+        except Exception:
+            status_code = None
+        elapsed = time.perf_counter() - t0
+        with lock:
+            latencies.append(elapsed)
+            if status_code != expected_status:
+                errors[0] += 1
+    
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(task, range(iterations)))
+    wall_time = time.perf_counter() - started
+    return summarize(name, latencies, wall_time, errors[0], concurrency=concurrency)
+
+
+class _QuietRequestHandler(WSGIRequestHandler):
+    disable_nagle_algorithm = True
+    
+    def log_message(self, format, *args):
+        pass
+
+
+class LiveServer:
+    """
+    Serves the Django project over real HTTP on 127.0.0.1 from a background thread.
+    
+    Used by the concurrent load scenarios so requests go through sockets,
+    HTTP parsing and the full WSGI handler like in production.
+    """
+    
+    def __init__(self):
+        self.httpd = ThreadedWSGIServer(('127.0.0.1', 0), _QuietRequestHandler, allow_reuse_address=False)
+        self.httpd.set_app(WSGIHandler())
+        self._thread = None
+    
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+
+def compare(baseline: List[Dict], current: List[Dict]) -> List[Dict]:
+    """Pair up scenarios by name and compute the relative change of each metric."""
+    previous = {result['name']: result for result in baseline}
+    rows = []
+    for result in current:
+        before = previous.get(result['name'])
+        if before is None:
+            continue
+        for metric in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request'):
+            old, new = before.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            change = ((new - old) / old * 100.0) if old else 0.0
+            rows.append({
+                'name': result['name'],
+                'metric': metric,
+                'baseline': old,
+                'current': new,
+                'change_pct': round(change, 1),
+            })
+    return rows
@@ -0,0 +1,178 @@
+import copy
+import time
+from typing import Iterable, Optional
+from django.conf import settings
+from django.core.cache import caches
+from authentication.models import SupabaseUser
+from authentication.routers import acan_read_replica, can_read_replica, replica_reads
+from authentication.utils import LRUCache
+
+
+class SupabaseUserCache:
+    """
+    Two-level cache for SupabaseUser rows resolved by the token middleware.
+    
+    Lookups check a small process-local LRU first, then the shared Django cache
+    (when SUPABASE_USER_CACHE_ALIAS is set), and only then hit the database,
+    a read replica if one is configured and the user hasn't just written.
+    The local TTL is kept short because invalidations only reach the shared
+    cache; it bounds how long another worker can serve a stale row.
+    
+    Rows are cached without refresh_token so secrets never land in the cache.
+    """
+    
+    KEY_PREFIX = 'supabase:user:'
+    
+    # Columns loaded for request.user; refresh_token is deliberately left out
+    FIELDS = ('id', 'supabase_user_id', 'email', 'role', 'created_at', 'updated_at')
+    
+    def __init__(self):
+        self.ttl = getattr(settings, 'SUPABASE_USER_CACHE_TTL', 300)
+        self.local_ttl = getattr(settings, 'SUPABASE_USER_CACHE_LOCAL_TTL', 5)
+        self.shared_cache_alias = getattr(settings, 'SUPABASE_USER_CACHE_ALIAS', None)
+        self.local = LRUCache(max_size=getattr(settings, 'SUPABASE_USER_CACHE_SIZE', 10000))
+    
+    def _key(self, user_id) -> str:
+        return str(user_id).lower()
+    
+    def get(self, user_id) -> SupabaseUser:
+        """
+        Resolve a SupabaseUser by Supabase user ID, using the cache when possible.
+        
+        Raises:
+            SupabaseUser.DoesNotExist: If the user has no row in our database
+        """
+        key = self._key(user_id)
+        
+        user = self.local.get(key)
+        if user is not None:
+            return copy.copy(user)
+        
+        if self.shared_cache_alias:
+            try:
+                user = caches[self.shared_cache_alias].get(self.KEY_PREFIX + key)
+            except Exception:
+                # Fall through to the database if the shared cache is unavailable
+                user = None
+            if user is not None:
+                self.local.set(key, user, time.time() + self.local_ttl)
+                return copy.copy(user)
+        
+        user = self._load(user_id)
+        self.set(user)
+        return copy.copy(user)
+    
+    async def aget(self, user_id) -> SupabaseUser:
+        """
+        Async version of get() using the async cache and ORM APIs.
+        
+        Raises:
+            SupabaseUser.DoesNotExist: If the user has no row in our database
+        """
+        key = self._key(user_id)
+        
+        user = self.local.get(key)
+        if user is not None:
+            return copy.copy(user)
+        
+        if self.shared_cache_alias:
+            try:
+                user = await caches[self.shared_cache_alias].aget(self.KEY_PREFIX + key)
+            except Exception:
+                user = None
+            if user is not None:
+                self.local.set(key, user, time.time() + self.local_ttl)
+                return copy.copy(user)
+        
+        user = None
+        queryset = SupabaseUser.objects.only(*self.FIELDS)
+        if await acan_read_replica(user_id):
+            with replica_reads():
+                user = await queryset.filter(supabase_user_id=user_id).afirst()
+        if user is None:
+            user = await queryset.aget(supabase_user_id=user_id)
+        await self.aset(user)
+        return copy.copy(user)
+    
+    def _load(self, user_id) -> SupabaseUser:
+        """
+        Fetch the user row, from a replica unless the user just wrote.
+        
+        A row missing on the replica may not have been replicated yet, so
+        that case is retried on the primary.
+        """
+        queryset = SupabaseUser.objects.only(*self.FIELDS)
+        if can_read_replica(user_id):
+            with replica_reads():
+                user = queryset.filter(supabase_user_id=user_id).first()
+            if user is not None:
+                return user
+        return queryset.get(supabase_user_id=user_id)
+    
+    def set(self, user: SupabaseUser):
+        """Store a resolved user in both cache levels."""
+        key = self._key(user.supabase_user_id)
+        self.local.set(key, user, time.time() + self.local_ttl)
+        
+        if self.shared_cache_alias:
+            try:
+                caches[self.shared_cache_alias].set(self.KEY_PREFIX + key, user, timeout=self.ttl)
+            except Exception:
+                pass
+    
+    async def aset(self, user: SupabaseUser):
+        """Async version of set()."""
+        key = self._key(user.supabase_user_id)
+        self.local.set(key, user, time.time() + self.local_ttl)
+        
+        if self.shared_cache_alias:
+            try:
+                await caches[self.shared_cache_alias].aset(self.KEY_PREFIX + key, user, timeout=self.ttl)
+            except Exception:
+                pass
+    
+    def invalidate(self, user_id):
+        """Drop a user from both cache levels after its row has been written."""
+        key = self._key(user_id)
+        self.local.delete(key)
+        
+        if self.shared_cache_alias:
+            try:
+                caches[self.shared_cache_alias].delete(self.KEY_PREFIX + key)
+            except Exception:
+                pass
+    
+    def invalidate_many(self, user_ids: Iterable):
+        """Drop several users from both cache levels with one shared cache call."""
+        keys = [self._key(user_id) for user_id in user_ids]
+        for key in keys:
+            self.local.delete(key)
+        
+        if self.shared_cache_alias and keys:
+            try:
+                caches[self.shared_cache_alias].delete_many([self.KEY_PREFIX + key for key in keys])
+            except Exception:
+                pass
+    
+    async def ainvalidate(self, user_id):
+        """Async version of invalidate()."""
+        key = self._key(user_id)
+        self.local.delete(key)
+        
+        if self.shared_cache_alias:
+            try:
+                await caches[self.shared_cache_alias].adelete(self.KEY_PREFIX + key)
+            except Exception:
+                pass
+
+
+# Singleton instance
+_user_cache = None
+
+
+def get_user_cache() -> SupabaseUserCache:
+    """Get or create the user cache singleton."""
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = SupabaseUserCache()
+    return _user_cache
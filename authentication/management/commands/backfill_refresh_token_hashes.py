@@ -0,0 +1,70 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from authentication.models import SupabaseUser
+from authentication.utils import token_digest
+
+
+class Command(BaseCommand):
+    """
+    Fill refresh_token_hash for rows written before the column existed.
+    
+    Walks supabase_users in primary key order, one short transaction per
+    batch, so it can run against a live table without holding long locks.
+    Safe to re-run: rows that already have a hash are skipped.
+    """
+    
+    help = 'Backfill SupabaseUser.refresh_token_hash in small batches'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows updated per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches to limit load (default: 0.1)',
+        )
+    
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pause = options['sleep']
+        last_id = 0
+        updated = 0
+        
+        while True:
+            with transaction.atomic():
+                # Only the columns we need; refresh_token can be large. The rows stay
+                # locked until the batch commits, so a concurrent refresh can't rotate
+                # the token between reading it and storing its hash
+                batch = list(
+                    SupabaseUser.objects
+                    .select_for_update()
+                    .filter(
+                        pk__gt=last_id,
+                        refresh_token_hash__isnull=True,
+                        refresh_token__isnull=False,
+                    )
+                    .order_by('pk')
+                    .only('id', 'refresh_token')[:batch_size]
+                )
+                if not batch:
+                    break
+                
+                for user in batch:
+                    user.refresh_token_hash = token_digest(user.refresh_token)
+                # bulk_update bypasses save(), so updated_at is left untouched
+                SupabaseUser.objects.bulk_update(batch, ['refresh_token_hash'])
+            
+            last_id = batch[-1].pk
+            updated += len(batch)
+            self.stdout.write(f"Backfilled {updated} rows (last id {last_id})")
+            
+            if pause:
+                time.sleep(pause)
+        
+        self.stdout.write(self.style.SUCCESS(f"Done. Backfilled {updated} rows."))
@@ -0,0 +1,281 @@
+import json
+import subprocess
+import threading
+import time
+import uuid
+import jwt
+import requests
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client, override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+from authentication import audit, revocation, supabase_client
+from authentication.benchmarks.fake_supabase import FakeSupabaseServer
+from authentication.benchmarks.runner import LiveServer, compare, run_concurrent, run_in_process
+from authentication.cache import get_user_cache
+from authentication.models import RefreshSession, SupabaseUser
+from authentication.routers import replica_aliases
+from authentication.utils import get_jwt_validator
+
+
+# Any authenticated path that doesn't resolve: the middleware does all its work, then Django 404s
+PROTECTED_PATH = '/api/benchmark/protected/'
+
+BENCHMARK_RATE_LIMITS = ('login:ip', 'login:user', 'refresh:ip', 'refresh:refresh_token')
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the authentication hot paths.
+    
+    Creates a throwaway test database, starts a local fake Supabase token
+    endpoint, and drives SupabaseTokenValidationMiddleware, login_view,
+    logout_view and refresh_token_view both in-process (Django test client,
+    with SQL query counts) and over HTTP with a concurrent load driver.
+    Reports throughput, p50/p95/p99 latency and queries per request, and can
+    save the results as a baseline JSON file or compare against one.
+    """
+    
+    help = 'Benchmark token validation and the login/logout/refresh endpoints'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=500, help='Requests per scenario (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=16, help='Threads for the HTTP scenarios (default: 16)')
+        parser.add_argument('--users', type=int, default=100, help='Users seeded in the test database (default: 100)')
+        parser.add_argument('--upstream-latency', type=float, default=0.0, help='Seconds the fake Supabase waits per call (default: 0)')
+        parser.add_argument('--skip-http', action='store_true', help='Only run the in-process scenarios')
+        parser.add_argument('--save', metavar='PATH', help='Write results to this JSON file')
+        parser.add_argument('--compare', metavar='PATH', help='Compare results with a saved JSON baseline')
+        parser.add_argument('--keepdb', action='store_true', help='Reuse the test database between runs')
+    
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        # Replica reads go to the test database too, like in Django's test runner
+        for alias in replica_aliases():
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+        try:
+            with FakeSupabaseServer(latency=options['upstream_latency']) as fake:
+                with override_settings(
+                    DEBUG=False,
+                    ALLOWED_HOSTS=['testserver', '127.0.0.1', 'localhost'],
+                    SUPABASE_URL=fake.url,
+                    # Keep the limiters in the measured path without ever tripping them
+                    RATELIMIT_RATES={name: '1000000/s' for name in BENCHMARK_RATE_LIMITS},
+                ):
+                    # Rebuild the upstream client against the fake server
+                    supabase_client._supabase_client = None
+                    results = self._run(options)
+                    supabase_client._supabase_client = None
+                    self.stdout.write(f"Fake Supabase received {fake.calls} calls")
+        finally:
+            # The revocation sync thread would keep polling the dropped database
+            if revocation._revocation_list is not None:
+                revocation._revocation_list.stop()
+                revocation._revocation_list = None
+            # Write the queued audit events while the database still exists
+            if audit._audit_log is not None:
+                audit._audit_log.stop()
+                audit._audit_log = None
+            # Replica aliases hold their own connections to the test database
+            for alias in replica_aliases():
+                connections[alias].close()
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+            teardown_test_environment()
+        
+        self._print_results(results)
+        
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+            self._print_comparison(compare(baseline['results'], results))
+        
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump({'meta': self._meta(options), 'results': results}, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved results to {options['save']}"))
+    
+    def _run(self, options):
+        iterations = options['iterations']
+        user_count = max(options['users'], options['concurrency'])
+        
+        # Seed users, each with a current refresh token
+        user_ids = [str(uuid.uuid4()) for _ in range(user_count)]
+        refresh_tokens = {}
+        for user_id in user_ids:
+            refresh_tokens[user_id] = uuid.uuid4().hex
+            user, _ = SupabaseUser.objects.upsert_login(user_id, f'{user_id[:8]}@example.com')
+            RefreshSession.objects.start(user, refresh_tokens[user_id], 'benchmark')
+        access_tokens = {user_id: self._access_token(user_id) for user_id in user_ids}
+        tokens_lock = threading.Lock()
+        
+        client = Client()
+        results = []
+        
+        # Middleware with warm caches: the same token over and over
+        self._reset_caches()
+        token = access_tokens[user_ids[0]]
+        results.append(run_in_process(
+            'middleware_cached', iterations,
+            lambda i: client.get(PROTECTED_PATH, HTTP_AUTHORIZATION=f'Bearer {token}').status_code,
+            expected_status=404,
+        ))
+        
+        # Middleware with cold caches: every request has a new token and user
+        self._reset_caches()
+        fresh_tokens = [self._access_token(user_ids[i % user_count]) for i in range(iterations)]
+        
+        def uncached(i):
+            get_user_cache().local.clear()
+            return client.get(PROTECTED_PATH, HTTP_AUTHORIZATION=f'Bearer {fresh_tokens[i]}').status_code
+        
+        results.append(run_in_process('middleware_uncached', iterations, uncached, expected_status=404))
+        
+        # Login: every call upserts a new refresh token for an existing user
+        self._reset_caches()
+        
+        def login(i):
+            user_id = user_ids[i % user_count]
+            new_refresh = uuid.uuid4().hex
+            response = client.post(
+                '/api/auth/login/',
+                {'access_token': access_tokens[user_id], 'refresh_token': new_refresh},
+                content_type='application/json',
+            )
+            refresh_tokens[user_id] = new_refresh
+            return response.status_code
+        
+        results.append(run_in_process('login', iterations, login))
+        
+        # Refresh: exchange each user's current refresh token with the fake Supabase
+        self._reset_caches()
+        
+        def refresh(i):
+            user_id = user_ids[i % user_count]
+            response = client.post(
+                '/api/auth/refresh/',
+                {'refresh_token': refresh_tokens[user_id]},
+                content_type='application/json',
+            )
+            if response.status_code == 200:
+                refresh_tokens[user_id] = response.json()['refresh_token']
+            return response.status_code
+        
+        results.append(run_in_process('refresh', iterations, refresh))
+        
+        # Logout through the Authorization header (middleware lookup plus one UPDATE)
+        self._reset_caches()
+        results.append(run_in_process(
+            'logout', iterations,
+            lambda i: client.post(
+                '/api/auth/logout/',
+                content_type='application/json',
+                HTTP_AUTHORIZATION=f'Bearer {access_tokens[user_ids[i % user_count]]}',
+            ).status_code,
+        ))
+        
+        # Logout revoked the access tokens; issue new ones and put a fresh refresh token back
+        access_tokens = {user_id: self._access_token(user_id) for user_id in user_ids}
+        for user_id in user_ids:
+            refresh_tokens[user_id] = uuid.uuid4().hex
+            user, _ = SupabaseUser.objects.upsert_login(user_id, f'{user_id[:8]}@example.com')
+            RefreshSession.objects.start(user, refresh_tokens[user_id], 'benchmark')
+        
+        if options['skip_http']:
+            return results
+        
+        concurrency = options['concurrency']
+        local = threading.local()
+        
+        def session():
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            return local.session
+        
+        with LiveServer() as server:
+            self._reset_caches()
+            results.append(run_concurrent(
+                'middleware_http', iterations, concurrency,
+                lambda i: session().get(
+                    server.url + PROTECTED_PATH,
+                    headers={'Authorization': f'Bearer {access_tokens[user_ids[i % user_count]]}'},
+                ).status_code,
+                expected_status=404,
+            ))
+            
+            self._reset_caches()
+            
+            def refresh_http(i):
+                user_id = user_ids[i % user_count]
+                with tokens_lock:
+                    current = refresh_tokens[user_id]
+                response = session().post(server.url + '/api/auth/refresh/', json={'refresh_token': current})
+                if response.status_code == 200:
+                    with tokens_lock:
+                        refresh_tokens[user_id] = response.json()['refresh_token']
+                return response.status_code
+            
+            results.append(run_concurrent('refresh_http', iterations, concurrency, refresh_http))
+        
+        return results
+    
+    def _access_token(self, user_id):
+        now = int(time.time())
+        return jwt.encode(
+            {
+                'sub': user_id,
+                'email': f'{user_id[:8]}@example.com',
+                'role': 'authenticated',
+                'iat': now,
+                'exp': now + 3600,
+                'jti': uuid.uuid4().hex,
+            },
+            settings.SUPABASE_JWT_SECRET,
+            algorithm='HS256',
+        )
+    
+    def _reset_caches(self):
+        get_jwt_validator().token_cache.clear()
+        get_user_cache().local.clear()
+        caches['default'].clear()
+    
+    def _meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': int(time.time()),
+            'iterations': options['iterations'],
+            'concurrency': options['concurrency'],
+            'users': options['users'],
+            'upstream_latency': options['upstream_latency'],
+        }
+    
+    def _print_results(self, results):
+        header = f"{'scenario':<22}{'reqs':>7}{'conc':>6}{'err':>5}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for r in results:
+            queries = '-' if r['queries_per_request'] is None else f"{r['queries_per_request']:.2f}"
+            self.stdout.write(
+                f"{r['name']:<22}{r['requests']:>7}{r['concurrency']:>6}{r['errors']:>5}"
+                f"{r['throughput_rps']:>10.1f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}{queries:>9}"
+            )
+    
+    def _print_comparison(self, rows):
+        self.stdout.write('')
+        self.stdout.write(f"{'scenario':<22}{'metric':<22}{'baseline':>12}{'current':>12}{'change':>10}")
+        for row in rows:
+            # Higher is better for throughput, lower for everything else
+            better = row['change_pct'] > 0 if row['metric'] == 'throughput_rps' else row['change_pct'] < 0
+            style = self.style.SUCCESS if better else self.style.WARNING
+            self.stdout.write(style(
+                f"{row['name']:<22}{row['metric']:<22}{row['baseline']:>12}{row['current']:>12}{row['change_pct']:>+9.1f}%"
+            ))
@@ -0,0 +1,74 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from authentication.models import SupabaseUser
+from authentication.renderers import FastJSONRenderer, orjson
+from authentication.serializers import (
+    LoginResponseSerializer,
+    RefreshTokenResponseSerializer,
+    login_user_data,
+    refresh_token_data,
+)
+
+
+class Command(BaseCommand):
+    """
+    Compare response encoding of the login and refresh endpoints.
+    
+    Times the serializer + JSONRenderer path the views used to take against
+    the response builders + FastJSONRenderer, on an unsaved user, and checks
+    that both produce the same bytes. Needs no database.
+    """
+    
+    help = 'Microbenchmark login/refresh response serialization and rendering'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20000, help='Calls per path (default: 20000)')
+    
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        now = timezone.now()
+        user = SupabaseUser(
+            supabase_user_id=uuid.uuid4(),
+            email='benchmark user@example.com',
+            created_at=now,
+            updated_at=now,
+        )
+        tokens = ('a' * 600, 'b' * 40)
+        old_renderer = JSONRenderer()
+        new_renderer = FastJSONRenderer()
+        
+        cases = {
+            'login': (
+                lambda: old_renderer.render({'message': 'Login successful', 'user': LoginResponseSerializer(user).data, 'created': False}),
+                lambda: new_renderer.render({'message': 'Login successful', 'user': login_user_data(user), 'created': False}),
+            ),
+            'refresh': (
+                lambda: old_renderer.render(RefreshTokenResponseSerializer({'access_token': tokens[0], 'refresh_token': tokens[1]}).data),
+                lambda: new_renderer.render(refresh_token_data(*tokens)),
+            ),
+        }
+        
+        if orjson is None:
+            self.stdout.write(self.style.WARNING('orjson is not installed; FastJSONRenderer falls back to JSONRenderer'))
+        
+        self.stdout.write(f"{'case':<10}{'serializer µs':>16}{'fast path µs':>16}{'speedup':>10}")
+        for name, (old, new) in cases.items():
+            if old() != new():
+                raise CommandError(f"{name}: fast path output differs:\n{old()!r}\n{new()!r}")
+            old_us = self._time(old, iterations)
+            new_us = self._time(new, iterations)
+            self.stdout.write(f"{name:<10}{old_us:>16.2f}{new_us:>16.2f}{old_us / new_us:>9.1f}x")
+        
+        self.stdout.write(self.style.SUCCESS('Output is byte-identical.'))
+    
+    def _time(self, func, iterations: int) -> float:
+        """Mean microseconds per call, after a short warm-up."""
+        for _ in range(min(iterations, 1000)):
+            func()
+        start = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        return (time.perf_counter() - start) / iterations * 1e6
@@ -0,0 +1,140 @@
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from authentication.benchmarks.runner import run_concurrent
+
+
+RUNSERVER = [sys.executable, 'manage.py', 'runserver', '--noreload', '127.0.0.1:{port}']
+# The worker class comes from GUNICORN_WORKER_CLASS (see gunicorn.conf.py)
+GUNICORN = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', '127.0.0.1:{port}']
+
+SERVERS = ('runserver', 'sync', 'gthread', 'uvicorn')
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    """
+    Compare the throughput of the development server and the gunicorn setups.
+    
+    Starts each server in turn on a free local port with the current
+    environment (gunicorn with GUNICORN_WORKER_CLASS set to the server name),
+    waits until it answers, drives it with the concurrent load driver from
+    authentication.benchmarks.runner and stops it again. With --url an
+    already running server is measured instead.
+    
+    The default request, GET /metrics, needs neither a user token nor the
+    database, so it measures the server itself (the servers started here
+    serve it with METRICS_PUBLIC; with --url pass the X-Internal-Token
+    header). Use --path, --header and --body for other endpoints.
+    """
+    
+    help = 'Load-test runserver against gunicorn sync, gthread and uvicorn workers'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='runserver,sync,gthread,uvicorn',
+                            help=f"Comma-separated servers to compare, from {', '.join(SERVERS)} (default: all)")
+        parser.add_argument('--url', help='Load-test this running server instead of starting any')
+        parser.add_argument('--path', default='/metrics', help='Path of the requests (default: /metrics)')
+        parser.add_argument('--method', default='GET', help='Method of the requests (default: GET)')
+        parser.add_argument('--body', help='JSON body of the requests')
+        parser.add_argument('--header', action='append', default=[], metavar='NAME:VALUE',
+                            help='Extra request header, e.g. "Authorization: Bearer ..." (repeatable)')
+        parser.add_argument('--expected-status', type=int, default=200, help='Status counted as success (default: 200)')
+        parser.add_argument('--iterations', type=int, default=2000, help='Requests per server (default: 2000)')
+        parser.add_argument('--concurrency', type=int, default=32, help='Client threads (default: 32)')
+        parser.add_argument('--workers', type=int, help='WEB_CONCURRENCY for the gunicorn servers (default: from the CPU count)')
+    
+    def handle(self, *args, **options):
+        headers = {'Content-Type': 'application/json'}
+        for header in options['header']:
+            name, _, value = header.partition(':')
+            headers[name.strip()] = value.strip()
+        
+        local = threading.local()
+        
+        def session():
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            return local.session
+        
+        def load(name: str, base_url: str) -> Dict:
+            url = base_url.rstrip('/') + options['path']
+            
+            def request(i):
+                return session().request(options['method'], url, headers=headers, data=options['body']).status_code
+            
+            # Warm up connections and lazily initialised state before measuring
+            run_concurrent('warmup', options['concurrency'] * 2, options['concurrency'], request)
+            return run_concurrent(name, options['iterations'], options['concurrency'], request,
+                                  expected_status=options['expected_status'])
+        
+        if options['url']:
+            results = [load(options['url'], options['url'])]
+        else:
+            results = []
+            for name in filter(None, (server.strip() for server in options['servers'].split(','))):
+                if name not in SERVERS:
+                    raise CommandError(f"Unknown server {name!r}; choose from {', '.join(SERVERS)}")
+                port = free_port()
+                process = self._start(name, port, options)
+                try:
+                    base_url = f"http://127.0.0.1:{port}"
+                    self._wait_until_ready(process, base_url + options['path'])
+                    self.stdout.write(f"{name}: measuring...")
+                    results.append(load(name, base_url))
+                finally:
+                    process.terminate()
+                    process.wait(timeout=60)
+        
+        self._print_results(results)
+    
+    def _start(self, name: str, port: int, options) -> subprocess.Popen:
+        env = dict(os.environ, GUNICORN_WORKER_CLASS=name, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        if options['workers']:
+            env['WEB_CONCURRENCY'] = str(options['workers'])
+        # Don't let the servers' request logging skew the comparison
+        env.pop('GUNICORN_ACCESS_LOG', None)
+        # Local throwaway servers; lets the default /metrics request through without the internal token
+        env.setdefault('METRICS_PUBLIC', 'True')
+        command = RUNSERVER if name == 'runserver' else GUNICORN
+        return subprocess.Popen(
+            [part.format(port=port) for part in command],
+            cwd=str(settings.BASE_DIR),
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    
+    def _wait_until_ready(self, process: subprocess.Popen, url: str, timeout: float = 60.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f"Server exited with status {process.returncode} before answering")
+            try:
+                requests.get(url, timeout=1)
+                return
+            except requests.RequestException:
+                time.sleep(0.2)
+        raise CommandError(f"Server did not answer {url} within {timeout:.0f}s")
+    
+    def _print_results(self, results: List[Dict]):
+        header = f"{'server':<22}{'reqs':>7}{'conc':>6}{'err':>5}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for r in results:
+            self.stdout.write(
+                f"{r['name']:<22}{r['requests']:>7}{r['concurrency']:>6}{r['errors']:>5}"
+                f"{r['throughput_rps']:>10.1f}{r['p50_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['p99_ms']:>10.3f}"
+            )
@@ -0,0 +1,202 @@
+import json
+import os
+import subprocess
+import sys
+from typing import Dict, List
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# Run in a fresh interpreter so nothing is imported or warmed up already.
+# Prints one JSON line of phase timings (ms) to stdout; -X importtime writes to stderr.
+BOOT_SCRIPT = r'''
+import io, json, os, sys, time
+t0 = time.perf_counter()
+preload, asgi, path, method, body = sys.argv[1:6]
+timings = {}
+
+if preload == '1':
+    import config.preload
+    application = config.preload.asgi_application if asgi == '1' else config.preload.application
+    timings['preload'] = time.perf_counter() - t0
+else:
+    import django
+    django.setup(set_prefix=False)
+    t1 = time.perf_counter()
+    timings['django_setup'] = t1 - t0
+    if asgi == '1':
+        from django.core.handlers.asgi import ASGIHandler
+        application = ASGIHandler()
+    else:
+        from django.core.handlers.wsgi import WSGIHandler
+        application = WSGIHandler()
+    timings['handler'] = time.perf_counter() - t1
+
+def request():
+    data = body.encode()
+    environ = {
+        'REQUEST_METHOD': method, 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': '',
+        'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1', 'CONTENT_TYPE': 'application/json', 'CONTENT_LENGTH': str(len(data)),
+        'wsgi.input': io.BytesIO(data), 'wsgi.url_scheme': 'http', 'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+    }
+    statuses = []
+    if asgi == '1':
+        import asyncio
+        from asgiref.testing import ApplicationCommunicator
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(data)).encode())],
+            'client': ('127.0.0.1', 0), 'server': ('localhost', 80), 'scheme': 'http', 'http_version': '1.1',
+        }
+        async def run():
+            communicator = ApplicationCommunicator(application, scope)
+            await communicator.send_input({'type': 'http.request', 'body': data})
+            start = await communicator.receive_output(10)
+            await communicator.receive_output(10)
+            return start['status']
+        statuses.append(asyncio.run(run()))
+    else:
+        response = application(environ, lambda status, headers: statuses.append(int(status.split()[0])))
+        b''.join(response)
+        response.close()
+    return statuses[0]
+
+if preload == '1':
+    # Serve from a forked child, like a gunicorn worker
+    read_fd, write_fd = os.pipe()
+    t2 = time.perf_counter()
+    if os.fork() == 0:
+        t3 = time.perf_counter()
+        status = request()
+        t4 = time.perf_counter()
+        request()
+        child = {'fork': t3 - t2, 'first_request': t4 - t3, 'second_request': time.perf_counter() - t4}
+        os.write(write_fd, json.dumps([status, child]).encode())
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as pipe:
+        status, child = json.loads(pipe.read())
+    os.wait()
+    timings.update(child)
+    timings['worker_ready'] = child['fork'] + child['first_request']
+else:
+    t2 = time.perf_counter()
+    status = request()
+    t3 = time.perf_counter()
+    timings['first_request'] = t3 - t2
+    request()
+    timings['second_request'] = time.perf_counter() - t3
+    timings['worker_ready'] = t3 - t0
+print(json.dumps({'status': status, 'timings': {k: v * 1000 for k, v in timings.items()}}))
+'''
+
+
+class ImportNode:
+    __slots__ = ('name', 'self_us', 'cumulative_us', 'children')
+    
+    def __init__(self, name: str, self_us: int, cumulative_us: int):
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.children: List['ImportNode'] = []
+
+
+def parse_importtime(stderr: str) -> List[ImportNode]:
+    """
+    Build the import tree from `python -X importtime` output.
+    
+    Children are printed before their parent, one indentation level deeper.
+    """
+    pending: Dict[int, List[ImportNode]] = {}
+    for line in stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indent><name>"
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, raw_name = line[len('import time:'):].split('|', 2)
+        depth = (len(raw_name) - len(raw_name.lstrip(' ')) - 1) // 2
+        node = ImportNode(raw_name.strip(), int(self_us), int(cumulative_us))
+        node.children = pending.pop(depth + 1, [])
+        pending.setdefault(depth, []).append(node)
+    return pending.get(0, [])
+
+
+class Command(BaseCommand):
+    """
+    Profile a cold start of the application.
+    
+    Boots Django in a fresh interpreter with `python -X importtime`, builds the
+    handler (settings, apps, middleware and URLconf), then sends two requests
+    straight into it, and reports the time of each phase, the slowest parts of
+    the import tree and import time by top-level package.
+    
+    With --preload it boots through config.preload and serves the requests
+    from a forked child, like a gunicorn --preload worker; worker_ready is
+    then the fork plus the first request instead of the whole cold start.
+    """
+    
+    help = 'Report import times and time-to-first-request of a cold start'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--preload', action='store_true', help='Boot through config.preload (warmed up)')
+        parser.add_argument('--asgi', action='store_true', help='Use the ASGI handler instead of WSGI')
+        parser.add_argument('--path', default='/api/auth/refresh/', help='Path of the requests (default: /api/auth/refresh/)')
+        parser.add_argument('--method', default='POST', help='Method of the requests (default: POST)')
+        parser.add_argument('--body', default='{}', help='JSON body of the requests (default: {})')
+        parser.add_argument('--min-ms', type=float, default=5.0, help='Hide imports faster than this (default: 5)')
+        parser.add_argument('--depth', type=int, default=4, help='Levels of the import tree to show (default: 4)')
+        parser.add_argument('--top', type=int, default=15, help='Packages listed in the summary (default: 15)')
+    
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [str(settings.BASE_DIR), env.get('PYTHONPATH')]))
+        result = subprocess.run(
+            [
+                sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT,
+                '1' if options['preload'] else '0',
+                '1' if options['asgi'] else '0',
+                options['path'], options['method'], options['body'],
+            ],
+            capture_output=True,
+            text=True,
+            env=env,
+            cwd=str(settings.BASE_DIR),
+        )
+        report_line = result.stdout.strip().splitlines()[-1] if result.stdout.strip() else ''
+        if result.returncode != 0 or not report_line.startswith('{'):
+            errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+            raise CommandError('Startup failed:\n' + '\n'.join(errors[-20:]))
+        report = json.loads(report_line)
+        roots = parse_importtime(result.stderr)
+        
+        self.stdout.write(self.style.MIGRATE_HEADING('Import tree'))
+        min_us = options['min_ms'] * 1000
+        for node in sorted(roots, key=lambda n: n.cumulative_us, reverse=True):
+            self._print_node(node, 0, min_us, options['depth'])
+        
+        self.stdout.write(self.style.MIGRATE_HEADING('\nImport time by package (self time)'))
+        packages: Dict[str, int] = {}
+        self._sum_packages(roots, packages)
+        total_us = sum(packages.values())
+        for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['top']]:
+            self.stdout.write(f"  {package:<32}{self_us / 1000:>9.1f} ms{100 * self_us / total_us:>7.1f}%")
+        self.stdout.write(f"  {'all imports':<32}{total_us / 1000:>9.1f} ms")
+        
+        self.stdout.write(self.style.MIGRATE_HEADING('\nStartup phases'))
+        for phase, ms in report['timings'].items():
+            self.stdout.write(f"  {phase:<32}{ms:>9.1f} ms")
+        self.stdout.write(f"  (first request answered {report['status']})")
+    
+    def _print_node(self, node: ImportNode, depth: int, min_us: float, max_depth: int):
+        if node.cumulative_us < min_us or depth >= max_depth:
+            return
+        self.stdout.write(f"{'  ' * depth}{node.name:<{48 - 2 * depth}}{node.cumulative_us / 1000:>9.1f} ms")
+        for child in sorted(node.children, key=lambda n: n.cumulative_us, reverse=True):
+            self._print_node(child, depth + 1, min_us, max_depth)
+    
+    def _sum_packages(self, nodes: List[ImportNode], packages: Dict[str, int]):
+        for node in nodes:
+            package = node.name.split('.')[0]
+            packages[package] = packages.get(package, 0) + node.self_us
+            self._sum_packages(node.children, packages)
@@ -0,0 +1,68 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from authentication.models import RefreshSession
+
+
+class Command(BaseCommand):
+    """
+    Delete expired refresh sessions.
+
+    Deletes at most --batch-size rows per transaction, oldest expiry first,
+    and skips rows another transaction has locked, so it can run from cron
+    against a live table without long locks or one huge DELETE.
+    """
+
+    help = 'Delete expired RefreshSession rows in small batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows deleted per transaction (default: 1000)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=0.1,
+            help='Seconds to pause between batches to limit load (default: 0.1)',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=0,
+            help='Stop after this many batches, 0 for no limit (default: 0)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        pause = options['sleep']
+        max_batches = options['max_batches']
+        # Fixed cutoff so sessions expiring while we run are left for the next run
+        cutoff = timezone.now()
+        deleted = 0
+        batches = 0
+
+        while not max_batches or batches < max_batches:
+            with transaction.atomic():
+                ids = list(
+                    RefreshSession.objects
+                    .filter(expires_at__lte=cutoff)
+                    .order_by('expires_at')
+                    .select_for_update(skip_locked=True)
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                count, _ = RefreshSession.objects.filter(pk__in=ids).delete()
+
+            deleted += count
+            batches += 1
+            self.stdout.write(f"Deleted {deleted} expired sessions")
+
+            if pause:
+                time.sleep(pause)
+
+        self.stdout.write(self.style.SUCCESS(f"Done. Deleted {deleted} expired sessions."))
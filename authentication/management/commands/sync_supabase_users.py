@@ -0,0 +1,224 @@
+import datetime
+import time
+import uuid
+from typing import Dict, Iterator, Optional, Tuple
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from authentication.cache import get_user_cache
+from authentication.models import SupabaseUser
+from config.bulk import FORMATS, copy_in_batches, detect_format, json_field, open_input, read_records
+
+
+STAGING_TABLE = 'supabase_users_staging'
+STAGING_COLUMNS = ('supabase_user_id', 'email', 'role', 'created_at')
+
+
+class Command(BaseCommand):
+    """
+    Upsert users from a Supabase auth export into supabase_users.
+    
+    Reads JSON Lines or CSV (`id`, `email`, `created_at` and optionally
+    `app_metadata` / `raw_app_meta_data` with a `role`), streams the records
+    into a temporary staging table with COPY in batches, then merges the
+    staging table into supabase_users with one INSERT ... ON CONFLICT, all in
+    one transaction. Memory use depends on --batch-size, not on the file.
+    Once the merge is committed, the users it wrote are read back a page at a
+    time to clear them from a shared user cache.
+    
+    New users get the default role unless the export has a valid one;
+    existing users keep their role unless the export sets one. Rows whose
+    email and role are unchanged are not rewritten. Records without a valid
+    id or an email (e.g. phone-only users), or with a created_at that isn't a
+    date and time, are skipped and counted.
+    """
+    
+    help = 'Bulk upsert a Supabase users export (JSON Lines or CSV) into SupabaseUser'
+    
+    INVALIDATE_CHUNK_SIZE = 1000
+    
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Export file, or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Input format (default: from the file extension)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50000,
+            help='Rows sent per COPY (default: 50000)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Stage and count, then roll back')
+    
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or ('jsonl' if path == '-' else detect_format(path))
+        db = router.db_for_write(SupabaseUser)
+        connection = connections[db]
+        if connection.vendor != 'postgresql':
+            raise CommandError('sync_supabase_users needs PostgreSQL (it loads with COPY)')
+        
+        self.skipped = 0
+        self.read = 0
+        started = time.perf_counter()
+        # Written to every row the merge creates or updates, to find them again after the commit
+        merged_at = timezone.now()
+        
+        try:
+            with transaction.atomic(using=db), connection.cursor() as cursor:
+                self._create_staging(cursor)
+                
+                with open_input(path) as f:
+                    rows = self._rows(read_records(f, format))
+                    staged = 0
+                    for staged in copy_in_batches(cursor, STAGING_TABLE, STAGING_COLUMNS, rows, options['batch_size']):
+                        elapsed = time.perf_counter() - started
+                        self.stdout.write(
+                            f"Staged {staged} users ({staged / elapsed:,.0f}/s, {self.skipped} skipped)"
+                        )
+                staging_time = time.perf_counter() - started
+                
+                merge_started = time.perf_counter()
+                created, updated = self._merge(cursor, merged_at)
+                merge_time = time.perf_counter() - merge_started
+                
+                if options['dry_run']:
+                    transaction.set_rollback(True, using=db)
+        except (OSError, ValueError, DatabaseError) as exc:
+            # The staging table is rolled back with everything else
+            raise CommandError(str(exc))
+        
+        # Only after the commit, or a request could cache the old row again in between
+        if updated and not options['dry_run']:
+            self._invalidate(db, merged_at)
+        
+        unchanged = staged - created - updated
+        self.stdout.write(
+            f"Staged {staged} of {self.read} records in {staging_time:.1f}s "
+            f"({staged / staging_time if staging_time else 0:,.0f}/s), merged in {merge_time:.1f}s"
+        )
+        prefix = 'Dry run, rolled back. Would have' if options['dry_run'] else 'Done.'
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix} created {created} and updated {updated} users; {unchanged} rows were "
+            f"unchanged or repeated, {self.skipped} records skipped."
+        ))
+    
+    def _create_staging(self, cursor):
+        # Dropped at commit; seq keeps the file order so the last copy of a duplicate wins
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE {STAGING_TABLE} (
+                seq bigserial,
+                supabase_user_id uuid NOT NULL,
+                email varchar(255) NOT NULL,
+                role varchar(20),
+                created_at timestamptz
+            ) ON COMMIT DROP
+        """)
+    
+    def _rows(self, records: Iterator[Dict]) -> Iterator[Tuple]:
+        """Turn export records into staging rows, skipping the ones that can't be users."""
+        for record in records:
+            self.read += 1
+            user_id = self._uuid(record.get('id') or record.get('supabase_user_id'))
+            email = record.get('email')
+            email = email.strip() if isinstance(email, str) else ''
+            created_at = self._datetime(record.get('created_at'))
+            if user_id is None or not email or len(email) > 255 or created_at is False:
+                self.skipped += 1
+                continue
+            metadata = json_field(record.get('app_metadata')) or json_field(record.get('raw_app_meta_data')) or {}
+            yield (
+                user_id,
+                email,
+                self._role(record.get('role')) or self._role(metadata.get('role')),
+                created_at,
+            )
+    
+    def _uuid(self, value) -> Optional[uuid.UUID]:
+        try:
+            return uuid.UUID(str(value)) if value else None
+        except ValueError:
+            return None
+    
+    def _datetime(self, value):
+        """
+        Parse a created_at value; None when it's missing, False when it's malformed.
+        
+        Checked here because one value COPY can't parse would abort the whole load.
+        """
+        if value is None or value == '':
+            return None
+        if not isinstance(value, str):
+            return False
+        try:
+            parsed = parse_datetime(value.strip())
+        except ValueError:
+            return False
+        if parsed is None:
+            return False
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed, datetime.timezone.utc)
+        return parsed
+    
+    def _role(self, value) -> Optional[str]:
+        """The value if it's one of our roles (Supabase also has e.g. 'authenticated')."""
+        return value if isinstance(value, str) and value in dict(SupabaseUser.ROLE_CHOICES) else None
+    
+    def _merge(self, cursor, now: datetime.datetime) -> Tuple[int, int]:
+        """
+        Merge the staging table into supabase_users with a single statement.
+        
+        Every row created or updated gets updated_at = now.
+        
+        Returns:
+            Tuple of (rows created, rows updated)
+        """
+        table = SupabaseUser._meta.db_table
+        default_role = SupabaseUser._meta.get_field('role').get_default()
+        cursor.execute(f"""
+            WITH merged AS (
+                INSERT INTO {table} (supabase_user_id, email, role, created_at, updated_at)
+                SELECT DISTINCT ON (s.supabase_user_id)
+                    s.supabase_user_id,
+                    s.email,
+                    COALESCE(s.role, u.role, %s),
+                    COALESCE(s.created_at, %s),
+                    %s
+                FROM {STAGING_TABLE} s
+                LEFT JOIN {table} u ON u.supabase_user_id = s.supabase_user_id
+                ORDER BY s.supabase_user_id, s.seq DESC
+                ON CONFLICT (supabase_user_id) DO UPDATE SET
+                    email = EXCLUDED.email,
+                    role = EXCLUDED.role,
+                    updated_at = EXCLUDED.updated_at
+                WHERE {table}.email IS DISTINCT FROM EXCLUDED.email
+                    OR {table}.role IS DISTINCT FROM EXCLUDED.role
+                RETURNING (xmax = 0) AS created
+            )
+            SELECT
+                COUNT(*) FILTER (WHERE created),
+                COUNT(*) FILTER (WHERE NOT created)
+            FROM merged
+        """, [default_role, now, now])
+        created, updated = cursor.fetchone()
+        return created, updated
+    
+    def _invalidate(self, db: str, merged_at: datetime.datetime):
+        """
+        Drop the users the merge wrote from the shared user cache.
+        
+        They are read back from the committed table by their updated_at, in
+        pages of INVALIDATE_CHUNK_SIZE ordered by primary key, so memory stays
+        bounded however many users changed. New users are included: they
+        can't be cached, and telling them apart would cost another column.
+        """
+        user_cache = get_user_cache()
+        if not user_cache.shared_cache_alias:
+            return
+        users = SupabaseUser.objects.using(db).filter(updated_at=merged_at).order_by('pk')
+        last_pk = 0
+        while True:
+            page = list(users.filter(pk__gt=last_pk).values_list('pk', 'supabase_user_id')[:self.INVALIDATE_CHUNK_SIZE])
+            if not page:
+                return
+            user_cache.invalidate_many([user_id for _, user_id in page])
+            last_pk = page[-1][0]
@@ -0,0 +1,321 @@
+"""
+Lightweight request instrumentation.
+
+Code paths mark phases with `with timed('jwt_decode'):`. ServerTimingMiddleware
+collects the phases of each sampled request, reports them in a Server-Timing
+response header and records them in histograms that /metrics exposes in the
+Prometheus text format.
+
+Histograms are sharded per thread, so recording a value takes no lock; shards
+are only summed when /metrics is scraped. Unsampled requests skip everything
+except one ContextVar lookup per phase.
+"""
+import contextvars
+import random
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, JsonResponse
+from authentication.policy import public
+from authentication.utils import has_internal_token
+
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Phase timings of the request being handled, or None if it isn't sampled
+_current_timings: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    'server_timings', default=None
+)
+
+
+class timed:
+    """Context manager recording how long a phase of the current request takes."""
+    
+    __slots__ = ('name', 'timings', 'start')
+    
+    def __init__(self, name: str):
+        self.name = name
+        self.timings = _current_timings.get()
+    
+    def __enter__(self):
+        if self.timings is not None:
+            self.start = perf_counter()
+        return self
+    
+    def __exit__(self, *exc_info):
+        if self.timings is not None:
+            self.timings.append((self.name, perf_counter() - self.start))
+        return False
+
+
+class Histogram:
+    """
+    Prometheus-style histogram with one label dimension set.
+    
+    Each thread writes to its own shard, so observe() never takes a lock.
+    Shards of threads that have exited are folded into a retired shard at
+    scrape time so short-lived threads don't leak memory.
+    """
+    
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._local = threading.local()
+        self._shards: List[Tuple[threading.Thread, Dict]] = []
+        self._retired: Dict = {}
+        self._lock = threading.Lock()
+    
+    def _shard(self) -> Dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+    
+    def observe(self, value: float, labels: Tuple[str, ...]):
+        """Record one value for the given label values."""
+        shard = self._shard()
+        entry = shard.get(labels)
+        if entry is None:
+            # Bucket counts (the last one is +Inf) followed by the running sum
+            entry = shard[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        entry[bisect_left(self.buckets, value)] += 1
+        entry[-1] += value
+    
+    def _merge(self, target: Dict, shard: Dict):
+        for labels, entry in list(shard.items()):
+            merged = target.get(labels)
+            if merged is None:
+                target[labels] = list(entry)
+            else:
+                for i, value in enumerate(entry):
+                    merged[i] += value
+    
+    def collect(self) -> Dict:
+        """Sum all shards into a {labels: [bucket counts..., sum]} snapshot."""
+        with self._lock:
+            alive = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    alive.append((thread, shard))
+                else:
+                    self._merge(self._retired, shard)
+            self._shards = alive
+            totals: Dict = {}
+            self._merge(totals, self._retired)
+            for _, shard in alive:
+                self._merge(totals, shard)
+        return totals
+    
+    def render(self) -> List[str]:
+        """Return the histogram in Prometheus text exposition format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        for labels, entry in sorted(self.collect().items()):
+            label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.labelnames, labels))
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {entry[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {cumulative}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds',
+    'Time spent handling a request, by URL name and status code.',
+    ('route', 'status'),
+)
+PHASE_DURATION = Histogram(
+    'auth_phase_duration_seconds',
+    'Time spent in each instrumented phase of a request.',
+    ('phase',),
+)
+
+# Gauge callbacks, each returning (name, help, [(labels, value), ...])
+_gauges: List[Callable[[], Tuple[str, str, Iterable[Tuple[Dict[str, str], float]]]]] = []
+
+
+def register_gauge(callback: Callable[[], Tuple[str, str, Iterable[Tuple[Dict[str, str], float]]]]):
+    """Register a callback whose values are sampled on every /metrics scrape."""
+    _gauges.append(callback)
+    return callback
+
+
+@register_gauge
+def _token_cache_stats():
+    from authentication.utils import get_jwt_validator
+    stats = get_jwt_validator().cache_stats()
+    return (
+        'auth_token_cache',
+        'Verified-token cache counters.',
+        [({'stat': key}, value) for key, value in stats.items()],
+    )
+
+
+@register_gauge
+def _user_cache_stats():
+    from authentication.cache import get_user_cache
+    stats = get_user_cache().local.stats()
+    return (
+        'auth_user_cache',
+        'Process-local SupabaseUser cache counters.',
+        [({'stat': key}, value) for key, value in stats.items()],
+    )
+
+
+@register_gauge
+def _revocation_stats():
+    from authentication.revocation import get_revocation_list
+    stats = get_revocation_list().stats()
+    return (
+        'auth_revocation_filter',
+        'Revoked access token filter counters.',
+        [({'stat': key}, value) for key, value in stats.items()],
+    )
+
+
+@register_gauge
+def _ratelimit_stats():
+    from authentication.ratelimit import rejected
+    return (
+        'auth_ratelimit_rejected',
+        'Requests rejected with 429, by limit.',
+        [({'limit': name}, value) for name, value in list(rejected.items())],
+    )
+
+
+@register_gauge
+def _audit_stats():
+    from authentication.audit import get_audit_log
+    stats = get_audit_log().stats()
+    return (
+        'auth_audit_events',
+        'Audit log queue and writer counters.',
+        [({'stat': key}, value) for key, value in stats.items()],
+    )
+
+
+# New database connections per alias; stays flat while connections are being reused
+connections_opened: Dict[str, int] = {}
+
+
+def _count_connection(sender, connection, **kwargs):
+    connections_opened[connection.alias] = connections_opened.get(connection.alias, 0) + 1
+
+
+connection_created.connect(_count_connection)
+
+
+@register_gauge
+def _database_stats():
+    return (
+        'db_connections',
+        'Database connections opened by this process.',
+        [({'alias': alias, 'stat': 'opened'}, count) for alias, count in list(connections_opened.items())],
+    )
+
+
+def render_prometheus() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    lines = REQUEST_DURATION.render() + PHASE_DURATION.render()
+    for callback in _gauges:
+        try:
+            name, documentation, samples = callback()
+        except Exception:
+            continue
+        lines.append(f"# HELP {name} {documentation}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{val}"' for key, val in labels.items())
+            lines.append(f"{name}{{{label_text}}} {value}")
+    return '\n'.join(lines) + '\n'
+
+
+@public  # Authenticated by the internal service token instead
+def metrics_view(request):
+    """
+    Expose collected metrics for Prometheus to scrape.
+    
+    Scrapers send the shared INTERNAL_SERVICE_TOKEN in the X-Internal-Token
+    header, unless METRICS_PUBLIC opts in to serving them to anyone.
+    """
+    if not getattr(settings, 'METRICS_PUBLIC', False) and not has_internal_token(request):
+        return JsonResponse({'error': 'Invalid internal service token'}, status=403)
+    return HttpResponse(render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ServerTimingMiddleware:
+    """
+    Times sampled requests, records their phases and adds a Server-Timing header.
+    
+    Should be the first entry in MIDDLEWARE so the total covers the whole stack.
+    METRICS_SAMPLE_RATE (0.0-1.0) controls what fraction of requests is measured.
+    """
+    
+    sync_capable = True
+    async_capable = True
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+        self.emit_header = getattr(settings, 'METRICS_SERVER_TIMING_HEADER', True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+    
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        
+        if not self._sampled():
+            return self.get_response(request)
+        
+        timings = []
+        token = _current_timings.set(timings)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        return self._finish(request, response, timings, perf_counter() - start)
+    
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        
+        timings = []
+        token = _current_timings.set(timings)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timings.reset(token)
+        return self._finish(request, response, timings, perf_counter() - start)
+    
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1.0 or random.random() < self.sample_rate
+    
+    def _finish(self, request, response, timings, total):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        REQUEST_DURATION.observe(total, (route, str(response.status_code)))
+        for name, duration in timings:
+            PHASE_DURATION.observe(duration, (name,))
+        
+        if self.emit_header:
+            entries = [f"{name};dur={duration * 1000:.3f}" for name, duration in timings]
+            entries.append(f"total;dur={total * 1000:.3f}")
+            response['Server-Timing'] = ', '.join(entries)
+        return response
@@ -1,84 +1,192 @@
+from django.conf import settings
 from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
-from authentication.models import SupabaseUser
+from authentication.audit import get_audit_log
+from authentication.cache import get_user_cache
+from authentication.metrics import timed
+from authentication.models import AuthAuditEvent, SupabaseUser
+from authentication.policy import get_route_policies
+from authentication.users import ClaimsUser, adatabase_role, database_role
 from authentication.utils import get_jwt_validator
 
 
 class SupabaseTokenValidationMiddleware(MiddlewareMixin):
     """
     Middleware to validate Supabase JWT tokens on every request.
-    Skips validation for public endpoints.
+    Skips validation for public routes and enforces role-restricted ones,
+    as declared with the decorators in authentication.policy.
+    
+    With SUPABASE_AUTH_CLAIMS_ONLY enabled, request.user is a ClaimsUser built
+    from the token and the database row is only loaded if a view needs it.
+    
+    Runs natively in both sync (WSGI) and async (ASGI) middleware chains.
     """
     
-    # Public endpoints that don't require token validation
-    PUBLIC_ENDPOINTS = [
-        '/api/auth/login',
-        '/api/auth/logout',
-        '/api/auth/refresh',
-    ]
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.claims_only = getattr(settings, 'SUPABASE_AUTH_CLAIMS_ONLY', False)
+        # Compiled once from the URLconf; one dict lookup per request
+        self.policies = get_route_policies()
+    
+    async def __acall__(self, request):
+        """
+        Native async request path used when the middleware chain runs under ASGI.
+        Avoids the thread hop MiddlewareMixin would otherwise add around process_request.
+        """
+        response, user_id = await self._aauthenticate(request)
+        if user_id is not None:
+            response = await self._aresolve_user(request, user_id)
+        if response is None and request.auth_policy.roles:
+            response = await self._aauthorize(request)
+        return response or await self.get_response(request)
     
     def process_request(self, request):
         """Process the request and validate the token if needed."""
-        # Check if this is a public endpoint
-        if self._is_public_endpoint(request.path):
-            request.user = None
-            return None
+        response, user_id = self._authenticate(request)
+        if user_id is not None:
+            response = self._resolve_user(request, user_id)
+        if response is None and request.auth_policy.roles:
+            response = self._authorize(request)
+        return response
+    
+    def _authenticate(self, request):
+        """
+        Validate the bearer token without touching the database.
+        
+        Returns:
+            Tuple of (error response or None, user ID still to be resolved or None).
+            Public endpoints and claims-only mode need no further resolution.
+        """
+        response, token = self._bearer_token(request)
+        if token is None:
+            return response, None
         
-        # Extract token from Authorization header
-        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+        validator = get_jwt_validator()
+        with timed('jwt_decode'):
+            token_payload = validator.validate_token(token)
+        return self._check_payload(request, validator, token_payload)
+    
+    async def _aauthenticate(self, request):
+        """Async version of _authenticate; shared cache and revocation lookups don't block the event loop."""
+        response, token = self._bearer_token(request)
+        if token is None:
+            return response, None
+        
+        validator = get_jwt_validator()
+        with timed('jwt_decode'):
+            token_payload = await validator.avalidate_token(token)
+        return self._check_payload(request, validator, token_payload)
+    
+    def _bearer_token(self, request):
+        """
+        Look up the route's policy and take the token from the Authorization header.
+        
+        Returns:
+            Tuple of (error response or None, token or None). Both are None for public routes.
+        """
+        request.user = None
+        
+        with timed('auth_header'):
+            # Check if this is a public route
+            request.auth_policy = self.policies.lookup(request.path_info, request.method)
+            if request.auth_policy.public:
+                return None, None
+            
+            # Extract token from Authorization header
+            auth_header = request.META.get('HTTP_AUTHORIZATION', '')
         
         # If no auth header, return 401
         if not auth_header or not auth_header.startswith('Bearer '):
             return JsonResponse(
                 {'error': 'Missing or invalid authorization header'},
                 status=401
-            )
-        
-        token = auth_header.split(' ')[1]
-        
-        # Validate token
-        validator = get_jwt_validator()
-        token_payload = validator.validate_token(token)
+            ), None
         
+        return None, auth_header.split(' ')[1]
+    
+    def _check_payload(self, request, validator, token_payload):
+        """Turn a validated payload into the user ID to resolve (or the claims user)."""
         if not token_payload:
+            get_audit_log().record(AuthAuditEvent.TOKEN_REJECTED, request, detail='Invalid or expired token')
             return JsonResponse(
                 {'error': 'Invalid or expired token'},
                 status=401
-            )
+            ), None
         
         # Extract user ID from token
         user_id = validator.extract_user_id(token_payload)
         
         if not user_id:
+            get_audit_log().record(AuthAuditEvent.TOKEN_REJECTED, request, detail='Invalid token payload')
             return JsonResponse(
                 {'error': 'Invalid token payload'},
                 status=401
-            )
+            ), None
         
-        # Get or create user from database
+        if self.claims_only:
+            try:
+                request.user = ClaimsUser.from_payload(user_id, token_payload)
+            except ValueError:
+                get_audit_log().record(
+                    AuthAuditEvent.TOKEN_REJECTED, request, user_id=user_id, detail='Invalid token payload'
+                )
+                return JsonResponse(
+                    {'error': 'Invalid token payload'},
+                    status=401
+                ), None
+            return None, None
+        
+        return None, user_id
+    
+    def _resolve_user(self, request, user_id):
+        """Load request.user from the cache or database."""
+        try:
+            with timed('user_lookup'):
+                request.user = get_user_cache().get(user_id)
+        except SupabaseUser.DoesNotExist:
+            return self._user_not_found(request, user_id)
+        return None
+    
+    async def _aresolve_user(self, request, user_id):
+        """Async version of _resolve_user."""
         try:
-            user = SupabaseUser.objects.get(supabase_user_id=user_id)
-            request.user = user
+            with timed('user_lookup'):
+                request.user = await get_user_cache().aget(user_id)
         except SupabaseUser.DoesNotExist:
-            # User doesn't exist in our database yet
-            # This could happen if they haven't logged in through our API
-            # For now, we'll return 401, but you might want to handle this differently
+            return self._user_not_found(request, user_id)
+        return None
+    
+    def _user_not_found(self, request, user_id):
+        get_audit_log().record(AuthAuditEvent.TOKEN_REJECTED, request, user_id=user_id, detail='User not found in database')
+        # User doesn't exist in our database yet
+        # This could happen if they haven't logged in through our API
+        # For now, we'll return 401, but you might want to handle this differently
+        return JsonResponse(
+            {'error': 'User not found in database'},
+            status=401
+        )
+    
+    def _authorize(self, request):
+        """Check the user's role against a role-restricted route."""
+        try:
+            # Never the token's role claim: it outlives a demotion until expiry
+            role = database_role(request.user)
+        except SupabaseUser.DoesNotExist:
+            return self._user_not_found(request, request.user.supabase_user_id)
+        return self._check_role(request, role)
+    
+    async def _aauthorize(self, request):
+        """Async version of _authorize."""
+        try:
+            role = await adatabase_role(request.user)
+        except SupabaseUser.DoesNotExist:
+            return self._user_not_found(request, request.user.supabase_user_id)
+        return self._check_role(request, role)
+    
+    def _check_role(self, request, role):
+        if role not in request.auth_policy.roles:
             return JsonResponse(
-                {'error': 'User not found in database'},
-                status=401
+                {'error': 'Insufficient permissions'},
+                status=403
             )
-        
         return None
-    
-    def _is_public_endpoint(self, path: str) -> bool:
-        """Check if the given path is a public endpoint."""
-        # Normalize path by removing trailing slash for comparison
-        normalized_path = path.rstrip('/')
-        for public_path in self.PUBLIC_ENDPOINTS:
-            # Normalize public path too
-            normalized_public = public_path.rstrip('/')
-            # Check exact match
-            if normalized_path == normalized_public:
-                return True
-        return False
-
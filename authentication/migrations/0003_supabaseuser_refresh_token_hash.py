@@ -0,0 +1,39 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('authentication', '0002_rename_supabase_users_supabase_user_id_idx_supabase_us_supabas_fbac80_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='supabaseuser',
+            name='refresh_token_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+        # Build the partial unique index without blocking writes to supabase_users
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name='supabaseuser',
+                    constraint=models.UniqueConstraint(condition=models.Q(('refresh_token_hash__isnull', False)), fields=('refresh_token_hash',), name='supabase_users_refresh_token_hash_uniq'),
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(
+                    sql=(
+                        'CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS "supabase_users_refresh_token_hash_uniq" '
+                        'ON "supabase_users" ("refresh_token_hash") WHERE "refresh_token_hash" IS NOT NULL'
+                    ),
+                    reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS "supabase_users_refresh_token_hash_uniq"',
+                ),
+            ],
+        ),
+    ]
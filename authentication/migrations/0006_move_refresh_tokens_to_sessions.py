@@ -0,0 +1,66 @@
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, transaction
+from django.utils import timezone
+
+
+BATCH_SIZE = 1000
+
+
+def move_refresh_tokens(apps, schema_editor):
+    """Give every user with a refresh token one session and clear the old column."""
+    SupabaseUser = apps.get_model('authentication', 'SupabaseUser')
+    RefreshSession = apps.get_model('authentication', 'RefreshSession')
+    db = schema_editor.connection.alias
+    ttl = timedelta(seconds=getattr(settings, 'SUPABASE_REFRESH_SESSION_TTL', 30 * 24 * 3600))
+
+    last_id = 0
+    while True:
+        # One short transaction per batch so the table isn't locked for the whole run
+        with transaction.atomic(using=db):
+            batch = list(
+                SupabaseUser.objects.using(db)
+                .filter(pk__gt=last_id, refresh_token__isnull=False)
+                .order_by('pk')
+                .only('id', 'refresh_token', 'refresh_token_hash', 'updated_at')[:BATCH_SIZE]
+            )
+            if not batch:
+                break
+
+            now = timezone.now()
+            RefreshSession.objects.using(db).bulk_create(
+                [
+                    RefreshSession(
+                        user_id=user.pk,
+                        token_hash=user.refresh_token_hash or hashlib.sha256(user.refresh_token.encode('utf-8')).hexdigest(),
+                        device='legacy',
+                        created_at=user.updated_at,
+                        last_used=user.updated_at,
+                        expires_at=now + ttl,
+                    )
+                    for user in batch
+                    if user.refresh_token
+                ],
+                ignore_conflicts=True,
+            )
+            SupabaseUser.objects.using(db).filter(pk__in=[user.pk for user in batch]).update(
+                refresh_token=None,
+                refresh_token_hash=None,
+            )
+        last_id = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    # Batches commit individually
+    atomic = False
+
+    dependencies = [
+        ('authentication', '0005_refreshsession'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_refresh_tokens, migrations.RunPython.noop),
+    ]
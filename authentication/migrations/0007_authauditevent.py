@@ -0,0 +1,33 @@
+# Generated by Django 4.2.11 on 2026-10-17 01:58
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0006_move_refresh_tokens_to_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthAuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event', models.CharField(choices=[('login', 'Login'), ('login_failed', 'Failed login'), ('refresh', 'Token refresh'), ('refresh_failed', 'Failed token refresh'), ('logout', 'Logout'), ('token_rejected', 'Rejected access token')], max_length=32)),
+                ('supabase_user_id', models.UUIDField(blank=True, null=True)),
+                ('ip_address', models.GenericIPAddressField(blank=True, null=True)),
+                ('user_agent', models.CharField(blank=True, default='', max_length=255)),
+                ('path', models.CharField(blank=True, default='', max_length=255)),
+                ('detail', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'verbose_name': 'Auth Audit Event',
+                'verbose_name_plural': 'Auth Audit Events',
+                'db_table': 'auth_audit_events',
+                'indexes': [models.Index(fields=['supabase_user_id', 'created_at'], name='auth_audit_user_idx')],
+            },
+        ),
+    ]
@@ -1,5 +1,110 @@
-from django.db import models
+from datetime import timedelta
+from typing import Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, models, router
+from django.utils import timezone
 import uuid
+from authentication.refresh import get_refresh_coalescer
+from authentication.utils import token_digest
+
+
+class SupabaseUserManager(models.Manager):
+    """Manager with lookups used by the authentication views."""
+    
+    def get_by_refresh_token(self, refresh_token: str) -> 'SupabaseUser':
+        """
+        Find a user by refresh token using the indexed refresh_token_hash column.
+        
+        Rows written before the hash column existed are only found when
+        SUPABASE_REFRESH_TOKEN_LEGACY_LOOKUP is enabled; run the
+        backfill_refresh_token_hashes command and turn it off afterwards.
+        
+        Raises:
+            SupabaseUser.DoesNotExist: If no user holds this refresh token
+        """
+        try:
+            return self.get(refresh_token_hash=token_digest(refresh_token))
+        except self.model.DoesNotExist:
+            if not getattr(settings, 'SUPABASE_REFRESH_TOKEN_LEGACY_LOOKUP', False):
+                raise
+        return self.get(refresh_token_hash__isnull=True, refresh_token=refresh_token)
+    
+    async def aget_by_refresh_token(self, refresh_token: str) -> 'SupabaseUser':
+        """Async version of get_by_refresh_token()."""
+        try:
+            return await self.aget(refresh_token_hash=token_digest(refresh_token))
+        except self.model.DoesNotExist:
+            if not getattr(settings, 'SUPABASE_REFRESH_TOKEN_LEGACY_LOOKUP', False):
+                raise
+        return await self.aget(refresh_token_hash__isnull=True, refresh_token=refresh_token)
+    
+    def upsert_login(self, supabase_user_id, email: str) -> Tuple['SupabaseUser', bool]:
+        """
+        Insert a user or update their email in a single statement.
+        
+        Uses INSERT ... ON CONFLICT (supabase_user_id) DO UPDATE, and the update
+        is skipped entirely when the email didn't change, so repeated logins
+        don't rewrite the row or hold its lock. Refresh tokens live in
+        RefreshSession.
+        
+        Returns:
+            Tuple of (user, created)
+        """
+        model = self.model
+        db = router.db_for_write(model)
+        connection = connections[db]
+        opts = model._meta
+        
+        now = timezone.now()
+        values = {
+            'supabase_user_id': supabase_user_id,
+            'email': email,
+            'role': opts.get_field('role').get_default(),
+            'created_at': now,
+            'updated_at': now,
+        }
+        insert_columns = ', '.join(connection.ops.quote_name(opts.get_field(name).column) for name in values)
+        params = [
+            opts.get_field(name).get_db_prep_save(value, connection)
+            for name, value in values.items()
+        ]
+        
+        fields = list(opts.concrete_fields)
+        columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+        table = connection.ops.quote_name(opts.db_table)
+        sql = f"""
+            WITH upserted AS (
+                INSERT INTO {table} ({insert_columns})
+                VALUES ({', '.join(['%s'] * len(values))})
+                ON CONFLICT (supabase_user_id) DO UPDATE SET
+                    email = EXCLUDED.email,
+                    updated_at = EXCLUDED.updated_at
+                WHERE {table}.email IS DISTINCT FROM EXCLUDED.email
+                RETURNING {columns}, (xmax = 0) AS created
+            )
+            SELECT {columns}, created FROM upserted
+            UNION ALL
+            SELECT {columns}, false FROM {table}
+            WHERE supabase_user_id = %s AND NOT EXISTS (SELECT 1 FROM upserted)
+        """
+        params.append(params[0])
+        
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+            if row is None:
+                # A concurrent transaction inserted the row after our snapshot was
+                # taken and nothing needed updating; read the committed row instead
+                cursor.execute(f"SELECT {columns}, false FROM {table} WHERE supabase_user_id = %s", [params[0]])
+                row = cursor.fetchone()
+        
+        user = model.from_db(db, [field.attname for field in fields], row[:-1])
+        return user, bool(row[-1])
+    
+    async def aupsert_login(self, supabase_user_id, email: str) -> Tuple['SupabaseUser', bool]:
+        """Async version of upsert_login()."""
+        return await sync_to_async(self.upsert_login)(supabase_user_id, email)
 
 
 class SupabaseUser(models.Model):
@@ -12,11 +117,17 @@ class SupabaseUser(models.Model):
     
     supabase_user_id = models.UUIDField(unique=True, db_index=True)
     email = models.EmailField(max_length=255)
+    # Single-device refresh token, superseded by RefreshSession. Only read to adopt
+    # tokens issued before sessions existed; see RefreshSessionManager.get_active()
     refresh_token = models.TextField(blank=True, null=True)
+    # SHA-256 of refresh_token, kept in sync by save() so lookups can use an index
+    refresh_token_hash = models.CharField(max_length=64, blank=True, null=True, editable=False)
     role = models.CharField(max_length=20, choices=ROLE_CHOICES, default='member', db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = SupabaseUserManager()
+    
     class Meta:
         db_table = 'supabase_users'
         verbose_name = 'Supabase User'
@@ -26,6 +137,255 @@ class SupabaseUser(models.Model):
             models.Index(fields=['email']),
             models.Index(fields=['role']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['refresh_token_hash'],
+                condition=models.Q(refresh_token_hash__isnull=False),
+                name='supabase_users_refresh_token_hash_uniq',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.email} ({self.supabase_user_id})"
+    
+    def save(self, *args, **kwargs):
+        """Keep refresh_token_hash in sync with refresh_token."""
+        # Skip when refresh_token was deferred, reading it would cost a query
+        if 'refresh_token' not in self.get_deferred_fields():
+            self.refresh_token_hash = token_digest(self.refresh_token) if self.refresh_token else None
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'refresh_token' in update_fields:
+                kwargs['update_fields'] = set(update_fields) | {'refresh_token_hash'}
+        super().save(*args, **kwargs)
+
+
+class RevokedToken(models.Model):
+    """Access token revoked before its expiry, e.g. on logout."""
+    
+    # SHA-256 of the access token
+    token_digest = models.CharField(max_length=64, unique=True)
+    # The token's own exp; the row is useless afterwards and gets pruned
+    expires_at = models.DateTimeField(db_index=True)
+    # Workers sync new revocations by it
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        db_table = 'revoked_tokens'
+        verbose_name = 'Revoked Token'
+        verbose_name_plural = 'Revoked Tokens'
+    
+    def __str__(self):
+        return f"{self.token_digest[:12]}... (expires {self.expires_at})"
+
+
+class RefreshTokenInUse(Exception):
+    """Raised when a login presents a refresh token whose session belongs to another user."""
+    pass
+
+
+class RefreshSessionManager(models.Manager):
+    """Manager with the session operations used by the authentication views."""
+    
+    def _expiry(self):
+        return timezone.now() + timedelta(seconds=getattr(settings, 'SUPABASE_REFRESH_SESSION_TTL', 30 * 24 * 3600))
+    
+    def start(self, user: SupabaseUser, refresh_token: str, device: str = '') -> 'RefreshSession':
+        """
+        Record a new session for a login with a single INSERT ... ON CONFLICT.
+        
+        Logging in again with a token we already know just renews that session.
+        Unlike bulk_create() this needs no surrounding transaction, so it is
+        one round trip.
+        
+        Raises:
+            RefreshTokenInUse: If the token's session belongs to another user
+        """
+        model = self.model
+        db = router.db_for_write(model)
+        connection = connections[db]
+        opts = model._meta
+        
+        now = timezone.now()
+        session = model(
+            user=user,
+            token_hash=token_digest(refresh_token),
+            device=device[:255],
+            created_at=now,
+            last_used=now,
+            expires_at=self._expiry(),
+        )
+        quote = connection.ops.quote_name
+        fields = [field for field in opts.concrete_fields if not field.primary_key]
+        columns = ', '.join(quote(field.column) for field in fields)
+        params = [field.get_db_prep_save(getattr(session, field.attname), connection) for field in fields]
+        sql = f"""
+            INSERT INTO {quote(opts.db_table)} ({columns})
+            VALUES ({', '.join(['%s'] * len(fields))})
+            ON CONFLICT (token_hash) DO UPDATE SET
+                device = EXCLUDED.device,
+                last_used = EXCLUDED.last_used,
+                expires_at = EXCLUDED.expires_at
+            WHERE {quote(opts.db_table)}.user_id = EXCLUDED.user_id
+            RETURNING {quote(opts.pk.column)}
+        """
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            row = cursor.fetchone()
+        if row is None:
+            # Never move another user's session to whoever sent its refresh token
+            raise RefreshTokenInUse('Refresh token belongs to another user')
+        session.pk = row[0]
+        session._state.adding = False
+        session._state.db = db
+        return session
+    
+    async def astart(self, user: SupabaseUser, refresh_token: str, device: str = '') -> 'RefreshSession':
+        """Async version of start()."""
+        return await sync_to_async(self.start)(user, refresh_token, device)
+    
+    def get_active(self, refresh_token: str) -> 'RefreshSession':
+        """
+        Find the unexpired session for a refresh token by its indexed hash.
+        
+        A token still stored on SupabaseUser (issued before sessions existed)
+        is moved into a new session on first use.
+        
+        Raises:
+            RefreshSession.DoesNotExist: If the token has no active session
+        """
+        try:
+            # The user comes along in the same query, for the audit log
+            return self.select_related('user').get(token_hash=token_digest(refresh_token), expires_at__gt=timezone.now())
+        except self.model.DoesNotExist:
+            try:
+                user = SupabaseUser.objects.get_by_refresh_token(refresh_token)
+            except SupabaseUser.DoesNotExist:
+                raise self.model.DoesNotExist('No active session for this refresh token')
+        
+        user.refresh_token = None
+        user.save(update_fields=['refresh_token'])
+        return self.start(user, refresh_token, device='legacy')
+    
+    async def aget_active(self, refresh_token: str) -> 'RefreshSession':
+        """Async version of get_active()."""
+        return await sync_to_async(self.get_active)(refresh_token)
+    
+    def rotate(self, session: 'RefreshSession', new_refresh_token: str):
+        """Store the rotated token of a session and extend its expiry."""
+        session.token_hash = token_digest(new_refresh_token)
+        session.last_used = timezone.now()
+        session.expires_at = self._expiry()
+        self.filter(pk=session.pk).update(
+            token_hash=session.token_hash,
+            last_used=session.last_used,
+            expires_at=session.expires_at,
+        )
+    
+    async def arotate(self, session: 'RefreshSession', new_refresh_token: str):
+        """Async version of rotate()."""
+        session.token_hash = token_digest(new_refresh_token)
+        session.last_used = timezone.now()
+        session.expires_at = self._expiry()
+        await self.filter(pk=session.pk).aupdate(
+            token_hash=session.token_hash,
+            last_used=session.last_used,
+            expires_at=session.expires_at,
+        )
+    
+    def end(self, refresh_token: str) -> bool:
+        """
+        Delete the session of a refresh token; returns whether one existed.
+        
+        The coalesced refresh result of the token is forgotten as well, so a
+        concurrent refresh can't hand the ended session's tokens back out.
+        """
+        digest = token_digest(refresh_token)
+        deleted, _ = self.filter(token_hash=digest).delete()
+        get_refresh_coalescer().forget([digest])
+        return bool(deleted)
+    
+    async def aend(self, refresh_token: str) -> bool:
+        """Async version of end()."""
+        digest = token_digest(refresh_token)
+        deleted, _ = await self.filter(token_hash=digest).adelete()
+        await get_refresh_coalescer().aforget([digest])
+        return bool(deleted)
+    
+    def end_all(self, supabase_user_id) -> int:
+        """Delete every session of a user, forgetting their coalesced refresh results; returns how many existed."""
+        sessions = self.filter(user__supabase_user_id=supabase_user_id)
+        digests = list(sessions.values_list('token_hash', flat=True))
+        deleted, _ = sessions.delete()
+        get_refresh_coalescer().forget(digests)
+        return deleted
+    
+    async def aend_all(self, supabase_user_id) -> int:
+        """Async version of end_all()."""
+        sessions = self.filter(user__supabase_user_id=supabase_user_id)
+        digests = [digest async for digest in sessions.values_list('token_hash', flat=True)]
+        deleted, _ = await sessions.adelete()
+        await get_refresh_coalescer().aforget(digests)
+        return deleted
+
+
+class RefreshSession(models.Model):
+    """One logged-in device of a user, identified by its current refresh token."""
+    
+    user = models.ForeignKey(SupabaseUser, on_delete=models.CASCADE, related_name='refresh_sessions')
+    # SHA-256 of the current refresh token; the token itself is never stored
+    token_hash = models.CharField(max_length=64, unique=True)
+    device = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+    
+    objects = RefreshSessionManager()
+    
+    class Meta:
+        db_table = 'refresh_sessions'
+        verbose_name = 'Refresh Session'
+        verbose_name_plural = 'Refresh Sessions'
+    
+    def __str__(self):
+        return f"{self.device or 'unknown device'} (user {self.user_id}, expires {self.expires_at})"
+
+
+class AuthAuditEvent(models.Model):
+    """A login, refresh, logout or rejected token, written in batches by authentication.audit."""
+    
+    LOGIN = 'login'
+    LOGIN_FAILED = 'login_failed'
+    REFRESH = 'refresh'
+    REFRESH_FAILED = 'refresh_failed'
+    LOGOUT = 'logout'
+    TOKEN_REJECTED = 'token_rejected'
+    EVENT_CHOICES = [
+        (LOGIN, 'Login'),
+        (LOGIN_FAILED, 'Failed login'),
+        (REFRESH, 'Token refresh'),
+        (REFRESH_FAILED, 'Failed token refresh'),
+        (LOGOUT, 'Logout'),
+        (TOKEN_REJECTED, 'Rejected access token'),
+    ]
+    
+    event = models.CharField(max_length=32, choices=EVENT_CHOICES)
+    # Not a foreign key: failed attempts may name users we don't have, and rows outlive users
+    supabase_user_id = models.UUIDField(null=True, blank=True)
+    ip_address = models.GenericIPAddressField(null=True, blank=True)
+    user_agent = models.CharField(max_length=255, blank=True, default='')
+    path = models.CharField(max_length=255, blank=True, default='')
+    # Reason for failures, e.g. the error message returned
+    detail = models.CharField(max_length=255, blank=True, default='')
+    # When the event happened, not when the batch was written
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    
+    class Meta:
+        db_table = 'auth_audit_events'
+        verbose_name = 'Auth Audit Event'
+        verbose_name_plural = 'Auth Audit Events'
+        indexes = [
+            models.Index(fields=['supabase_user_id', 'created_at'], name='auth_audit_user_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event} (user {self.supabase_user_id}, {self.created_at})"
@@ -0,0 +1,191 @@
+"""
+Route-level authentication policies.
+
+Views declare who may call them with decorators applied on top of everything
+else (including @api_view):
+
+    @public
+    @api_view(['POST'])
+    def login_view(request): ...
+
+    @role_required('admin')
+    @public(methods=['GET'])
+    @api_view(['GET', 'POST'])
+    def schedule_view(request): ...
+
+Undecorated routes require a valid token. AUTH_ROUTE_POLICIES overrides
+policies by URL name and AUTH_PREFIX_POLICIES assigns them to path prefixes.
+
+The URLconf is compiled once into a dict keyed by normalized path, so the
+middleware finds the policy of a static route with one lookup no matter how
+many routes exist. Routes with path converters are resolved once per distinct
+path and remembered in a bounded LRU cache.
+"""
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Optional, Union
+from django.conf import settings
+from django.urls import URLPattern, URLResolver, Resolver404, get_resolver
+from django.urls.resolvers import RoutePattern
+
+
+ANY_METHOD = '*'
+
+
+class Policy:
+    """What a request needs to reach a route: nothing, a valid token, or a role."""
+    
+    __slots__ = ('public', 'roles')
+    
+    def __init__(self, public: bool = False, roles: Optional[Iterable[str]] = None):
+        self.public = public
+        self.roles: Optional[FrozenSet[str]] = frozenset(roles) if roles else None
+    
+    def __repr__(self):
+        if self.public:
+            return 'Policy(public)'
+        if self.roles:
+            return f"Policy(roles={sorted(self.roles)})"
+        return 'Policy(authenticated)'
+
+
+PUBLIC = Policy(public=True)
+AUTHENTICATED = Policy()
+
+# Method -> Policy, with ANY_METHOD as the fallback
+MethodPolicies = Dict[str, Policy]
+
+
+def _decorate(policy: Policy, methods: Optional[Iterable[str]]):
+    def decorator(view):
+        policies = dict(getattr(view, 'auth_policy', {}))
+        for method in (methods or [ANY_METHOD]):
+            policies[method.upper()] = policy
+        view.auth_policy = policies
+        return view
+    return decorator
+
+
+def public(view=None, *, methods: Optional[Iterable[str]] = None):
+    """Allow requests without a token (for all methods, or only the given ones)."""
+    decorator = _decorate(PUBLIC, methods)
+    return decorator(view) if view is not None else decorator
+
+
+def authenticated(view=None, *, methods: Optional[Iterable[str]] = None):
+    """Require a valid token (the default for undecorated views)."""
+    decorator = _decorate(AUTHENTICATED, methods)
+    return decorator(view) if view is not None else decorator
+
+
+def role_required(*roles: str, methods: Optional[Iterable[str]] = None):
+    """Require a valid token whose user has one of the given roles."""
+    return _decorate(Policy(roles=roles), methods)
+
+
+def _parse_spec(spec: Union[str, Iterable[str], Dict]) -> MethodPolicies:
+    """
+    Turn a settings value into method policies.
+    
+    'public' and 'authenticated' map to those policies, a list of names is a
+    set of allowed roles, and a dict maps HTTP methods to either form.
+    """
+    if isinstance(spec, dict):
+        policies = {}
+        for method, method_spec in spec.items():
+            policies[method.upper()] = _parse_spec(method_spec)[ANY_METHOD]
+        return policies
+    if spec == 'public':
+        return {ANY_METHOD: PUBLIC}
+    if spec == 'authenticated':
+        return {ANY_METHOD: AUTHENTICATED}
+    if isinstance(spec, str):
+        return {ANY_METHOD: Policy(roles=[spec])}
+    return {ANY_METHOD: Policy(roles=spec)}
+
+
+def _normalize(path: str) -> str:
+    return path.rstrip('/')
+
+
+class RoutePolicyTable:
+    """Policies of every route in the URLconf, compiled for constant-time lookup."""
+    
+    def __init__(self, urlconf=None):
+        self.urlconf = urlconf
+        self.overrides = {
+            name: _parse_spec(spec)
+            for name, spec in getattr(settings, 'AUTH_ROUTE_POLICIES', {}).items()
+        }
+        self.prefixes = {
+            _normalize(prefix): _parse_spec(spec)
+            for prefix, spec in getattr(settings, 'AUTH_PREFIX_POLICIES', {}).items()
+        }
+        self.max_prefix_depth = max((prefix.count('/') for prefix in self.prefixes), default=0)
+        self.static: Dict[str, MethodPolicies] = {}
+        self._compile(get_resolver(urlconf).url_patterns, '', [], static=True)
+        self._resolve_cached = lru_cache(maxsize=getattr(settings, 'AUTH_POLICY_CACHE_SIZE', 1024))(self._resolve)
+    
+    def _compile(self, patterns, prefix: str, namespaces, static: bool):
+        for pattern in patterns:
+            is_static = static and isinstance(pattern.pattern, RoutePattern) and '<' not in str(pattern.pattern)
+            route = prefix + str(pattern.pattern)
+            if isinstance(pattern, URLResolver):
+                namespace = namespaces + [pattern.namespace] if pattern.namespace else namespaces
+                self._compile(pattern.url_patterns, route, namespace, is_static)
+            elif isinstance(pattern, URLPattern) and is_static:
+                path = _normalize('/' + route)
+                # The first matching pattern wins, like in the resolver
+                self.static.setdefault(path, self._policies_for(pattern.callback, namespaces, pattern.name))
+    
+    def _policies_for(self, view, namespaces, url_name: Optional[str]) -> Optional[MethodPolicies]:
+        if url_name:
+            override = self.overrides.get(':'.join(namespaces + [url_name]))
+            if override is not None:
+                return override
+        return getattr(view, 'auth_policy', None)
+    
+    def _resolve(self, path: str) -> Optional[MethodPolicies]:
+        try:
+            match = get_resolver(self.urlconf).resolve(path)
+        except Resolver404:
+            return None
+        return self._policies_for(match.func, match.namespaces, match.url_name)
+    
+    def _prefix_policies(self, path: str) -> Optional[MethodPolicies]:
+        # Longest prefix first, checking only as many segments as the deepest prefix has
+        parts = path.split('/')[:self.max_prefix_depth + 1]
+        for end in range(len(parts), 1, -1):
+            policies = self.prefixes.get('/'.join(parts[:end]))
+            if policies is not None:
+                return policies
+        return None
+    
+    def lookup(self, path: str, method: str) -> Policy:
+        """
+        Return the policy for a request path (path_info) and method.
+        
+        A route's own policy wins over AUTH_PREFIX_POLICIES; paths covered by
+        neither require authentication.
+        """
+        normalized = _normalize(path)
+        if normalized in self.static:
+            policies = self.static[normalized]
+        else:
+            policies = self._resolve_cached(path)
+        if policies is None and self.prefixes:
+            policies = self._prefix_policies(normalized)
+        if not policies:
+            return AUTHENTICATED
+        return policies.get(method) or policies.get(ANY_METHOD) or AUTHENTICATED
+
+
+# Singleton instance
+_route_policies = None
+
+
+def get_route_policies() -> RoutePolicyTable:
+    """Get or create the compiled route policy table for the root URLconf."""
+    global _route_policies
+    if _route_policies is None:
+        _route_policies = RoutePolicyTable()
+    return _route_policies
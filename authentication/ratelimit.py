@@ -0,0 +1,223 @@
+"""
+Rate limiting for the public authentication endpoints.
+    
+    @public
+    @ratelimit('login', '20/m', key='ip')
+    @ratelimit('login', '10/m', key='user')
+    @api_view(['POST'])
+    def login_view(request): ...
+
+Counters live in a Django cache (RATELIMIT_CACHE_ALIAS) so every worker
+shares them; any backend with an atomic incr() works, including locmem in
+tests. Each check is one incr() of the counter for the current window; the
+previous window's counter is final once that window is over, so it is read
+once per window and kept in memory. The two are blended into a sliding-window
+estimate, which, unlike plain fixed windows, doesn't allow a double burst
+around window boundaries.
+
+Rejected requests get a 429 with a Retry-After header. If the cache is
+unavailable requests are let through.
+"""
+import functools
+import json
+import math
+import time
+from typing import Callable, Dict, Optional, Tuple, Union
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.http import JsonResponse
+from authentication.utils import LRUCache, bearer_token, get_jwt_validator, token_digest
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Requests rejected per limit, for /metrics
+rejected: Dict[str, int] = {}
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """Parse '10/m' (or '100/5m') into (limit, period in seconds)."""
+    limit, _, period = rate.partition('/')
+    multiplier = int(period[:-1]) if len(period) > 1 else 1
+    return int(limit), multiplier * PERIODS[period[-1]]
+
+
+def client_ip(request) -> str:
+    """
+    The client address.
+    
+    RATELIMIT_IP_HEADER (e.g. 'HTTP_X_FORWARDED_FOR') names a header set by a
+    trusted proxy; its first address is used. Otherwise REMOTE_ADDR.
+    """
+    header = getattr(settings, 'RATELIMIT_IP_HEADER', None)
+    if header:
+        forwarded = request.META.get(header, '')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _body_field(request, name: str) -> Optional[str]:
+    if request.content_type != 'application/json':
+        return None
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    value = data.get(name) if isinstance(data, dict) else None
+    return value if isinstance(value, str) and value else None
+
+
+def user_key(request) -> Optional[str]:
+    """
+    The Supabase user ID of the request.
+    
+    Taken from request.user when the middleware authenticated the request,
+    otherwise from a valid access token in the Authorization header or the
+    JSON body (as sent to login). Validation hits the verified-token cache,
+    so the view's own check afterwards costs nothing extra.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and getattr(user, 'is_authenticated', False):
+        return str(user.supabase_user_id)
+    token = bearer_token(request) or _body_field(request, 'access_token')
+    if not token:
+        return None
+    validator = get_jwt_validator()
+    payload = validator.validate_token(token)
+    return validator.extract_user_id(payload) if payload else None
+
+
+def refresh_token_key(request) -> Optional[str]:
+    """Digest of the refresh token in the JSON body, i.e. one session."""
+    token = _body_field(request, 'refresh_token')
+    return token_digest(token) if token else None
+
+
+KEYS: Dict[str, Callable] = {
+    'ip': client_ip,
+    'user': user_key,
+    'refresh_token': refresh_token_key,
+}
+
+
+class RateLimit:
+    """A sliding-window limit on requests per key value."""
+    
+    KEY_PREFIX = 'ratelimit:'
+    
+    def __init__(self, group: str, rate: str, key: Union[str, Callable]):
+        self.group = group
+        self.default_rate = rate
+        self.key_name = key if isinstance(key, str) else key.__name__
+        self.key_func = KEYS[key] if isinstance(key, str) else key
+        self.name = f"{group}:{self.key_name}"
+        self._parsed: Dict[str, Tuple[int, int]] = {}
+        # Counts of windows that have ended, by cache key
+        self._previous = LRUCache(max_size=getattr(settings, 'RATELIMIT_LOCAL_CACHE_SIZE', 10000))
+    
+    def rate(self) -> Tuple[int, int]:
+        """The (limit, period), overridable per group and key via RATELIMIT_RATES."""
+        rate = getattr(settings, 'RATELIMIT_RATES', {}).get(self.name, self.default_rate)
+        parsed = self._parsed.get(rate)
+        if parsed is None:
+            parsed = self._parsed[rate] = parse_rate(rate)
+        return parsed
+    
+    def check(self, request) -> Optional[int]:
+        """
+        Count the request against the limit.
+        
+        Returns:
+            None if allowed, otherwise the seconds to wait before retrying
+        """
+        value = self.key_func(request)
+        if not value:
+            return None
+        
+        limit, period = self.rate()
+        now = time.time()
+        window = int(now // period)
+        elapsed = now - window * period
+        prefix = f"{self.KEY_PREFIX}{self.name}:{value}:"
+        cache = caches[getattr(settings, 'RATELIMIT_CACHE_ALIAS', 'default')]
+        
+        try:
+            current_key = prefix + str(window)
+            try:
+                count = cache.incr(current_key)
+            except ValueError:
+                # First request of the window; another worker may create it first
+                if cache.add(current_key, 1, timeout=period * 2):
+                    count = 1
+                else:
+                    count = cache.incr(current_key)
+            previous_key = prefix + str(window - 1)
+            previous = self._previous.get(previous_key)
+            if previous is None:
+                previous = cache.get(previous_key, 0)
+                self._previous.set(previous_key, previous, (window + 1) * period)
+        except Exception:
+            # A cache outage must not take the endpoints down with it
+            return None
+        
+        # The previous window's share of the sliding window shrinks as this one progresses
+        estimate = previous * (1 - elapsed / period) + count
+        if estimate <= limit:
+            return None
+        
+        rejected[self.name] = rejected.get(self.name, 0) + 1
+        return self._retry_after(limit, period, elapsed, previous, count)
+    
+    def _retry_after(self, limit: int, period: int, elapsed: float, previous: int, count: int) -> int:
+        # Rejected requests are counted too, so the retry itself adds one more to this window
+        if count < limit and previous:
+            # Enough of the previous window will age out before this one ends
+            wait = period * (previous - (limit - count - 1)) / previous - elapsed
+        else:
+            # This window alone is over the limit; wait until it has aged out enough
+            wait = (period - elapsed) + period * (count - (limit - 1)) / count
+        return max(1, math.ceil(wait))
+
+
+def _too_many_requests(retry_after: int) -> JsonResponse:
+    response = JsonResponse({'error': 'Too many requests'}, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def ratelimit(group: str, rate: str, key: Union[str, Callable] = 'ip'):
+    """
+    Limit a view (sync or async) to `rate` requests per key value.
+    
+    Args:
+        group: Name shared by the limits of one endpoint, e.g. 'login'
+        rate: 'N/s', 'N/m', 'N/h' or 'N/d', optionally with a count ('N/5m')
+        key: 'ip', 'user', 'refresh_token' or a callable(request) returning a
+            string; requests without a key value are not limited
+    """
+    limiter = RateLimit(group, rate, key)
+    
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                # The cache calls are short; a thread hop would cost more than they do
+                if getattr(settings, 'RATELIMIT_ENABLED', True):
+                    retry_after = limiter.check(request)
+                    if retry_after is not None:
+                        return _too_many_requests(retry_after)
+                return await view(request, *args, **kwargs)
+            return async_wrapper
+        
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if getattr(settings, 'RATELIMIT_ENABLED', True):
+                retry_after = limiter.check(request)
+                if retry_after is not None:
+                    return _too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    
+    return decorator
@@ -0,0 +1,292 @@
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+from django.conf import settings
+from django.core.cache import caches
+from authentication.utils import token_digest
+
+
+RefreshResult = Tuple[int, Dict]
+
+
+class _InflightCall:
+    """A refresh in progress that other threads can wait on."""
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Optional[RefreshResult] = None
+        self.error: Optional[BaseException] = None
+
+
+class RefreshCoalescer:
+    """
+    Single-flight coalescing of concurrent refreshes of the same refresh token.
+    
+    Within a process, concurrent callers with the same token share one call
+    (threads via run(), coroutines on the same event loop via arun()).
+    Across workers, a short lock in the Django cache lets one worker talk to
+    Supabase while the others wait for its result, which is kept in the cache
+    for a few seconds. Callers arriving after a rotation get the same new
+    token pair instead of failing with the rotated-away token.
+    
+    Ending a session forgets its result (see forget()), so a logout is never
+    followed by a replay of the pair it just ended. The lock and results live
+    in the SUPABASE_REFRESH_COALESCE_ALIAS cache: without a shared backend
+    such as Redis, coalescing only covers the requests of one process.
+    """
+    
+    LOCK_PREFIX = 'supabase:refresh-lock:'
+    RESULT_PREFIX = 'supabase:refresh-result:'
+    # Maps the digest of a rotated-in refresh token to the result it came from
+    ROTATED_PREFIX = 'supabase:refresh-rotated:'
+    POLL_INTERVAL = 0.05
+    
+    def __init__(self):
+        self.cache_alias = getattr(settings, 'SUPABASE_REFRESH_COALESCE_ALIAS', 'default')
+        self.result_ttl = getattr(settings, 'SUPABASE_REFRESH_RESULT_TTL', 10)
+        self.lock_ttl = getattr(settings, 'SUPABASE_REFRESH_LOCK_TTL', 15)
+        self._inflight: Dict[str, _InflightCall] = {}
+        self._lock = threading.Lock()
+        self._ainflight: Dict[str, asyncio.Future] = {}
+    
+    def run(self, refresh_token: str, refresh: Callable[[], RefreshResult]) -> RefreshResult:
+        """
+        Run refresh() at most once for concurrent callers with the same token.
+        
+        Args:
+            refresh_token: The refresh token being exchanged
+            refresh: Performs the exchange and returns (status_code, response_data)
+        
+        Returns:
+            The (status_code, response_data) of the shared refresh
+        """
+        key = token_digest(refresh_token)
+        
+        cached = self._get_result(key)
+        if cached is not None:
+            return 200, cached
+        
+        with self._lock:
+            call = self._inflight.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _InflightCall()
+                self._inflight[key] = call
+        
+        if not is_leader:
+            call.event.wait(self.lock_ttl)
+            if call.error is not None:
+                raise call.error
+            if call.result is not None:
+                return call.result
+            # The leader took too long; do the work ourselves
+            return self._run_locked(key, refresh)
+        
+        try:
+            call.result = self._run_locked(key, refresh)
+            return call.result
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            call.event.set()
+    
+    def _run_locked(self, key: str, refresh: Callable[[], RefreshResult]) -> RefreshResult:
+        """Run refresh() under the cross-worker lock, or reuse another worker's result."""
+        acquired = self._acquire(key)
+        if not acquired:
+            cached = self._wait_for_result(key)
+            if cached is not None:
+                return 200, cached
+        
+        try:
+            status_code, data = refresh()
+            if status_code == 200:
+                self._set_result(key, data)
+            return status_code, data
+        finally:
+            if acquired:
+                self._release(key)
+    
+    async def arun(self, refresh_token: str, refresh: Callable[[], Awaitable[RefreshResult]]) -> RefreshResult:
+        """
+        Async version of run(); concurrent callers on the same event loop share one task.
+        
+        Args:
+            refresh_token: The refresh token being exchanged
+            refresh: Coroutine function that performs the exchange
+        
+        Returns:
+            The (status_code, response_data) of the shared refresh
+        """
+        key = token_digest(refresh_token)
+        
+        cached = await self._aget_result(key)
+        if cached is not None:
+            return 200, cached
+        
+        loop = asyncio.get_running_loop()
+        future = self._ainflight.get(key)
+        if future is not None and future.get_loop() is loop:
+            # shield() so one cancelled waiter doesn't cancel the shared refresh
+            return await asyncio.shield(future)
+        
+        future = loop.create_task(self._arun_locked(key, refresh))
+        self._ainflight[key] = future
+        
+        def forget(done):
+            if self._ainflight.get(key) is done:
+                del self._ainflight[key]
+        
+        future.add_done_callback(forget)
+        return await asyncio.shield(future)
+    
+    async def _arun_locked(self, key: str, refresh: Callable[[], Awaitable[RefreshResult]]) -> RefreshResult:
+        """Async version of _run_locked()."""
+        cache = caches[self.cache_alias]
+        try:
+            acquired = await cache.aadd(self.LOCK_PREFIX + key, 1, timeout=self.lock_ttl)
+        except Exception:
+            acquired = True
+        
+        if not acquired:
+            deadline = time.monotonic() + self.lock_ttl
+            while time.monotonic() < deadline:
+                cached = await self._aget_result(key)
+                if cached is not None:
+                    return 200, cached
+                try:
+                    if await cache.aget(self.LOCK_PREFIX + key) is None:
+                        break
+                except Exception:
+                    break
+                await asyncio.sleep(self.POLL_INTERVAL)
+            cached = await self._aget_result(key)
+            if cached is not None:
+                return 200, cached
+        
+        try:
+            status_code, data = await refresh()
+            if status_code == 200:
+                try:
+                    await cache.aset_many(self._result_entries(key, data), timeout=self.result_ttl)
+                except Exception:
+                    pass
+            return status_code, data
+        finally:
+            if acquired:
+                try:
+                    await cache.adelete(self.LOCK_PREFIX + key)
+                except Exception:
+                    pass
+    
+    async def _aget_result(self, key: str) -> Optional[Dict]:
+        try:
+            return await caches[self.cache_alias].aget(self.RESULT_PREFIX + key)
+        except Exception:
+            return None
+    
+    def _acquire(self, key: str) -> bool:
+        try:
+            return caches[self.cache_alias].add(self.LOCK_PREFIX + key, 1, timeout=self.lock_ttl)
+        except Exception:
+            # Without the shared cache we can still refresh, just uncoalesced
+            return True
+    
+    def _release(self, key: str):
+        try:
+            caches[self.cache_alias].delete(self.LOCK_PREFIX + key)
+        except Exception:
+            pass
+    
+    def _wait_for_result(self, key: str) -> Optional[Dict]:
+        """Poll for the lock holder's result until it appears or the lock is released."""
+        deadline = time.monotonic() + self.lock_ttl
+        cache = caches[self.cache_alias]
+        while time.monotonic() < deadline:
+            cached = self._get_result(key)
+            if cached is not None:
+                return cached
+            try:
+                if cache.get(self.LOCK_PREFIX + key) is None:
+                    # Released without a successful result
+                    return self._get_result(key)
+            except Exception:
+                return None
+            time.sleep(self.POLL_INTERVAL)
+        return None
+    
+    def _get_result(self, key: str) -> Optional[Dict]:
+        try:
+            return caches[self.cache_alias].get(self.RESULT_PREFIX + key)
+        except Exception:
+            return None
+    
+    def _set_result(self, key: str, data: Dict):
+        try:
+            caches[self.cache_alias].set_many(self._result_entries(key, data), timeout=self.result_ttl)
+        except Exception:
+            pass
+    
+    def _result_entries(self, key: str, data: Dict) -> Dict[str, object]:
+        """The cache entries of a result: the result itself and the link back to it from its new refresh token."""
+        entries = {self.RESULT_PREFIX + key: data}
+        new_refresh_token = data.get('refresh_token')
+        if new_refresh_token:
+            entries[self.ROTATED_PREFIX + token_digest(new_refresh_token)] = key
+        return entries
+    
+    def forget(self, digests: Iterable[str]):
+        """
+        Drop the results that could replay the sessions of these token digests.
+        
+        A digest may be the refresh token a result was stored for, or the
+        token that result rotated in, which is the one a session holds.
+        
+        Args:
+            digests: token_digest() of the refresh tokens of ended sessions
+        """
+        digests = list(digests)
+        if not digests:
+            return
+        cache = caches[self.cache_alias]
+        try:
+            origins = cache.get_many([self.ROTATED_PREFIX + digest for digest in digests])
+            cache.delete_many(
+                [self.RESULT_PREFIX + digest for digest in digests]
+                + [self.RESULT_PREFIX + origin for origin in origins.values()]
+                + list(origins)
+            )
+        except Exception:
+            pass
+    
+    async def aforget(self, digests: Iterable[str]):
+        """Async version of forget()."""
+        digests = list(digests)
+        if not digests:
+            return
+        cache = caches[self.cache_alias]
+        try:
+            origins = await cache.aget_many([self.ROTATED_PREFIX + digest for digest in digests])
+            await cache.adelete_many(
+                [self.RESULT_PREFIX + digest for digest in digests]
+                + [self.RESULT_PREFIX + origin for origin in origins.values()]
+                + list(origins)
+            )
+        except Exception:
+            pass
+
+
+# Singleton instance
+_refresh_coalescer = None
+
+
+def get_refresh_coalescer() -> RefreshCoalescer:
+    """Get or create the refresh coalescer singleton."""
+    global _refresh_coalescer
+    if _refresh_coalescer is None:
+        _refresh_coalescer = RefreshCoalescer()
+    return _refresh_coalescer
@@ -0,0 +1,64 @@
+"""
+orjson-backed JSON renderer.
+
+FastJSONRenderer produces the same bytes as DRF's JSONRenderer with this
+project's settings (compact separators, UTF-8 output, U+2028/U+2029
+escaped). Values orjson would format differently from the standard library
+(datetimes, dataclasses) are handed to DRF's own JSONEncoder, and anything
+orjson can't encode (non-string keys, integers over 64 bits) is rendered by
+JSONRenderer itself. So is any data containing a float: orjson writes NaN and
+infinity as null where JSONRenderer raises, and some exponents differently
+(1e-5 for 1e-05). The auth responses hold no floats and take the fast path.
+
+If orjson isn't installed, or the client asks for indented output, it falls
+back to JSONRenderer entirely.
+"""
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Drop-in replacement for JSONRenderer that encodes with orjson."""
+    
+    # Let DRF's encoder format these so the output matches JSONRenderer
+    ORJSON_OPTIONS = (
+        orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if orjson is not None else 0
+    )
+    
+    def __init__(self):
+        self._default = self.encoder_class().default
+    
+    def _has_float(self, data) -> bool:
+        if isinstance(data, float):
+            return True
+        if isinstance(data, dict):
+            return any(self._has_float(value) for value in data.values())
+        if isinstance(data, (list, tuple)):
+            return any(self._has_float(value) for value in data)
+        return False
+    
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        """
+        Render `data` into JSON, returning a bytestring.
+        """
+        if orjson is None or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self._has_float(data):
+            return super().render(data, accepted_media_type, renderer_context)
+        
+        try:
+            ret = orjson.dumps(data, default=self._default, option=self.ORJSON_OPTIONS)
+        except (TypeError, orjson.JSONEncodeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        
+        # Same escaping as JSONRenderer; skip the scans when there's nothing to escape
+        if b'\xe2\x80' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
@@ -0,0 +1,324 @@
+"""
+Access-token revocation.
+
+Logout records the digest of the access token in the revoked_tokens table.
+Every worker keeps a Bloom filter of the unexpired digests, refreshed from the
+table by a background thread, so checking a token costs a few bit lookups and
+no query. Only when the filter reports a possible hit is the table consulted,
+and that answer is cached until the token expires.
+
+Another worker sees a revocation within SUPABASE_REVOCATION_SYNC_INTERVAL
+seconds; the worker that handled the logout sees it immediately.
+
+Checks fail closed: until the initial load succeeds every token is looked up
+in the table, and a token whose lookup fails is treated as revoked.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone as dt_timezone
+from typing import Dict, Iterable, Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.utils import timezone
+from authentication.models import RevokedToken
+from authentication.utils import LRUCache, get_jwt_validator, token_digest
+
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over SHA-256 hex digests.
+    
+    The digests are already uniformly distributed, so the k bit positions are
+    derived from two 64-bit slices of the digest (double hashing) instead of
+    hashing again.
+    """
+    
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = max(1, capacity)
+        self.size = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _positions(self, digest: str) -> Iterable[int]:
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:32], 16) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+    
+    def add(self, digest: str):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+    
+    def __contains__(self, digest: str) -> bool:
+        bits = self.bits
+        for position in self._positions(digest):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+
+class RevocationList:
+    """
+    Per-process view of the revoked_tokens table behind a Bloom filter.
+    
+    All database work runs on one background thread. is_revoked() only blocks
+    on the initial load and on the rare possible hit that isn't cached yet;
+    ais_revoked() awaits those instead, for the async middleware.
+    """
+    
+    # Covers transactions that commit after a newer revocation did, and clock skew between workers
+    SYNC_OVERLAP = timedelta(seconds=60)
+    
+    def __init__(self):
+        self.sync_interval = getattr(settings, 'SUPABASE_REVOCATION_SYNC_INTERVAL', 5)
+        self.prune_interval = getattr(settings, 'SUPABASE_REVOCATION_PRUNE_INTERVAL', 300)
+        self.capacity = getattr(settings, 'SUPABASE_REVOCATION_FILTER_CAPACITY', 100000)
+        self.error_rate = getattr(settings, 'SUPABASE_REVOCATION_FILTER_ERROR_RATE', 0.001)
+        self.filter = BloomFilter(self.capacity, self.error_rate)
+        # digest -> True (revoked) / False (filter false positive)
+        self.confirmed = LRUCache(max_size=getattr(settings, 'SUPABASE_REVOCATION_CACHE_SIZE', 10000))
+        # Newest created_at synced so far
+        self.last_seen: Optional[datetime] = None
+        self.possible_hits = 0
+        self.false_positives = 0
+        self.sync_errors = 0
+        self.lookup_errors = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='revocation')
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+    
+    def start(self):
+        """Load the filter and start the background sync, once per process."""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            # Block the first request on the initial load; if it fails, tokens are looked up
+            # one by one until the sync thread's retry succeeds
+            self._executor.submit(self._rebuild).result()
+            threading.Thread(target=self._sync_loop, name='revocation-sync', daemon=True).start()
+            self._started = True
+    
+    def _sync_loop(self):
+        next_prune = time.monotonic() + self.prune_interval
+        while not self._stopped.wait(self.sync_interval):
+            if time.monotonic() >= next_prune:
+                next_prune = time.monotonic() + self.prune_interval
+                task = self._prune
+            else:
+                task = self._sync
+            try:
+                self._executor.submit(task).result()
+            except Exception:
+                self.sync_errors += 1
+                logger.exception('Revocation sync failed')
+    
+    def stop(self):
+        """Stop the background sync, e.g. before the database goes away."""
+        self._stopped.set()
+        self._executor.submit(connections.close_all).result()
+        self._executor.shutdown(wait=True)
+    
+    def _rebuild(self):
+        """Load every unexpired digest into a fresh filter, dropping expired ones."""
+        close_old_connections()
+        started = timezone.now()
+        try:
+            rows = list(
+                RevokedToken.objects.filter(expires_at__gt=started)
+                .values_list('created_at', 'token_digest')
+            )
+        except Exception:
+            self.sync_errors += 1
+            logger.exception('Failed to load revoked tokens')
+            return
+        bloom = BloomFilter(max(self.capacity, len(rows) * 2), self.error_rate)
+        for _, digest in rows:
+            bloom.add(digest)
+        self.filter = bloom
+        self.last_seen = max((created_at for created_at, _ in rows), default=started)
+    
+    def _sync(self):
+        """
+        Add digests revoked since the last sync, by any worker.
+        
+        Rows don't commit in created_at order (nor in id order), so every sync
+        re-reads the last SYNC_OVERLAP before the newest row already seen;
+        digests already in the filter are skipped.
+        """
+        if self.last_seen is None:
+            # The initial load failed
+            self._rebuild()
+            return
+        close_old_connections()
+        try:
+            rows = list(
+                RevokedToken.objects.filter(created_at__gt=self.last_seen - self.SYNC_OVERLAP)
+                .values_list('created_at', 'token_digest')
+            )
+        except Exception:
+            self.sync_errors += 1
+            logger.exception('Failed to sync revoked tokens')
+            return
+        new_digests = [digest for _, digest in rows if digest not in self.filter]
+        if self.filter.count + len(new_digests) > self.filter.capacity:
+            # Full filters lose accuracy; start over with a bigger one
+            self._rebuild()
+            return
+        for digest in new_digests:
+            self.filter.add(digest)
+        if rows:
+            self.last_seen = max(self.last_seen, max(created_at for created_at, _ in rows))
+    
+    def _prune(self):
+        """Delete expired rows and rebuild the filter without them."""
+        close_old_connections()
+        try:
+            deleted, _ = RevokedToken.objects.filter(expires_at__lte=timezone.now()).delete()
+        except Exception:
+            self.sync_errors += 1
+            logger.exception('Failed to prune revoked tokens')
+            return
+        if deleted:
+            logger.info('Pruned %d expired revoked tokens', deleted)
+        self._rebuild()
+    
+    def _lookup(self, digest: str) -> Optional[datetime]:
+        close_old_connections()
+        return (
+            RevokedToken.objects.filter(token_digest=digest)
+            .values_list('expires_at', flat=True)
+            .first()
+        )
+    
+    def _check_filter(self, digest: str) -> Optional[bool]:
+        """Answer from the filter and the cache, or None if the table has to be asked."""
+        if self.last_seen is None:
+            # The initial load failed, so the filter can't rule anything out
+            return self.confirmed.get(digest)
+        if digest not in self.filter:
+            return False
+        known = self.confirmed.get(digest)
+        if known is None:
+            self.possible_hits += 1
+        return known
+    
+    def _lookup_failed(self) -> bool:
+        self.lookup_errors += 1
+        logger.exception('Revoked token lookup failed; treating the token as revoked')
+        return True
+    
+    def is_revoked(self, digest: str) -> bool:
+        """Check a token digest; only possible filter hits cost a query."""
+        self.start()
+        known = self._check_filter(digest)
+        if known is not None:
+            return known
+        try:
+            expires_at = self._executor.submit(self._lookup, digest).result()
+        except Exception:
+            return self._lookup_failed()
+        return self._confirm(digest, expires_at)
+    
+    async def ais_revoked(self, digest: str) -> bool:
+        """Async version of is_revoked(); waits for the database thread without blocking the event loop."""
+        if not self._started:
+            await sync_to_async(self.start, thread_sensitive=False)()
+        known = self._check_filter(digest)
+        if known is not None:
+            return known
+        try:
+            expires_at = await asyncio.wrap_future(self._executor.submit(self._lookup, digest))
+        except Exception:
+            return self._lookup_failed()
+        return self._confirm(digest, expires_at)
+    
+    def _confirm(self, digest: str, expires_at: Optional[datetime]) -> bool:
+        """Cache the table's answer for a possible hit."""
+        if expires_at is None:
+            if self.last_seen is not None:
+                self.false_positives += 1
+            # Cache the miss until the next sync could have changed the answer
+            self.confirmed.set(digest, False, time.time() + self.sync_interval)
+            return False
+        self.confirmed.set(digest, True, expires_at.timestamp())
+        return True
+    
+    def _expiry(self, payload: Dict) -> datetime:
+        exp = payload.get('exp')
+        if isinstance(exp, (int, float)):
+            return datetime.fromtimestamp(exp, tz=dt_timezone.utc)
+        # Tokens without exp never expire on their own; keep them for a day
+        return timezone.now() + timedelta(days=1)
+    
+    def _remember(self, digest: str, expires_at: datetime):
+        self.filter.add(digest)
+        self.confirmed.set(digest, True, expires_at.timestamp())
+        get_jwt_validator().evict(digest)
+    
+    def revoke(self, token: str) -> bool:
+        """
+        Revoke a valid access token until it expires.
+        
+        Returns:
+            True if the token was valid and is now revoked, False otherwise
+        """
+        payload = get_jwt_validator().validate_token(token)
+        if payload is None:
+            return False
+        digest = token_digest(token)
+        expires_at = self._expiry(payload)
+        RevokedToken.objects.bulk_create(
+            [RevokedToken(token_digest=digest, expires_at=expires_at)],
+            ignore_conflicts=True,
+        )
+        self._remember(digest, expires_at)
+        return True
+    
+    async def arevoke(self, token: str) -> bool:
+        """Async version of revoke()."""
+        payload = await get_jwt_validator().avalidate_token(token)
+        if payload is None:
+            return False
+        digest = token_digest(token)
+        expires_at = self._expiry(payload)
+        await RevokedToken.objects.abulk_create(
+            [RevokedToken(token_digest=digest, expires_at=expires_at)],
+            ignore_conflicts=True,
+        )
+        self._remember(digest, expires_at)
+        return True
+    
+    def stats(self) -> Dict[str, int]:
+        """Return filter and lookup counters."""
+        return {
+            'filter_entries': self.filter.count,
+            'filter_capacity': self.filter.capacity,
+            'possible_hits': self.possible_hits,
+            'false_positives': self.false_positives,
+            'sync_errors': self.sync_errors,
+            'lookup_errors': self.lookup_errors,
+        }
+
+
+# Singleton instance
+_revocation_list = None
+
+
+def get_revocation_list() -> RevocationList:
+    """Get or create the revocation list singleton."""
+    global _revocation_list
+    if _revocation_list is None:
+        _revocation_list = RevocationList()
+    return _revocation_list
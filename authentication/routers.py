@@ -0,0 +1,109 @@
+"""
+Primary/replica database routing.
+
+Everything reads from and writes to the primary ('default') unless the code
+opts in with replica_reads(), which the middleware's user lookups and the
+introspection endpoint do. Replicas are the 'replica', 'replica_2', ...
+entries of DATABASES (from DATABASE_REPLICA_URL); without any the router
+always answers 'default'.
+
+A replica can lag behind the primary, so a user who just logged in or
+refreshed is pinned to the primary for DATABASE_REPLICA_STICKY_SECONDS and
+reads their own write. Pins are kept in the default cache: with Redis every
+worker sees them, with the local-memory cache only the worker that wrote.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List
+from django.conf import settings
+from django.core.cache import cache
+
+
+PIN_KEY_PREFIX = 'replica:pinned:'
+
+_replica_reads: ContextVar[bool] = ContextVar('replica_reads', default=False)
+
+
+def replica_aliases() -> List[str]:
+    """The configured replica database aliases."""
+    return [alias for alias in settings.DATABASES if alias == 'replica' or alias.startswith('replica_')]
+
+
+@contextmanager
+def replica_reads():
+    """Send the ORM reads in this block (and its sync_to_async calls) to a replica."""
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def _pin_key(user_id) -> str:
+    return PIN_KEY_PREFIX + str(user_id).lower()
+
+
+def pin_to_primary(user_id):
+    """Keep a user's reads on the primary for a while after they wrote."""
+    if not replica_aliases():
+        return
+    try:
+        cache.set(_pin_key(user_id), True, timeout=getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 10))
+    except Exception:
+        pass
+
+
+async def apin_to_primary(user_id):
+    """Async version of pin_to_primary()."""
+    if not replica_aliases():
+        return
+    try:
+        await cache.aset(_pin_key(user_id), True, timeout=getattr(settings, 'DATABASE_REPLICA_STICKY_SECONDS', 10))
+    except Exception:
+        pass
+
+
+def can_read_replica(user_id) -> bool:
+    """Whether a user's rows may be read from a replica: one exists and they aren't pinned."""
+    if not replica_aliases():
+        return False
+    try:
+        return not cache.get(_pin_key(user_id))
+    except Exception:
+        # Without the cache we can't tell; the primary is always safe
+        return False
+
+
+async def acan_read_replica(user_id) -> bool:
+    """Async version of can_read_replica()."""
+    if not replica_aliases():
+        return False
+    try:
+        return not await cache.aget(_pin_key(user_id))
+    except Exception:
+        return False
+
+
+class PrimaryReplicaRouter:
+    """Database router for DATABASE_ROUTERS; see the module docstring."""
+    
+    def __init__(self):
+        self.replicas = replica_aliases()
+    
+    def db_for_read(self, model, **hints):
+        if self.replicas and _replica_reads.get():
+            return random.choice(self.replicas)
+        # Explicit, so objects loaded from a replica don't pull their relations from it too
+        return 'default'
+    
+    def db_for_write(self, model, **hints):
+        return 'default'
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema through replication
+        return False if db in self.replicas else None
@@ -1,3 +1,4 @@
+from typing import Dict, Optional
 from rest_framework import serializers
 from authentication.models import SupabaseUser
 
@@ -6,6 +7,8 @@ class LoginSerializer(serializers.Serializer):
     """Serializer for login request."""
     access_token = serializers.CharField(required=True)
     refresh_token = serializers.CharField(required=True)
+    # Shown in the user's session list; defaults to the User-Agent header
+    device = serializers.CharField(required=False, allow_blank=True, max_length=255)
 
 
 class LoginResponseSerializer(serializers.ModelSerializer):
@@ -17,6 +20,22 @@ class LoginResponseSerializer(serializers.ModelSerializer):
         read_only_fields = ['supabase_user_id', 'email', 'created_at', 'updated_at']
 
 
+_datetime_field = serializers.DateTimeField()
+
+
+def login_user_data(user: SupabaseUser) -> Dict:
+    """
+    Same output as LoginResponseSerializer(user).data, without building a
+    serializer and its fields on every login.
+    """
+    return {
+        'supabase_user_id': str(user.supabase_user_id),
+        'email': user.email if user.email is None else str(user.email),
+        'created_at': _datetime_field.to_representation(user.created_at),
+        'updated_at': _datetime_field.to_representation(user.updated_at),
+    }
+
+
 class LogoutSerializer(serializers.Serializer):
     """Serializer for logout request."""
     pass  # No fields needed, token is in header
@@ -32,3 +51,19 @@ class RefreshTokenResponseSerializer(serializers.Serializer):
     access_token = serializers.CharField()
     refresh_token = serializers.CharField()
 
+
+def refresh_token_data(access_token: Optional[str], refresh_token: Optional[str]) -> Dict:
+    """Same output as RefreshTokenResponseSerializer(...).data, without the serializer."""
+    return {
+        'access_token': access_token if access_token is None else str(access_token),
+        'refresh_token': refresh_token if refresh_token is None else str(refresh_token),
+    }
+
+
+class IntrospectSerializer(serializers.Serializer):
+    """Serializer for batch token introspection request."""
+    tokens = serializers.ListField(
+        child=serializers.CharField(),
+        allow_empty=False,
+        max_length=500,
+    )
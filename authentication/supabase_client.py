@@ -0,0 +1,238 @@
+import asyncio
+import threading
+import time
+from typing import TYPE_CHECKING, Dict, Optional
+from django.conf import settings
+
+if TYPE_CHECKING:
+    import requests
+
+
+class SupabaseUnavailable(Exception):
+    """Raised when Supabase can't be reached, or without trying while the circuit breaker is open."""
+    pass
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker for upstream calls.
+    
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    fail fast for `reset_timeout` seconds. Then a single trial call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+    
+    def allow_request(self) -> bool:
+        """Return True if a call may be attempted now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let exactly one trial request through
+                self.state = self.HALF_OPEN
+                return True
+            return False
+    
+    def record_success(self):
+        """Close the circuit after a successful call."""
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+    
+    def record_failure(self):
+        """Count a failed call, opening the circuit once the threshold is reached."""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class SupabaseClient:
+    """
+    Shared HTTP client for calls to the Supabase Auth API.
+    
+    A single requests.Session per process keeps connections to Supabase alive
+    and pooled, so token refreshes don't pay for a new TCP and TLS handshake.
+    Connection failures are retried a bounded number of times; responses are
+    never retried because a refresh token is consumed by the first attempt.
+    Server errors and network failures feed a circuit breaker that makes
+    calls fail fast with SupabaseUnavailable while Supabase is degraded.
+    
+    requests (with urllib3 and certifi) is imported when the first client is
+    built rather than at startup, so workers that never refresh don't load it.
+    """
+    
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        self.base_url = (base_url if base_url is not None else getattr(settings, 'SUPABASE_URL', '')).rstrip('/')
+        self.api_key = api_key if api_key is not None else getattr(settings, 'SUPABASE_ANON_KEY', '')
+        self.timeout = (
+            getattr(settings, 'SUPABASE_HTTP_CONNECT_TIMEOUT', 3.05),
+            getattr(settings, 'SUPABASE_HTTP_READ_TIMEOUT', 5.0),
+        )
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=getattr(settings, 'SUPABASE_CIRCUIT_FAILURE_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'SUPABASE_CIRCUIT_RESET_TIMEOUT', 30.0),
+        )
+        self.session = self._build_session()
+    
+    def _build_session(self) -> 'requests.Session':
+        """Create a session with a connection pool and connect-only retries."""
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        
+        retries = Retry(
+            total=getattr(settings, 'SUPABASE_HTTP_RETRIES', 2),
+            connect=getattr(settings, 'SUPABASE_HTTP_RETRIES', 2),
+            read=0,
+            status=0,
+            backoff_factor=0.1,
+            allowed_methods=None,
+            raise_on_status=False,
+        )
+        pool_size = getattr(settings, 'SUPABASE_HTTP_POOL_SIZE', 10)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retries)
+        
+        session = requests.Session()
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update({
+            'Content-Type': 'application/json',
+            'apikey': self.api_key,
+        })
+        return session
+    
+    def post(self, path: str, json: Dict) -> 'requests.Response':
+        """
+        POST JSON to a Supabase API path.
+        
+        Raises:
+            SupabaseUnavailable: If the circuit breaker is open or the request
+                could not be completed (chained to the requests exception)
+        """
+        import requests
+        
+        if not self.circuit_breaker.allow_request():
+            raise SupabaseUnavailable('Supabase circuit breaker is open')
+        
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=json, timeout=self.timeout)
+        except requests.RequestException as exc:
+            self.circuit_breaker.record_failure()
+            raise SupabaseUnavailable(str(exc)) from exc
+        
+        if response.status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        return response
+    
+    def refresh_session(self, refresh_token: str) -> 'requests.Response':
+        """Exchange a refresh token for a new session."""
+        return self.post('/auth/v1/token?grant_type=refresh_token', {'refresh_token': refresh_token})
+
+
+class AsyncSupabaseClient:
+    """
+    Async counterpart of SupabaseClient for the ASGI request path, built on httpx.
+    
+    Uses the same pooling, timeout, retry and circuit breaker settings, so an
+    upstream refresh no longer ties up a thread while it waits on Supabase.
+    httpx is imported lazily so sync-only deployments don't load it.
+    """
+    
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
+        import httpx
+        
+        self.base_url = (base_url if base_url is not None else getattr(settings, 'SUPABASE_URL', '')).rstrip('/')
+        self.api_key = api_key if api_key is not None else getattr(settings, 'SUPABASE_ANON_KEY', '')
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=getattr(settings, 'SUPABASE_CIRCUIT_FAILURE_THRESHOLD', 5),
+            reset_timeout=getattr(settings, 'SUPABASE_CIRCUIT_RESET_TIMEOUT', 30.0),
+        )
+        pool_size = getattr(settings, 'SUPABASE_HTTP_POOL_SIZE', 10)
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers={
+                'Content-Type': 'application/json',
+                'apikey': self.api_key,
+            },
+            timeout=httpx.Timeout(
+                getattr(settings, 'SUPABASE_HTTP_READ_TIMEOUT', 5.0),
+                connect=getattr(settings, 'SUPABASE_HTTP_CONNECT_TIMEOUT', 3.05),
+            ),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            # httpx transport retries only cover failed connection attempts
+            transport=httpx.AsyncHTTPTransport(retries=getattr(settings, 'SUPABASE_HTTP_RETRIES', 2)),
+        )
+    
+    async def post(self, path: str, json: Dict):
+        """
+        POST JSON to a Supabase API path.
+        
+        Raises:
+            SupabaseUnavailable: If the circuit breaker is open
+            httpx.HTTPError: If the request could not be completed
+        """
+        import httpx
+        
+        if not self.circuit_breaker.allow_request():
+            raise SupabaseUnavailable('Supabase circuit breaker is open')
+        
+        try:
+            response = await self.client.post(path, json=json)
+        except httpx.HTTPError:
+            self.circuit_breaker.record_failure()
+            raise
+        
+        if response.status_code >= 500:
+            self.circuit_breaker.record_failure()
+        else:
+            self.circuit_breaker.record_success()
+        return response
+    
+    async def refresh_session(self, refresh_token: str):
+        """Exchange a refresh token for a new session."""
+        return await self.post('/auth/v1/token?grant_type=refresh_token', {'refresh_token': refresh_token})
+
+
+# Singleton instance
+_supabase_client = None
+
+
+def get_supabase_client() -> SupabaseClient:
+    """Get or create the Supabase client singleton."""
+    global _supabase_client
+    if _supabase_client is None:
+        _supabase_client = SupabaseClient()
+    return _supabase_client
+
+
+# Async clients are bound to the event loop their connections were opened on
+_async_supabase_clients = {}
+
+
+def get_async_supabase_client() -> AsyncSupabaseClient:
+    """Get or create the async Supabase client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_supabase_clients.get(loop)
+    if client is None:
+        # Drop clients whose loops are gone (e.g. one-off loops under WSGI)
+        for stale_loop in [l for l in _async_supabase_clients if l.is_closed()]:
+            del _async_supabase_clients[stale_loop]
+        client = AsyncSupabaseClient()
+        _async_supabase_clients[loop] = client
+    return client
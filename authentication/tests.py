@@ -1,3 +1,1277 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import io
+import json
+import os
+import socket
+import tempfile
+import time
+import types
+import uuid
+from unittest import skipUnless
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+import jwt
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connections
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from urllib3.util import connection as urllib3_connection
+from authentication import async_views, revocation, views
+from authentication.audit import AuditLog
+from authentication.benchmarks.fake_supabase import FakeSupabaseServer
+from authentication.cache import SupabaseUserCache, get_user_cache
+from authentication.management.commands.profile_startup import parse_importtime
+from authentication.management.commands.sync_supabase_users import Command
+from authentication.metrics import metrics_view
+from authentication.middleware import SupabaseTokenValidationMiddleware
+from authentication.models import AuthAuditEvent, RefreshSession, RefreshTokenInUse, RevokedToken, SupabaseUser
+from authentication.policy import AUTHENTICATED, RoutePolicyTable, public, role_required
+from authentication.ratelimit import RateLimit
+from authentication.refresh import RefreshCoalescer, get_refresh_coalescer
+from authentication.renderers import FastJSONRenderer
+from authentication.revocation import RevocationList
+from authentication.routers import PrimaryReplicaRouter, can_read_replica, pin_to_primary, replica_aliases, replica_reads
+from authentication.serializers import (
+    LoginResponseSerializer, RefreshTokenResponseSerializer, login_user_data, refresh_token_data,
+)
+from authentication.supabase_client import CircuitBreaker, SupabaseClient, SupabaseUnavailable
+from authentication.users import ClaimsUser
+from authentication.utils import LRUCache, SupabaseJWTValidator, token_digest
+from authentication.views import introspect_view
+from games import ratings
+from games.models import Game, Season, Team
 
-# Create your tests here.
+
+def unused_port() -> int:
+    """A local port nothing listens on, so connections to it are refused."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@override_settings(SUPABASE_HTTP_RETRIES=2, SUPABASE_CIRCUIT_FAILURE_THRESHOLD=3, SUPABASE_CIRCUIT_RESET_TIMEOUT=0.2)
+class SupabaseClientRetryTests(SimpleTestCase):
+    """Only failed connection attempts are retried; a sent refresh token is consumed."""
+    
+    def test_connect_failures_are_retried(self):
+        client = SupabaseClient(base_url=f"http://127.0.0.1:{unused_port()}", api_key='')
+        with mock.patch.object(urllib3_connection, 'create_connection', wraps=urllib3_connection.create_connection) as connect:
+            with self.assertRaises(SupabaseUnavailable):
+                client.refresh_session('token')
+        self.assertEqual(connect.call_count, 3)
+    
+    def test_server_errors_are_not_retried(self):
+        with FakeSupabaseServer(status_code=503) as fake:
+            response = SupabaseClient(base_url=fake.url, api_key='').refresh_session('token')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(fake.calls, 1)
+    
+    @override_settings(SUPABASE_HTTP_READ_TIMEOUT=0.1)
+    def test_read_timeouts_are_not_retried(self):
+        with FakeSupabaseServer(latency=0.3) as fake:
+            with self.assertRaises(SupabaseUnavailable):
+                SupabaseClient(base_url=fake.url, api_key='').refresh_session('token')
+            # The server counts a call once its latency has passed
+            time.sleep(0.4)
+            self.assertEqual(fake.calls, 1)
+
+
+@override_settings(SUPABASE_HTTP_RETRIES=0, SUPABASE_CIRCUIT_FAILURE_THRESHOLD=3, SUPABASE_CIRCUIT_RESET_TIMEOUT=0.2)
+class CircuitBreakerTests(SimpleTestCase):
+    
+    def test_opens_after_consecutive_failures(self):
+        with FakeSupabaseServer(status_code=503) as fake:
+            client = SupabaseClient(base_url=fake.url, api_key='')
+            for _ in range(3):
+                self.assertEqual(client.refresh_session('token').status_code, 503)
+            self.assertEqual(client.circuit_breaker.state, CircuitBreaker.OPEN)
+            
+            # Fails fast without reaching Supabase
+            with self.assertRaises(SupabaseUnavailable):
+                client.refresh_session('token')
+            self.assertEqual(fake.calls, 3)
+    
+    def test_success_resets_the_failure_count(self):
+        with FakeSupabaseServer(status_code=503) as fake:
+            client = SupabaseClient(base_url=fake.url, api_key='')
+            client.refresh_session('token')
+            client.refresh_session('token')
+            fake.status_code = None
+            client.refresh_session('token')
+            fake.status_code = 503
+            client.refresh_session('token')
+            client.refresh_session('token')
+            self.assertEqual(client.circuit_breaker.state, CircuitBreaker.CLOSED)
+    
+    def test_half_open_trial_closes_the_circuit(self):
+        with FakeSupabaseServer(status_code=503) as fake:
+            client = SupabaseClient(base_url=fake.url, api_key='')
+            for _ in range(3):
+                client.refresh_session('token')
+            
+            fake.status_code = None
+            time.sleep(0.25)
+            self.assertEqual(client.refresh_session('token').status_code, 200)
+            self.assertEqual(client.circuit_breaker.state, CircuitBreaker.CLOSED)
+            self.assertEqual(fake.calls, 4)
+    
+    def test_failed_half_open_trial_reopens_the_circuit(self):
+        with FakeSupabaseServer(status_code=503) as fake:
+            client = SupabaseClient(base_url=fake.url, api_key='')
+            for _ in range(3):
+                client.refresh_session('token')
+            
+            time.sleep(0.25)
+            self.assertEqual(client.refresh_session('token').status_code, 503)
+            self.assertEqual(client.circuit_breaker.state, CircuitBreaker.OPEN)
+            with self.assertRaises(SupabaseUnavailable):
+                client.refresh_session('token')
+            self.assertEqual(fake.calls, 4)
+    
+    def test_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+        
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow_request())
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # Other callers keep failing fast until the trial's outcome is known
+        self.assertFalse(breaker.allow_request())
+
+
+@override_settings(INTERNAL_SERVICE_TOKEN='internal-secret')
+class IntrospectAuthTests(SimpleTestCase):
+    
+    def introspect(self, **headers):
+        request = RequestFactory().post('/api/auth/introspect/', {'tokens': []}, content_type='application/json', **headers)
+        return introspect_view(request)
+    
+    def test_missing_or_wrong_token_is_forbidden(self):
+        self.assertEqual(self.introspect().status_code, 403)
+        self.assertEqual(self.introspect(HTTP_X_INTERNAL_TOKEN='wrong').status_code, 403)
+    
+    def test_non_ascii_token_is_forbidden(self):
+        self.assertEqual(self.introspect(HTTP_X_INTERNAL_TOKEN='intérnal-sécret').status_code, 403)
+    
+    @override_settings(INTERNAL_SERVICE_TOKEN='')
+    def test_disabled_without_a_configured_token(self):
+        self.assertEqual(self.introspect(HTTP_X_INTERNAL_TOKEN='').status_code, 403)
+
+
+@override_settings(INTERNAL_SERVICE_TOKEN='internal-secret', METRICS_PUBLIC=False)
+class MetricsAuthTests(SimpleTestCase):
+    
+    def test_requires_the_internal_token(self):
+        self.assertEqual(metrics_view(RequestFactory().get('/metrics')).status_code, 403)
+        response = metrics_view(RequestFactory().get('/metrics', HTTP_X_INTERNAL_TOKEN='internal-secret'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE', response.content)
+    
+    @override_settings(METRICS_PUBLIC=True)
+    def test_public_when_opted_in(self):
+        self.assertEqual(metrics_view(RequestFactory().get('/metrics')).status_code, 200)
+
+
+class RevocationSyncTests(TestCase):
+    
+    def setUp(self):
+        # Normally run on the revocation thread; here it would close the test's transaction
+        patcher = mock.patch('authentication.revocation.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.revocations = RevocationList()
+        self.addCleanup(self.revocations._executor.shutdown)
+        self.revocations._rebuild()
+    
+    def revoke(self, token, **fields):
+        return RevokedToken.objects.create(
+            token_digest=token_digest(token), expires_at=timezone.now() + timedelta(hours=1), **fields
+        )
+    
+    def test_sync_adds_new_revocations(self):
+        self.revoke('token')
+        self.revocations._sync()
+        self.assertIn(token_digest('token'), self.revocations.filter)
+    
+    def test_sync_picks_up_rows_committed_out_of_order(self):
+        later = self.revoke('later', id=100)
+        self.revocations._sync()
+        
+        # A logout that began first commits only now, with a lower id and an older created_at
+        earlier = self.revoke('earlier', id=50)
+        RevokedToken.objects.filter(pk=earlier.pk).update(created_at=later.created_at - timedelta(seconds=2))
+        self.revocations._sync()
+        self.assertIn(token_digest('earlier'), self.revocations.filter)
+    
+    def test_rereading_the_overlap_does_not_count_twice(self):
+        self.revoke('token')
+        self.revocations._sync()
+        self.revocations._sync()
+        self.assertEqual(self.revocations.filter.count, 1)
+
+
+class RevocationFailClosedTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.revocations = RevocationList()
+        self.addCleanup(self.revocations._executor.shutdown)
+        # No background sync thread; each test loads the filter itself
+        self.revocations._started = True
+        self.digest = token_digest('token')
+    
+    def load(self, error=None):
+        with mock.patch('authentication.revocation.close_old_connections'), \
+                mock.patch.object(RevokedToken.objects, 'filter', side_effect=error) as query:
+            query.return_value.values_list.return_value = []
+            self.revocations._rebuild()
+    
+    def test_tokens_are_looked_up_while_the_initial_load_has_failed(self):
+        self.load(error=DatabaseError('down'))
+        expires_at = timezone.now() + timedelta(hours=1)
+        # The empty filter would have ruled the revoked token out without a query
+        with mock.patch.object(self.revocations, '_lookup', side_effect=[expires_at, None]) as lookup:
+            self.assertTrue(self.revocations.is_revoked(self.digest))
+            self.assertFalse(self.revocations.is_revoked(token_digest('other')))
+        self.assertEqual(lookup.call_count, 2)
+    
+    def test_sync_retries_the_initial_load(self):
+        self.load(error=DatabaseError('down'))
+        with mock.patch.object(self.revocations, '_rebuild') as rebuild:
+            self.revocations._sync()
+        rebuild.assert_called_once()
+    
+    def test_failed_lookup_of_a_possible_hit_counts_as_revoked(self):
+        self.load()
+        self.revocations.filter.add(self.digest)
+        with mock.patch.object(self.revocations, '_lookup', side_effect=DatabaseError('down')):
+            self.assertTrue(self.revocations.is_revoked(self.digest))
+            self.assertTrue(async_to_sync(self.revocations.ais_revoked)(self.digest))
+        self.assertEqual(self.revocations.stats()['lookup_errors'], 2)
+        # Not ruled out by the filter, so no query and no error
+        self.assertFalse(self.revocations.is_revoked(token_digest('other')))
+
+
+def stop_revocation_list():
+    """Stop the sync thread a request started, so it doesn't hold the test database open."""
+    if revocation._revocation_list is not None:
+        revocation._revocation_list.stop()
+        revocation._revocation_list = None
+
+
+def access_token(user_id, email='user@example.com') -> str:
+    return jwt.encode(
+        {'sub': str(user_id), 'email': email, 'exp': int(time.time()) + 3600},
+        settings.SUPABASE_JWT_SECRET,
+        algorithm='HS256',
+    )
+
+
+@override_settings(AUTH_AUDIT_ENABLED=False, RATELIMIT_ENABLED=False)
+class RefreshSessionOwnershipTests(TestCase):
+    
+    def setUp(self):
+        self.owner = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='owner@example.com')
+        self.other = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='other@example.com')
+    
+    def test_logging_in_again_renews_the_session(self):
+        first = RefreshSession.objects.start(self.owner, 'refresh', 'phone')
+        second = RefreshSession.objects.start(self.owner, 'refresh', 'tablet')
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(RefreshSession.objects.get().device, 'tablet')
+    
+    def test_another_users_session_is_not_taken_over(self):
+        RefreshSession.objects.start(self.owner, 'refresh', 'phone')
+        with self.assertRaises(RefreshTokenInUse):
+            RefreshSession.objects.start(self.other, 'refresh', 'laptop')
+        session = RefreshSession.objects.get()
+        self.assertEqual((session.user_id, session.device), (self.owner.pk, 'phone'))
+    
+    def test_login_rejects_another_users_refresh_token(self):
+        self.addCleanup(stop_revocation_list)
+        RefreshSession.objects.start(self.owner, 'refresh', 'phone')
+        response = Client().post(
+            '/api/auth/login/',
+            {'access_token': access_token(self.other.supabase_user_id, self.other.email), 'refresh_token': 'refresh'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(RefreshSession.objects.get().user_id, self.owner.pk)
+
+
+@override_settings(AUTH_AUDIT_ENABLED=False, RATELIMIT_ENABLED=False)
+class LogoutTests(TestCase):
+    
+    def setUp(self):
+        self.addCleanup(stop_revocation_list)
+        self.user = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='user@example.com')
+        self.other = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='other@example.com')
+        for device, token in (('phone', 'refresh-1'), ('laptop', 'refresh-2')):
+            RefreshSession.objects.start(self.user, token, device)
+        RefreshSession.objects.start(self.other, 'refresh-3', 'phone')
+        self.authorization = f'Bearer {access_token(self.user.supabase_user_id, self.user.email)}'
+    
+    def test_header_only_logout_ends_every_session(self):
+        response = views.logout_view(
+            RequestFactory().post('/api/auth/logout/', {}, content_type='application/json', headers={'Authorization': self.authorization})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(RefreshSession.objects.values_list('user_id', flat=True)), [self.other.pk])
+    
+    async def test_async_header_only_logout_ends_every_session(self):
+        response = await async_views.logout_view(
+            AsyncRequestFactory().post('/api/auth/logout/', {}, content_type='application/json', headers={'Authorization': self.authorization})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([session.user_id async for session in RefreshSession.objects.all()], [self.other.pk])
+    
+    def rotate(self, refresh_token, new_refresh_token):
+        """Refresh through the coalescer as the refresh view does, rotating the session."""
+        def refresh():
+            RefreshSession.objects.rotate(RefreshSession.objects.get_active(refresh_token), new_refresh_token)
+            return 200, refresh_token_data('access', new_refresh_token)
+        
+        get_refresh_coalescer().run(refresh_token, refresh)
+    
+    def assertNotReplayed(self, refresh_token):
+        self.assertEqual(get_refresh_coalescer().run(refresh_token, lambda: (401, {})), (401, {}))
+    
+    def test_logout_forgets_the_coalesced_refresh(self):
+        self.addCleanup(cache.clear)
+        self.rotate('refresh-1', 'refresh-1b')
+        response = views.logout_view(
+            RequestFactory().post('/api/auth/logout/', {'refresh_token': 'refresh-1b'}, content_type='application/json')
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotReplayed('refresh-1')
+    
+    def test_header_only_logout_forgets_the_coalesced_refreshes(self):
+        self.addCleanup(cache.clear)
+        self.rotate('refresh-1', 'refresh-1b')
+        self.rotate('refresh-2', 'refresh-2b')
+        self.rotate('refresh-3', 'refresh-3b')
+        views.logout_view(
+            RequestFactory().post('/api/auth/logout/', {}, content_type='application/json', headers={'Authorization': self.authorization})
+        )
+        self.assertNotReplayed('refresh-1')
+        self.assertNotReplayed('refresh-2')
+        # Another user's refresh is still replayed
+        self.assertEqual(get_refresh_coalescer().run('refresh-3', lambda: (401, {}))[0], 200)
+    
+    async def test_async_logout_forgets_the_coalesced_refresh(self):
+        self.addCleanup(cache.clear)
+        await sync_to_async(self.rotate)('refresh-1', 'refresh-1b')
+        await async_views.logout_view(
+            AsyncRequestFactory().post('/api/auth/logout/', {'refresh_token': 'refresh-1b'}, content_type='application/json')
+        )
+        await sync_to_async(self.assertNotReplayed)('refresh-1')
+
+
+@override_settings(SUPABASE_AUTH_CLAIMS_ONLY=True, AUTH_ROUTE_POLICIES={'games:ratings': 'admin'})
+class ClaimsOnlyRoleTests(TransactionTestCase):
+    """A token still claiming a role the user lost must not pass role-restricted routes."""
+    
+    # The user row is read through the replica when one is configured
+    databases = '__all__'
+    
+    def setUp(self):
+        self.addCleanup(stop_revocation_list)
+        self.user = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='user@example.com', role='member')
+        token = jwt.encode(
+            {
+                'sub': str(self.user.supabase_user_id),
+                'email': self.user.email,
+                'app_metadata': {'role': 'admin'},
+                'exp': int(time.time()) + 3600,
+            },
+            settings.SUPABASE_JWT_SECRET,
+            algorithm='HS256',
+        )
+        self.headers = {'Authorization': f'Bearer {token}'}
+        patcher = mock.patch('authentication.middleware.get_route_policies', return_value=RoutePolicyTable())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_demoted_admin_is_denied(self):
+        middleware = SupabaseTokenValidationMiddleware(lambda request: HttpResponse())
+        response = middleware(RequestFactory().get('/api/games/ratings/', headers=self.headers))
+        self.assertEqual(response.status_code, 403)
+        
+        SupabaseUser.objects.filter(pk=self.user.pk).update(role='admin')
+        get_user_cache().invalidate(self.user.supabase_user_id)
+        response = middleware(RequestFactory().get('/api/games/ratings/', headers=self.headers))
+        self.assertEqual(response.status_code, 200)
+    
+    async def test_async_demoted_admin_is_denied(self):
+        async def get_response(request):
+            return HttpResponse()
+        
+        middleware = SupabaseTokenValidationMiddleware(get_response)
+        response = await middleware(AsyncRequestFactory().get('/api/games/ratings/', headers=self.headers))
+        self.assertEqual(response.status_code, 403)
+    
+    def test_role_claim_still_reaches_views(self):
+        seen = []
+        middleware = SupabaseTokenValidationMiddleware(lambda request: seen.append(request.user.role) or HttpResponse())
+        with override_settings(AUTH_ROUTE_POLICIES={}):
+            middleware.policies = RoutePolicyTable()
+        middleware(RequestFactory().get('/api/games/ratings/', headers=self.headers))
+        self.assertEqual(seen, ['admin'])
+
+
+@override_settings(
+    CACHES={'ratelimit': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ratelimit-tests'}},
+    RATELIMIT_CACHE_ALIAS='ratelimit',
+    RATELIMIT_RATES={},
+)
+class RateLimitTests(SimpleTestCase):
+    """Sliding-window limits of 3 requests a minute, against locmem with a controlled clock."""
+    
+    # Start of a minute window
+    WINDOW_START = 60 * 29_000_000
+    
+    def setUp(self):
+        caches['ratelimit'].clear()
+        self.limit = RateLimit('test', '3/m', key='ip')
+        self.now = self.WINDOW_START
+        patcher = mock.patch('authentication.ratelimit.time.time', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def check(self, ip='10.0.0.1', at=None):
+        if at is not None:
+            self.now = self.WINDOW_START + at
+        return self.limit.check(RequestFactory().post('/', REMOTE_ADDR=ip))
+    
+    def test_rejects_requests_over_the_limit(self):
+        for _ in range(3):
+            self.assertIsNone(self.check(at=1))
+        self.assertGreaterEqual(self.check(), 1)
+    
+    def test_keys_are_limited_separately(self):
+        for _ in range(3):
+            self.check('10.0.0.1', at=1)
+        self.assertIsNotNone(self.check('10.0.0.1'))
+        self.assertIsNone(self.check('10.0.0.2'))
+    
+    def test_no_double_burst_across_a_window_boundary(self):
+        for _ in range(3):
+            self.assertIsNone(self.check(at=59))
+        # A fixed window would allow 3 more right after the boundary
+        self.assertIsNotNone(self.check(at=61))
+    
+    def test_previous_window_ages_out(self):
+        for _ in range(3):
+            self.check(at=1)
+        # 45s into the next window a quarter of the previous one still counts: 0.75 + 1, + 2, + 3
+        self.assertIsNone(self.check(at=105))
+        self.assertIsNone(self.check())
+        self.assertIsNotNone(self.check())
+    
+    def test_two_windows_later_everything_has_aged_out(self):
+        for _ in range(4):
+            self.check(at=1)
+        for _ in range(3):
+            self.assertIsNone(self.check(at=121))
+    
+    def test_retry_after_is_just_long_enough(self):
+        for ip in ('10.0.0.1', '10.0.0.2'):
+            for _ in range(3):
+                self.check(ip, at=59)
+            retry_after = self.check(ip, at=61)
+        self.assertIsNotNone(self.check('10.0.0.1', at=61 + retry_after - 1))
+        self.assertIsNone(self.check('10.0.0.2', at=61 + retry_after))
+
+
+class PrimaryReplicaRouterTests(SimpleTestCase):
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_everything_goes_to_the_primary_without_replicas(self):
+        user_id = uuid.uuid4()
+        with mock.patch('authentication.routers.replica_aliases', return_value=[]):
+            router = PrimaryReplicaRouter()
+            with replica_reads():
+                self.assertEqual(router.db_for_read(SupabaseUser), 'default')
+            pin_to_primary(user_id)
+            self.assertFalse(can_read_replica(user_id))
+            self.assertIsNone(cache.get('replica:pinned:' + str(user_id)))
+    
+    def test_only_opted_in_reads_go_to_a_replica(self):
+        with mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']}):
+            router = PrimaryReplicaRouter()
+            self.assertEqual(router.db_for_read(SupabaseUser), 'default')
+            with replica_reads():
+                self.assertEqual(router.db_for_read(SupabaseUser), 'replica')
+                self.assertEqual(router.db_for_write(SupabaseUser), 'default')
+            self.assertIs(router.allow_migrate('replica', 'authentication'), False)
+    
+    def test_pinned_users_read_the_primary(self):
+        user_id = uuid.uuid4()
+        with mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']}):
+            self.assertTrue(can_read_replica(user_id))
+            pin_to_primary(str(user_id).upper())
+            self.assertFalse(can_read_replica(user_id))
+            self.assertTrue(can_read_replica(uuid.uuid4()))
+    
+    @override_settings(DATABASE_REPLICA_STICKY_SECONDS=10)
+    def test_pins_expire(self):
+        user_id = uuid.uuid4()
+        with mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']}):
+            pin_to_primary(user_id)
+            with mock.patch('django.core.cache.backends.locmem.time.time', return_value=time.time() + 11):
+                self.assertTrue(can_read_replica(user_id))
+
+
+@override_settings(AUTH_AUDIT_ENABLED=False, RATELIMIT_ENABLED=False)
+class LoginPinTests(TestCase):
+    
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(stop_revocation_list)
+    
+    def test_user_is_pinned_before_the_cache_is_invalidated(self):
+        user_id = uuid.uuid4()
+        readable = []
+        
+        def invalidate(cache, user_id):
+            # Anything loaded now must not come from a replica that lacks the login's write
+            readable.append(can_read_replica(user_id))
+        
+        with mock.patch.dict(settings.DATABASES, {'replica': settings.DATABASES['default']}), \
+                mock.patch.object(SupabaseUserCache, 'invalidate', autospec=True, side_effect=invalidate):
+            response = Client().post(
+                '/api/auth/login/',
+                {'access_token': access_token(user_id), 'refresh_token': 'refresh'},
+                content_type='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(readable, [False])
+
+
+@skipUnless(replica_aliases(), 'needs a replica in DATABASE_REPLICA_URL')
+class ReplicaStickinessTests(TransactionTestCase):
+    """User lookups against a real second connection; the test replica mirrors the primary."""
+    
+    databases = '__all__'
+    
+    def setUp(self):
+        cache.clear()
+        self.user = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='user@example.com')
+    
+    def lookup(self):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(SupabaseUserCache().get(self.user.supabase_user_id).pk, self.user.pk)
+        return len(primary), len(replica)
+    
+    def test_lookups_read_the_replica(self):
+        self.assertEqual(self.lookup(), (0, 1))
+    
+    def test_pinned_lookups_read_the_primary(self):
+        pin_to_primary(self.user.supabase_user_id)
+        self.assertEqual(self.lookup(), (1, 0))
+
+
+@override_settings(AUTH_AUDIT_ENABLED=False, RATELIMIT_ENABLED=False)
+class BatchPathTests(TestCase):
+    # Some reads go to a replica when one is configured
+    databases = '__all__'
+    
+    def setUp(self):
+        self.addCleanup(stop_revocation_list)
+        self.user = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='user@example.com')
+    
+    def batch(self, *paths):
+        response = Client().post(
+            '/api/batch/',
+            {'requests': [{'path': path} for path in paths]},
+            content_type='application/json',
+            headers={'Authorization': f'Bearer {access_token(self.user.supabase_user_id, self.user.email)}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        return [(entry['status'], entry['body']['error']) for entry in response.json()['responses']]
+    
+    def test_non_latin_1_paths_are_answered_per_entry(self):
+        self.assertEqual(
+            self.batch('/api/games/ratings/', '/api/games/\u20ac/', '/api/games/\ud800/'),
+            [(404, 'Season not found'), (404, 'Not found'), (400, 'Invalid path')],
+        )
+    
+    def test_percent_encoded_paths_are_decoded(self):
+        self.assertEqual(
+            self.batch('/api/games/%72atings/', '/api/games/ratings/?season=\u00e9'),
+            [(404, 'Season not found'), (400, 'season must be a year')],
+        )
+
+
+@override_settings(SUPABASE_USER_CACHE_ALIAS='default')
+class SyncSupabaseUsersTests(TransactionTestCase):
+    # Some reads go to a replica when one is configured
+    databases = '__all__'
+    
+    def setUp(self):
+        cache.clear()
+        self.user_cache = SupabaseUserCache()
+        patcher = mock.patch(
+            'authentication.management.commands.sync_supabase_users.get_user_cache', return_value=self.user_cache
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def sync(self, *records):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+            f.flush()
+            call_command('sync_supabase_users', f.name, stdout=mock.Mock())
+    
+    def test_updated_users_are_invalidated(self):
+        changed = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='old@example.com')
+        unchanged = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='same@example.com')
+        self.user_cache.get(changed.supabase_user_id)
+        self.user_cache.get(unchanged.supabase_user_id)
+        self.user_cache.local.clear()
+        
+        created_id = uuid.uuid4()
+        with mock.patch.object(self.user_cache, 'invalidate_many', wraps=self.user_cache.invalidate_many) as invalidate:
+            self.sync(
+                {'id': str(changed.supabase_user_id), 'email': 'new@example.com'},
+                {'id': str(unchanged.supabase_user_id), 'email': 'same@example.com'},
+                {'id': str(created_id), 'email': 'created@example.com'},
+            )
+        # New users are read back with the updated ones; only unchanged users are left alone
+        self.assertEqual(
+            [sorted(map(str, call.args[0])) for call in invalidate.call_args_list],
+            [sorted([str(changed.supabase_user_id), str(created_id)])],
+        )
+        self.assertEqual(self.user_cache.get(changed.supabase_user_id).email, 'new@example.com')
+        self.assertEqual(self.user_cache.get(unchanged.supabase_user_id).email, 'same@example.com')
+    
+    def test_invalidation_reads_updated_users_in_pages(self):
+        users = [SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email=f'old{i}@example.com') for i in range(5)]
+        with mock.patch.object(Command, 'INVALIDATE_CHUNK_SIZE', 2), \
+                mock.patch.object(self.user_cache, 'invalidate_many', wraps=self.user_cache.invalidate_many) as invalidate:
+            self.sync(*({'id': str(user.supabase_user_id), 'email': f'new{i}@example.com'} for i, user in enumerate(users)))
+        self.assertEqual([len(list(call.args[0])) for call in invalidate.call_args_list], [2, 2, 1])
+    
+    def test_dry_run_invalidates_nothing(self):
+        user = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='old@example.com')
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as f, \
+                mock.patch.object(self.user_cache, 'invalidate_many') as invalidate:
+            f.write(json.dumps({'id': str(user.supabase_user_id), 'email': 'new@example.com'}) + '\n')
+            f.flush()
+            call_command('sync_supabase_users', f.name, '--dry-run', stdout=mock.Mock())
+        invalidate.assert_not_called()
+        self.assertEqual(SupabaseUser.objects.get(pk=user.pk).email, 'old@example.com')
+    
+    def test_malformed_records_are_skipped(self):
+        good = uuid.uuid4()
+        out = io.StringIO()
+        records = [
+            {'id': str(uuid.uuid4()), 'email': 42},
+            {'id': str(uuid.uuid4()), 'email': ['a@example.com']},
+            {'id': str(uuid.uuid4()), 'email': 'bad-date@example.com', 'created_at': 'yesterday'},
+            {'id': str(uuid.uuid4()), 'email': 'bad-day@example.com', 'created_at': '2024-02-30T00:00:00Z'},
+            {'id': str(uuid.uuid4()), 'email': 'number@example.com', 'created_at': 1700000000},
+            {'id': str(uuid.uuid4()), 'email': 'role@example.com', 'role': ['admin'], 'app_metadata': {'role': {'x': 1}}},
+            {'id': str(good), 'email': ' good@example.com ', 'created_at': '2024-01-02 03:04:05.123456+00'},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+            f.flush()
+            call_command('sync_supabase_users', f.name, stdout=out)
+        self.assertIn('created 2 and updated 0 users; 0 rows were unchanged or repeated, 5 records skipped.', out.getvalue())
+        user = SupabaseUser.objects.get(supabase_user_id=good)
+        self.assertEqual(user.email, 'good@example.com')
+        self.assertEqual(user.created_at, datetime.datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=datetime.timezone.utc))
+        self.assertEqual(SupabaseUser.objects.get(email='role@example.com').role, 'member')
+    
+    def test_naive_created_at_is_utc(self):
+        user_id = uuid.uuid4()
+        self.sync({'id': str(user_id), 'email': 'user@example.com', 'created_at': '2024-01-02T03:04:05'})
+        self.assertEqual(
+            SupabaseUser.objects.get(supabase_user_id=user_id).created_at,
+            datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc),
+        )
+
+
+@override_settings(AUTH_AUDIT_ENABLED=False, RATELIMIT_ENABLED=False)
+class FastJSONRendererTests(TransactionTestCase):
+    
+    # Ratings are read from a replica when one is configured
+    databases = '__all__'
+    
+    def setUp(self):
+        self.addCleanup(stop_revocation_list)
+        self.addCleanup(ratings._season_ratings.clear)
+    
+    def assertSameBytes(self, data):
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+    
+    def test_auth_responses_match_json_renderer(self):
+        user_id = uuid.uuid4()
+        response = Client().post(
+            '/api/auth/login/',
+            {'access_token': access_token(user_id, 'caf\u00e9@example.com'), 'refresh_token': 'refresh\u2028'},
+            content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+        self.assertSameBytes(refresh_token_data('access', 'refresh'))
+    
+    def test_ratings_response_matches_json_renderer(self):
+        season = Season.objects.create(year=2026)
+        teams = [Team.objects.create(external_id=name, name=name) for name in ('a', 'b')]
+        Game.objects.create(
+            external_id='g1', season=season, date=datetime.date(2025, 11, 10), home_team=teams[0], away_team=teams[1],
+            home_score=71, away_score=64, status=Game.STATUS_FINAL,
+        )
+        user = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='user@example.com')
+        response = Client().get(
+            '/api/games/ratings/?season=2026',
+            headers={'Authorization': f'Bearer {access_token(user.supabase_user_id, user.email)}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, JSONRenderer().render(response.data))
+    
+    def test_floats_are_rendered_by_json_renderer(self):
+        self.assertSameBytes({'values': [1e-05, 1e16, 0.1, {'nested': 2.5}]})
+        for value in (float('nan'), float('inf')):
+            with self.assertRaises(ValueError):
+                FastJSONRenderer().render({'value': value})
+
+
+class LRUCacheTests(SimpleTestCase):
+    
+    def test_entries_expire_at_their_own_time(self):
+        cache = LRUCache(max_size=10)
+        with mock.patch('authentication.utils.time.time', return_value=1000.0) as clock:
+            cache.set('short', 1, expires_at=1010.0)
+            cache.set('long', 2, expires_at=1100.0)
+            clock.return_value = 1010.0
+            self.assertIsNone(cache.get('short'))
+            self.assertEqual(cache.get('long'), 2)
+        self.assertEqual(cache.stats()['size'], 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+    
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = LRUCache(max_size=2)
+        expires_at = time.time() + 60
+        cache.set('a', 1, expires_at)
+        cache.set('b', 2, expires_at)
+        cache.get('a')
+        cache.set('c', 3, expires_at)
+        self.assertEqual([cache.get(key) for key in 'abc'], [1, None, 3])
+        self.assertEqual(cache.evictions, 1)
+    
+    def test_zero_size_disables_the_cache(self):
+        cache = LRUCache(max_size=0)
+        cache.set('a', 1, time.time() + 60)
+        self.assertIsNone(cache.get('a'))
+
+
+@override_settings(SUPABASE_TOKEN_CACHE_TTL=300, SUPABASE_TOKEN_CACHE_ALIAS=None, SUPABASE_REVOCATION_ENABLED=False)
+class VerifiedTokenCacheTests(SimpleTestCase):
+    
+    def token(self, exp) -> str:
+        return jwt.encode({'sub': str(uuid.uuid4()), 'exp': exp}, settings.SUPABASE_JWT_SECRET, algorithm='HS256')
+    
+    def test_repeated_token_is_verified_once(self):
+        validator = SupabaseJWTValidator()
+        token = self.token(int(time.time()) + 3600)
+        with mock.patch.object(validator, '_decode_token', wraps=validator._decode_token) as decode:
+            first = validator.validate_token(token)
+            second = validator.validate_token(token)
+        self.assertEqual(first, second)
+        self.assertEqual(decode.call_count, 1)
+        self.assertEqual(validator.cache_stats()['hits'], 1)
+    
+    def test_invalid_tokens_are_not_cached(self):
+        validator = SupabaseJWTValidator()
+        self.assertIsNone(validator.validate_token('not-a-token'))
+        self.assertEqual(validator.cache_stats()['size'], 0)
+    
+    def test_entries_never_outlive_exp(self):
+        validator = SupabaseJWTValidator()
+        now = time.time()
+        self.assertEqual(validator._cache_expiry({'exp': now + 30}), now + 30)
+        self.assertAlmostEqual(validator._cache_expiry({'exp': now + 3600}), now + 300, delta=1)
+        self.assertIsNone(validator._cache_expiry({'exp': now - 1}))
+    
+    def test_cached_token_is_dropped_at_exp(self):
+        validator = SupabaseJWTValidator()
+        exp = int(time.time()) + 30
+        token = self.token(exp)
+        self.assertIsNotNone(validator.validate_token(token))
+        with mock.patch('authentication.utils.time.time', return_value=exp):
+            self.assertIsNone(validator.token_cache.get(token_digest(token)))
+    
+    @override_settings(
+        CACHES={'tokens': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'token-cache-tests'}},
+        SUPABASE_TOKEN_CACHE_ALIAS='tokens',
+    )
+    def test_shared_cache_serves_other_workers(self):
+        token = self.token(int(time.time()) + 3600)
+        self.addCleanup(caches['tokens'].clear)
+        SupabaseJWTValidator().validate_token(token)
+        
+        other_worker = SupabaseJWTValidator()
+        with mock.patch.object(other_worker, '_decode_token') as decode:
+            self.assertIsNotNone(other_worker.validate_token(token))
+        decode.assert_not_called()
+        self.assertEqual(other_worker.cache_stats()['shared_hits'], 1)
+
+
+@override_settings(
+    CACHES={**settings.CACHES, 'users': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'user-cache-tests'}},
+    SUPABASE_USER_CACHE_ALIAS='users',
+    SUPABASE_USER_CACHE_LOCAL_TTL=5,
+)
+class SupabaseUserCacheTests(TransactionTestCase):
+    # Rows are read through the replica when one is configured
+    databases = '__all__'
+    
+    def setUp(self):
+        self.addCleanup(stop_revocation_list)
+        self.addCleanup(caches['users'].clear)
+        self.user = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='user@example.com')
+    
+    def test_rows_are_served_from_both_levels(self):
+        worker = SupabaseUserCache()
+        self.assertEqual(worker.get(self.user.supabase_user_id).email, 'user@example.com')
+        
+        other_worker = SupabaseUserCache()
+        with self.assertNumQueries(0):
+            self.assertEqual(worker.get(str(self.user.supabase_user_id).upper()).pk, self.user.pk)
+            self.assertEqual(other_worker.get(self.user.supabase_user_id).pk, self.user.pk)
+        self.assertEqual(other_worker.local.stats()['size'], 1)
+    
+    def test_refresh_token_is_never_cached(self):
+        SupabaseUserCache().get(self.user.supabase_user_id)
+        cached = caches['users'].get(SupabaseUserCache.KEY_PREFIX + str(self.user.supabase_user_id))
+        self.assertNotIn('refresh_token', cached.__dict__)
+    
+    def test_invalidate_drops_both_levels(self):
+        worker, other_worker = SupabaseUserCache(), SupabaseUserCache()
+        worker.get(self.user.supabase_user_id)
+        other_worker.get(self.user.supabase_user_id)
+        SupabaseUser.objects.filter(pk=self.user.pk).update(email='new@example.com')
+        worker.invalidate(self.user.supabase_user_id)
+        
+        self.assertEqual(worker.get(self.user.supabase_user_id).email, 'new@example.com')
+        # Other workers only hold the row until their short local TTL runs out
+        self.assertEqual(other_worker.get(self.user.supabase_user_id).email, 'user@example.com')
+        with mock.patch('authentication.utils.time.time', return_value=time.time() + 5):
+            self.assertEqual(other_worker.get(self.user.supabase_user_id).email, 'new@example.com')
+    
+    def test_invalidate_many(self):
+        other = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='other@example.com')
+        worker = SupabaseUserCache()
+        for user in (self.user, other):
+            worker.get(user.supabase_user_id)
+        worker.invalidate_many([self.user.supabase_user_id, other.supabase_user_id])
+        self.assertEqual(worker.local.stats()['size'], 0)
+        self.assertEqual(caches['users'].get_many([SupabaseUserCache.KEY_PREFIX + str(self.user.supabase_user_id)]), {})
+    
+    def test_login_invalidates_the_cached_row(self):
+        with mock.patch('authentication.cache._user_cache', SupabaseUserCache()):
+            get_user_cache().get(self.user.supabase_user_id)
+            response = Client().post(
+                '/api/auth/login/',
+                {'access_token': access_token(self.user.supabase_user_id, 'new@example.com'), 'refresh_token': 'refresh'},
+                content_type='application/json',
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(get_user_cache().get(self.user.supabase_user_id).email, 'new@example.com')
+    
+    def test_missing_user_raises(self):
+        with self.assertRaises(SupabaseUser.DoesNotExist):
+            SupabaseUserCache().get(uuid.uuid4())
+
+
+@override_settings(SUPABASE_AUTH_CLAIMS_ONLY=True)
+class ClaimsUserTests(TransactionTestCase):
+    # The user row is read through the replica when one is configured
+    databases = '__all__'
+    
+    def setUp(self):
+        self.addCleanup(stop_revocation_list)
+        self.user = SupabaseUser.objects.create(supabase_user_id=uuid.uuid4(), email='user@example.com', role='admin')
+    
+    def request_user(self, token):
+        seen = []
+        middleware = SupabaseTokenValidationMiddleware(lambda request: seen.append(request.user) or HttpResponse())
+        response = middleware(RequestFactory().get('/api/games/ratings/', headers={'Authorization': f'Bearer {token}'}))
+        self.assertEqual(response.status_code, 200)
+        return seen[0]
+    
+    def test_claims_are_answered_without_the_database(self):
+        # Load the revocation list first so only user queries are counted
+        self.request_user(access_token(uuid.uuid4()))
+        with self.assertNumQueries(0):
+            user = self.request_user(access_token(self.user.supabase_user_id, 'claimed@example.com'))
+            self.assertEqual(user.supabase_user_id, self.user.supabase_user_id)
+            self.assertEqual(user.email, 'claimed@example.com')
+        self.assertIsInstance(user, ClaimsUser)
+    
+    def test_other_attributes_load_the_row_once(self):
+        user = self.request_user(access_token(self.user.supabase_user_id))
+        with mock.patch.object(SupabaseUserCache, 'get', wraps=get_user_cache().get) as get:
+            self.assertEqual(user.id, self.user.pk)
+            self.assertEqual(user.created_at, self.user.created_at)
+            # No role claim in the token, so it comes from the row too
+            self.assertEqual(user.role, 'admin')
+        self.assertEqual(get.call_count, 1)
+    
+    def test_missing_row_raises_on_access(self):
+        user = self.request_user(access_token(uuid.uuid4()))
+        with self.assertRaises(SupabaseUser.DoesNotExist):
+            user.created_at
+    
+    def test_role_claim_is_read_from_the_configured_path(self):
+        payload = {'app_metadata': {'role': 'admin'}, 'custom': {'role': 'member'}, 'role': 'authenticated'}
+        self.assertEqual(ClaimsUser.from_payload(str(uuid.uuid4()), payload).role, 'admin')
+        with override_settings(SUPABASE_ROLE_CLAIM='custom.role'):
+            self.assertEqual(ClaimsUser.from_payload(str(uuid.uuid4()), payload).role, 'member')
+        with override_settings(SUPABASE_ROLE_CLAIM='role'):
+            self.assertNotIn('role', ClaimsUser.from_payload(str(uuid.uuid4()), payload).__dict__)
+    
+    async def test_ainstance_loads_the_row(self):
+        user = ClaimsUser(self.user.supabase_user_id)
+        self.assertEqual((await user.ainstance()).pk, self.user.pk)
+        self.assertEqual(user.email, 'user@example.com')
+
+
+@override_settings(
+    CACHES={**settings.CACHES, 'refresh': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'refresh-tests'}},
+    SUPABASE_REFRESH_COALESCE_ALIAS='refresh',
+    SUPABASE_REFRESH_RESULT_TTL=10,
+    SUPABASE_REFRESH_LOCK_TTL=5,
+)
+class RefreshCoalescerTests(SimpleTestCase):
+    
+    def setUp(self):
+        self.addCleanup(caches['refresh'].clear)
+        self.calls = 0
+    
+    def refresh(self):
+        self.calls += 1
+        time.sleep(0.1)
+        return 200, {'access_token': f'access-{self.calls}', 'refresh_token': f'refresh-{self.calls}'}
+    
+    def test_concurrent_threads_share_one_refresh(self):
+        coalescer = RefreshCoalescer()
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            results = list(executor.map(lambda _: coalescer.run('refresh-0', self.refresh), range(5)))
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [(200, {'access_token': 'access-1', 'refresh_token': 'refresh-1'})] * 5)
+    
+    def test_concurrent_tasks_share_one_refresh(self):
+        async def refresh():
+            self.calls += 1
+            await asyncio.sleep(0.1)
+            return 200, {'access_token': 'access-1', 'refresh_token': 'refresh-1'}
+        
+        async def refresh_concurrently():
+            coalescer = RefreshCoalescer()
+            return await asyncio.gather(*(coalescer.arun('refresh-0', refresh) for _ in range(5)))
+        
+        results = async_to_sync(refresh_concurrently)()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(len(set(json.dumps(result) for result in results)), 1)
+    
+    def test_other_workers_reuse_the_result(self):
+        first = RefreshCoalescer().run('refresh-0', self.refresh)
+        self.assertEqual(RefreshCoalescer().run('refresh-0', self.refresh), first)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(RefreshCoalescer().run('refresh-other', self.refresh)[1]['access_token'], 'access-2')
+    
+    def test_worker_waits_for_the_lock_holder(self):
+        coalescer, other_worker = RefreshCoalescer(), RefreshCoalescer()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            leader = executor.submit(coalescer.run, 'refresh-0', self.refresh)
+            time.sleep(0.02)
+            follower = executor.submit(other_worker.run, 'refresh-0', self.refresh)
+            self.assertEqual(follower.result(), leader.result())
+        self.assertEqual(self.calls, 1)
+    
+    def test_failed_refresh_is_not_replayed(self):
+        coalescer = RefreshCoalescer()
+        self.assertEqual(coalescer.run('refresh-0', lambda: (401, {'error': 'Invalid refresh token'}))[0], 401)
+        self.assertEqual(coalescer.run('refresh-0', self.refresh)[0], 200)
+        self.assertEqual(self.calls, 1)
+    
+    def test_errors_reach_every_waiter(self):
+        coalescer = RefreshCoalescer()
+        
+        def refresh():
+            time.sleep(0.1)
+            raise SupabaseUnavailable('down')
+        
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            futures = [executor.submit(coalescer.run, 'refresh-0', refresh) for _ in range(3)]
+            for future in futures:
+                with self.assertRaises(SupabaseUnavailable):
+                    future.result()
+
+
+class UpsertLoginTests(TestCase):
+    
+    def setUp(self):
+        self.user_id = uuid.uuid4()
+    
+    def row_version(self):
+        # Every UPDATE writes a new row version, even inside the test transaction
+        with connections['default'].cursor() as cursor:
+            cursor.execute('SELECT ctid::text FROM supabase_users WHERE supabase_user_id = %s', [self.user_id])
+            return cursor.fetchone()[0]
+    
+    def test_first_login_creates_the_user(self):
+        with self.assertNumQueries(1):
+            user, created = SupabaseUser.objects.upsert_login(self.user_id, 'user@example.com')
+        self.assertTrue(created)
+        self.assertEqual(SupabaseUser.objects.get(pk=user.pk).email, 'user@example.com')
+        self.assertEqual((user.supabase_user_id, user.role), (self.user_id, 'member'))
+    
+    def test_unchanged_login_does_not_write(self):
+        first, _ = SupabaseUser.objects.upsert_login(self.user_id, 'user@example.com')
+        version = self.row_version()
+        with self.assertNumQueries(1):
+            user, created = SupabaseUser.objects.upsert_login(self.user_id, 'user@example.com')
+        self.assertFalse(created)
+        self.assertEqual((user.pk, user.updated_at), (first.pk, first.updated_at))
+        self.assertEqual(self.row_version(), version)
+    
+    def test_email_change_updates_only_email(self):
+        first, _ = SupabaseUser.objects.upsert_login(self.user_id, 'user@example.com')
+        SupabaseUser.objects.filter(pk=first.pk).update(role='admin')
+        user, created = SupabaseUser.objects.upsert_login(self.user_id, 'new@example.com')
+        self.assertFalse(created)
+        self.assertEqual((user.pk, user.email, user.role, user.created_at), (first.pk, 'new@example.com', 'admin', first.created_at))
+        self.assertGreater(user.updated_at, first.updated_at)
+        self.assertEqual(SupabaseUser.objects.get(pk=first.pk).email, 'new@example.com')
+    
+    async def test_aupsert_login(self):
+        _, created = await SupabaseUser.objects.aupsert_login(self.user_id, 'user@example.com')
+        _, created_again = await SupabaseUser.objects.aupsert_login(self.user_id, 'user@example.com')
+        self.assertEqual((created, created_again), (True, False))
+
+
+def policy_test_view():
+    """A fresh view function, so decorating it leaves the other routes alone."""
+    def view(request, **kwargs):
+        return HttpResponse()
+    return view
+
+
+def policy_test_urlconf():
+    """A URLconf module covering each kind of route the policy table compiles."""
+    urlconf = types.ModuleType('policy_test_urls')
+    urlconf.urlpatterns = [
+        path('login/', public(policy_test_view()), name='login'),
+        path('schedule/', role_required('admin', methods=['POST'])(public(methods=['GET'])(policy_test_view())), name='schedule'),
+        path('items/<int:pk>/', role_required('admin')(policy_test_view()), name='item'),
+        path('plain/', policy_test_view(), name='plain'),
+        path('tools/', include(([path('open/', policy_test_view(), name='open'), path('<slug:name>/', policy_test_view())], 'tools'))),
+    ]
+    return urlconf
+
+
+class RoutePolicyTableTests(SimpleTestCase):
+    
+    def table(self, **overrides) -> RoutePolicyTable:
+        with override_settings(**overrides):
+            return RoutePolicyTable(policy_test_urlconf())
+    
+    def test_decorated_routes(self):
+        table = self.table()
+        self.assertTrue(table.lookup('/login/', 'POST').public)
+        self.assertTrue(table.lookup('/login', 'POST').public)
+        self.assertTrue(table.lookup('/schedule/', 'GET').public)
+        self.assertEqual(table.lookup('/schedule/', 'POST').roles, {'admin'})
+        self.assertIs(table.lookup('/plain/', 'GET'), AUTHENTICATED)
+        self.assertIs(table.lookup('/missing/', 'GET'), AUTHENTICATED)
+    
+    def test_routes_with_converters_are_resolved_and_remembered(self):
+        table = self.table()
+        self.assertNotIn('/items/1', table.static)
+        self.assertEqual(table.lookup('/items/1/', 'GET').roles, {'admin'})
+        self.assertIs(table.lookup('/items/x/', 'GET'), AUTHENTICATED)
+        table.lookup('/items/1/', 'DELETE')
+        self.assertEqual(table._resolve_cached.cache_info().hits, 1)
+    
+    def test_settings_override_routes_by_name(self):
+        table = self.table(AUTH_ROUTE_POLICIES={'plain': 'public', 'tools:open': ['admin', 'member'], 'login': {'get': 'authenticated'}})
+        self.assertTrue(table.lookup('/plain/', 'GET').public)
+        self.assertEqual(table.lookup('/tools/open/', 'GET').roles, {'admin', 'member'})
+        self.assertIs(table.lookup('/login/', 'GET'), AUTHENTICATED)
+        self.assertIs(table.lookup('/login/', 'POST'), AUTHENTICATED)
+    
+    def test_prefix_policies(self):
+        table = self.table(AUTH_PREFIX_POLICIES={'/tools/': 'admin', '/tools/open/': 'public', '/other/': 'public'})
+        self.assertTrue(table.lookup('/tools/open/', 'GET').public)
+        self.assertEqual(table.lookup('/tools/anything/', 'GET').roles, {'admin'})
+        self.assertTrue(table.lookup('/other/deep/path/', 'GET').public)
+        # A route's own policy wins over its prefix
+        self.assertTrue(self.table(AUTH_PREFIX_POLICIES={'/': 'admin'}).lookup('/login/', 'POST').public)
+    
+    def test_project_routes(self):
+        table = RoutePolicyTable()
+        for path_info in ('/api/auth/login/', '/api/auth/logout/', '/api/auth/refresh/'):
+            self.assertTrue(table.lookup(path_info, 'POST').public, path_info)
+        self.assertIs(table.lookup('/api/games/ratings/', 'GET'), AUTHENTICATED)
+
+
+class ResponseDataTests(SimpleTestCase):
+    """The serializer-free response paths must produce what the serializers and JSONRenderer did."""
+    
+    def assertSameBytes(self, data, accepted_media_type=None):
+        self.assertEqual(
+            FastJSONRenderer().render(data, accepted_media_type),
+            JSONRenderer().render(data, accepted_media_type),
+        )
+    
+    def test_login_user_data_matches_serializer(self):
+        user = SupabaseUser(
+            supabase_user_id=uuid.uuid4(),
+            email='caf\u00e9@example.com',
+            created_at=timezone.now(),
+            updated_at=timezone.now() + timedelta(microseconds=1),
+        )
+        self.assertEqual(login_user_data(user), LoginResponseSerializer(user).data)
+        user.email = None
+        self.assertEqual(login_user_data(user), LoginResponseSerializer(user).data)
+    
+    def test_refresh_token_data_matches_serializer(self):
+        for pair in (('access', 'refresh'), (None, 'refresh')):
+            expected = RefreshTokenResponseSerializer({'access_token': pair[0], 'refresh_token': pair[1]}).data
+            self.assertEqual(refresh_token_data(*pair), expected)
+    
+    def test_values_orjson_formats_differently(self):
+        self.assertSameBytes({
+            'id': uuid.uuid4(),
+            'at': timezone.now(),
+            'day': datetime.date(2026, 1, 2),
+            'amount': Decimal('1.50'),
+            'text': 'line\u2028para\u2029caf\u00e9 \U0001f600 "quoted"',
+            'big': 2 ** 70,
+            1: 'non-string key',
+            'nested': [None, True, {'empty': []}],
+        })
+    
+    def test_indented_output_matches(self):
+        self.assertSameBytes({'a': [1, 2]}, 'application/json; indent=2')
+
+
+@override_settings(AUTH_AUDIT_ENABLED=True, AUTH_AUDIT_BATCH_SIZE=2, AUTH_AUDIT_QUEUE_SIZE=5, AUTH_AUDIT_FLUSH_INTERVAL=0.05)
+class AuditLogTests(TransactionTestCase):
+    
+    def audit_log(self, start=False) -> AuditLog:
+        audit_log = AuditLog()
+        if not start:
+            # Keep events queued until the test flushes them
+            patcher = mock.patch.object(audit_log, 'start')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(audit_log.stop)
+        return audit_log
+    
+    def test_record_only_queues(self):
+        audit_log = self.audit_log()
+        request = RequestFactory().post('/api/auth/login/', headers={'User-Agent': 'tests'}, REMOTE_ADDR='10.0.0.1')
+        with self.assertNumQueries(0):
+            audit_log.record(AuthAuditEvent.LOGIN, request, user_id=str(uuid.uuid4()))
+        self.assertEqual(audit_log.stats()['queued'], 1)
+        self.assertFalse(AuthAuditEvent.objects.exists())
+    
+    def test_flush_writes_in_batches(self):
+        audit_log = self.audit_log()
+        user_id = uuid.uuid4()
+        request = RequestFactory().post('/api/auth/login/', headers={'User-Agent': 'tests'}, REMOTE_ADDR='10.0.0.1')
+        audit_log.record(AuthAuditEvent.LOGIN, request, user_id=user_id)
+        audit_log.record(AuthAuditEvent.LOGIN_FAILED, RequestFactory().post('/', REMOTE_ADDR='not-an-ip'), user_id='not-a-uuid', detail='x' * 300)
+        audit_log.record(AuthAuditEvent.TOKEN_REJECTED)
+        with mock.patch.object(AuthAuditEvent.objects, 'bulk_create', wraps=AuthAuditEvent.objects.bulk_create) as bulk_create:
+            audit_log.flush()
+        self.assertEqual([len(call.args[0]) for call in bulk_create.call_args_list], [2, 1])
+        self.assertEqual(audit_log.stats(), {'queued': 0, 'written': 3, 'dropped': 0, 'write_errors': 0})
+        
+        login, failed, rejected = AuthAuditEvent.objects.order_by('id')
+        self.assertEqual(
+            (login.event, login.supabase_user_id, login.ip_address, login.user_agent, login.path),
+            (AuthAuditEvent.LOGIN, user_id, '10.0.0.1', 'tests', '/api/auth/login/'),
+        )
+        self.assertEqual((failed.supabase_user_id, failed.ip_address, len(failed.detail)), (None, None, 255))
+        self.assertEqual((rejected.event, rejected.path), (AuthAuditEvent.TOKEN_REJECTED, ''))
+    
+    def test_events_are_dropped_when_the_queue_is_full(self):
+        audit_log = self.audit_log()
+        for _ in range(7):
+            audit_log.record(AuthAuditEvent.LOGOUT)
+        self.assertEqual(audit_log.stats(), {'queued': 5, 'written': 0, 'dropped': 2, 'write_errors': 0})
+    
+    def test_failed_writes_are_counted(self):
+        audit_log = self.audit_log()
+        for _ in range(3):
+            audit_log.record(AuthAuditEvent.LOGOUT)
+        with mock.patch.object(AuthAuditEvent.objects, 'bulk_create', side_effect=DatabaseError), self.assertLogs('authentication.audit', 'ERROR'):
+            audit_log.flush()
+        self.assertEqual(audit_log.stats(), {'queued': 0, 'written': 0, 'dropped': 3, 'write_errors': 2})
+    
+    def test_writer_thread_flushes_on_stop(self):
+        audit_log = self.audit_log(start=True)
+        for _ in range(3):
+            audit_log.record(AuthAuditEvent.LOGOUT)
+        audit_log.stop()
+        self.assertEqual(AuthAuditEvent.objects.count(), 3)
+        audit_log.record(AuthAuditEvent.LOGOUT)
+        self.assertEqual(audit_log.stats()['dropped'], 1)
+    
+    @override_settings(AUTH_AUDIT_ENABLED=False)
+    def test_disabled(self):
+        audit_log = self.audit_log()
+        audit_log.record(AuthAuditEvent.LOGOUT)
+        self.assertEqual(audit_log.stats()['queued'], 0)
+
+
+class ProfileStartupTests(SimpleTestCase):
+    
+    def test_parse_importtime(self):
+        # Children come before their parent, one level deeper
+        stderr = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:        50 |         50 |     django.utils.functional',
+            'import time:       100 |        150 |   django.utils',
+            'import time:       200 |        350 | django',
+            'import time:        30 |         30 | json',
+            'unrelated line',
+        ])
+        roots = parse_importtime(stderr)
+        self.assertEqual([(node.name, node.self_us, node.cumulative_us) for node in roots], [('django', 200, 350), ('json', 30, 30)])
+        self.assertEqual([node.name for node in roots[0].children], ['django.utils'])
+        self.assertEqual([node.name for node in roots[0].children[0].children], ['django.utils.functional'])
+    
+    def test_cold_and_preloaded_start(self):
+        for args, phases in (([], {'django_setup', 'handler'}), (['--preload'], {'preload', 'fork'})):
+            out = io.StringIO()
+            call_command('profile_startup', *args, '--depth', '1', stdout=out)
+            report = out.getvalue()
+            self.assertIn('(first request answered 400)', report)
+            for phase in phases | {'first_request', 'second_request', 'worker_ready'}:
+                self.assertRegex(report, rf'\n  {phase} +[0-9.]+ ms')
+    
+    def test_failed_start_is_reported(self):
+        with mock.patch.dict(os.environ, {'DJANGO_SETTINGS_MODULE': 'missing_settings'}):
+            with self.assertRaisesMessage(CommandError, 'Startup failed'):
+                call_command('profile_startup', stdout=io.StringIO())
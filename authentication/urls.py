@@ -1,11 +1,18 @@
+from django.conf import settings
 from django.urls import path
 from authentication import views
 
+auth_views = views
+
+# Native async views for ASGI deployments
+if getattr(settings, 'SUPABASE_ASYNC_VIEWS', False):
+    from authentication import async_views as auth_views
+
 app_name = 'authentication'
 
 urlpatterns = [
-    path('login/', views.login_view, name='login'),
-    path('logout/', views.logout_view, name='logout'),
-    path('refresh/', views.refresh_token_view, name='refresh'),
+    path('login/', auth_views.login_view, name='login'),
+    path('logout/', auth_views.logout_view, name='logout'),
+    path('refresh/', auth_views.refresh_token_view, name='refresh'),
+    path('introspect/', views.introspect_view, name='introspect'),
 ]
-
@@ -0,0 +1,103 @@
+import uuid
+from typing import Dict, Optional
+from django.conf import settings
+from authentication.cache import get_user_cache
+from authentication.models import SupabaseUser
+
+
+class ClaimsUser:
+    """
+    Lightweight request.user built from verified JWT claims.
+    
+    supabase_user_id, email and role are answered straight from the token.
+    Any other attribute (id, created_at, ...) loads the SupabaseUser row on
+    first access, without the refresh_token column, and is served from it
+    for the rest of the request.
+    
+    The role claim is only a hint for views on claims-only routes: it stays
+    whatever it was when the token was issued. Authorization uses
+    database_role(), which always reads SupabaseUser.role.
+    """
+    
+    is_authenticated = True
+    
+    def __init__(self, supabase_user_id: uuid.UUID, email: Optional[str] = None, role: Optional[str] = None):
+        self._user = None
+        self.supabase_user_id = supabase_user_id
+        # Leave missing claims unset so they fall through to the database row
+        if email:
+            self.email = email
+        if role:
+            self.role = role
+    
+    @classmethod
+    def from_payload(cls, user_id: str, token_payload: Dict) -> 'ClaimsUser':
+        """
+        Build a ClaimsUser from a validated token payload.
+        
+        Raises:
+            ValueError: If user_id is not a valid UUID
+        """
+        email = token_payload.get('email') or token_payload.get('user_metadata', {}).get('email')
+        return cls(uuid.UUID(str(user_id)), email=email, role=_role_from_payload(token_payload))
+    
+    @property
+    def instance(self) -> SupabaseUser:
+        """
+        The backing SupabaseUser row, loaded on first access.
+        
+        Raises:
+            SupabaseUser.DoesNotExist: If the user has no row in our database
+        """
+        if self._user is None:
+            self._user = get_user_cache().get(self.supabase_user_id)
+        return self._user
+    
+    async def ainstance(self) -> SupabaseUser:
+        """Async version of instance, for use from async views."""
+        if self._user is None:
+            self._user = await get_user_cache().aget(self.supabase_user_id)
+        return self._user
+    
+    def __getattr__(self, name):
+        # Only called for attributes not set from the token claims
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.instance, name)
+    
+    def __str__(self):
+        return f"{self.__dict__.get('email', '')} ({self.supabase_user_id})"
+
+
+def database_role(user) -> str:
+    """
+    The role stored on the user's SupabaseUser row, ignoring any token claim.
+    
+    Raises:
+        SupabaseUser.DoesNotExist: If the user has no row in our database
+    """
+    if isinstance(user, ClaimsUser):
+        return user.instance.role
+    return user.role
+
+
+async def adatabase_role(user) -> str:
+    """Async version of database_role()."""
+    if isinstance(user, ClaimsUser):
+        return (await user.ainstance()).role
+    return user.role
+
+
+def _role_from_payload(token_payload: Dict) -> Optional[str]:
+    """Read the application role from the claim named by SUPABASE_ROLE_CLAIM (dotted path)."""
+    claim_path = getattr(settings, 'SUPABASE_ROLE_CLAIM', 'app_metadata.role')
+    value = token_payload
+    for part in claim_path.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    
+    # Ignore values that aren't application roles, e.g. Supabase's 'authenticated'
+    if value in dict(SupabaseUser.ROLE_CHOICES):
+        return value
+    return None
@@ -1,7 +1,97 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
 import jwt
-import requests
-from typing import Optional, Dict
+from typing import Any, Optional, Dict, List, Tuple
 from django.conf import settings
+from django.core.cache import caches
+
+
+def token_digest(token: str) -> str:
+    """Return a fixed-width SHA-256 hex digest of a token for use as a cache key."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def bearer_token(request) -> Optional[str]:
+    """Return the token from an `Authorization: Bearer <token>` header, if any."""
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    return auth_header.split(' ')[1] or None
+
+
+def has_internal_token(request) -> bool:
+    """Check the X-Internal-Token header against INTERNAL_SERVICE_TOKEN; always False while that is unset."""
+    expected_token = getattr(settings, 'INTERNAL_SERVICE_TOKEN', '')
+    provided_token = request.META.get('HTTP_X_INTERNAL_TOKEN', '')
+    # Compared as bytes: compare_digest() raises TypeError for non-ASCII str
+    return bool(expected_token) and hmac.compare_digest(provided_token.encode('utf-8'), expected_token.encode('utf-8'))
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache where every entry carries its own expiry.
+    
+    Keeps hit/miss/eviction counters so callers can report how effective it is.
+    """
+    
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key: str, value: Any, expires_at: float):
+        """Store value until the absolute unix timestamp expires_at."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def delete(self, key: str):
+        """Remove key from the cache if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def clear(self):
+        """Remove every entry (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> Dict[str, int]:
+        """Return a snapshot of the cache counters."""
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
 
 
 class SupabaseJWTValidator:
@@ -9,17 +99,37 @@ class SupabaseJWTValidator:
     Utility class for validating Supabase JWT tokens.
     
     Supports both HS256 (default) and ES256/RS256 (for OAuth providers).
+    
+    Successfully validated tokens are kept in a bounded LRU cache keyed by the
+    token digest, so repeated requests with the same access token skip the
+    header parse and signature check. An entry never outlives the token's own
+    `exp` claim. When SUPABASE_TOKEN_CACHE_ALIAS names a Django cache, hits are
+    shared between worker processes through that backend as well.
+    
+    Tokens revoked on logout (see authentication.revocation) are rejected
+    even when their payload is cached.
     """
     
+    CACHE_KEY_PREFIX = 'supabase:jwt:'
+    
     def __init__(self):
         self.jwt_secret = None
         self.supabase_url = None
+        self.cache_ttl = 300
+        self.shared_cache_alias = None
         self._load_config()
+        self.token_cache = LRUCache(
+            max_size=getattr(settings, 'SUPABASE_TOKEN_CACHE_SIZE', 10000)
+        )
+        self.shared_hits = 0
     
     def _load_config(self):
         """Load Supabase configuration from settings."""
         self.jwt_secret = getattr(settings, 'SUPABASE_JWT_SECRET', None)
         self.supabase_url = getattr(settings, 'SUPABASE_URL', None)
+        self.cache_ttl = getattr(settings, 'SUPABASE_TOKEN_CACHE_TTL', 300)
+        self.shared_cache_alias = getattr(settings, 'SUPABASE_TOKEN_CACHE_ALIAS', None)
+        self.check_revocations = getattr(settings, 'SUPABASE_REVOCATION_ENABLED', True)
         
         if not self.jwt_secret:
             raise ValueError(
@@ -35,6 +145,112 @@ class SupabaseJWTValidator:
         except Exception:
             return None
     
+    def _cache_expiry(self, payload: Dict) -> Optional[float]:
+        """Return when a cached payload must be dropped, capped at the token's exp."""
+        expires_at = time.time() + self.cache_ttl
+        exp = payload.get('exp')
+        if isinstance(exp, (int, float)):
+            expires_at = min(expires_at, float(exp))
+        if expires_at <= time.time():
+            return None
+        return expires_at
+    
+    def _get_cached(self, digest: str) -> Optional[Dict]:
+        """Look up a previously verified payload, locally first, then in the shared cache."""
+        payload = self.token_cache.get(digest)
+        if payload is not None or not self.shared_cache_alias:
+            return payload
+        
+        try:
+            payload = caches[self.shared_cache_alias].get(self.CACHE_KEY_PREFIX + digest)
+        except Exception:
+            # A shared cache outage must never fail authentication
+            return None
+        return self._adopt_shared(digest, payload)
+    
+    async def _aget_cached(self, digest: str) -> Optional[Dict]:
+        """Async version of _get_cached(); the shared cache is awaited instead of blocking the event loop."""
+        payload = self.token_cache.get(digest)
+        if payload is not None or not self.shared_cache_alias:
+            return payload
+        
+        try:
+            payload = await caches[self.shared_cache_alias].aget(self.CACHE_KEY_PREFIX + digest)
+        except Exception:
+            return None
+        return self._adopt_shared(digest, payload)
+    
+    def _adopt_shared(self, digest: str, payload: Optional[Dict]) -> Optional[Dict]:
+        """Copy a payload found in the shared cache into the local one."""
+        if payload is None:
+            return None
+        
+        expires_at = self._cache_expiry(payload)
+        if expires_at is None:
+            return None
+        self.shared_hits += 1
+        self.token_cache.set(digest, payload, expires_at)
+        return payload
+    
+    def _set_cached(self, digest: str, payload: Dict):
+        """Remember a verified payload until it expires."""
+        expires_at = self._cache_expiry(payload)
+        if expires_at is None:
+            return
+        self.token_cache.set(digest, payload, expires_at)
+        
+        if self.shared_cache_alias:
+            try:
+                caches[self.shared_cache_alias].set(
+                    self.CACHE_KEY_PREFIX + digest,
+                    payload,
+                    timeout=max(1, int(expires_at - time.time())),
+                )
+            except Exception:
+                pass
+    
+    async def _aset_cached(self, digest: str, payload: Dict):
+        """Async version of _set_cached()."""
+        expires_at = self._cache_expiry(payload)
+        if expires_at is None:
+            return
+        self.token_cache.set(digest, payload, expires_at)
+        
+        if self.shared_cache_alias:
+            try:
+                await caches[self.shared_cache_alias].aset(
+                    self.CACHE_KEY_PREFIX + digest,
+                    payload,
+                    timeout=max(1, int(expires_at - time.time())),
+                )
+            except Exception:
+                pass
+    
+    def evict(self, digest: str):
+        """Drop a token from the local and shared caches."""
+        self.token_cache.delete(digest)
+        if self.shared_cache_alias:
+            try:
+                caches[self.shared_cache_alias].delete(self.CACHE_KEY_PREFIX + digest)
+            except Exception:
+                pass
+    
+    def after_fork(self):
+        """
+        Start a worker forked from a preloaded master with its own token cache.
+        
+        The configuration read in the master stays shared copy-on-write; only
+        the cache, its lock and its counters are per worker, so the entries a
+        worker adds never land on (and copy) pages its siblings share.
+        """
+        self.token_cache = LRUCache(max_size=self.token_cache.max_size)
+        self.shared_hits = 0
+    
+    def cache_stats(self) -> Dict[str, int]:
+        """Return verified-token cache counters; shared_hits counts local misses served by the shared cache."""
+        stats = self.token_cache.stats()
+        stats['shared_hits'] = self.shared_hits
+        return stats
     
     def validate_token(self, token: str) -> Optional[Dict]:
         """
@@ -43,13 +259,58 @@ class SupabaseJWTValidator:
         
         Args:
             token: The JWT token string from Supabase
-            
+        
         Returns:
             Decoded token payload if valid, None otherwise
         """
         if not self.jwt_secret:
             return None
         
+        digest = token_digest(token)
+        payload = self._get_cached(digest)
+        if payload is None:
+            payload = self._decode_token(token)
+            if payload is None:
+                return None
+            self._set_cached(digest, payload)
+        
+        if self.check_revocations and self._is_revoked(digest):
+            return None
+        return payload
+    
+    async def avalidate_token(self, token: str) -> Optional[Dict]:
+        """
+        Async version of validate_token() for the ASGI request path.
+        
+        Shared cache round trips and revocation lookups are awaited, so a
+        slow Redis or database never stalls the other requests on the event loop.
+        """
+        if not self.jwt_secret:
+            return None
+        
+        digest = token_digest(token)
+        payload = await self._aget_cached(digest)
+        if payload is None:
+            payload = self._decode_token(token)
+            if payload is None:
+                return None
+            await self._aset_cached(digest, payload)
+        
+        if self.check_revocations and await self._ais_revoked(digest):
+            return None
+        return payload
+    
+    def _is_revoked(self, digest: str) -> bool:
+        # Imported here because the revocation list depends on the models, which import this module
+        from authentication.revocation import get_revocation_list
+        return get_revocation_list().is_revoked(digest)
+    
+    async def _ais_revoked(self, digest: str) -> bool:
+        from authentication.revocation import get_revocation_list
+        return await get_revocation_list().ais_revoked(digest)
+    
+    def _decode_token(self, token: str) -> Optional[Dict]:
+        """Fully decode and verify a token, bypassing the cache."""
         # Determine the algorithm from token header
         algorithm = self._get_token_algorithm(token)
         
@@ -83,7 +344,7 @@ class SupabaseJWTValidator:
                 return decoded
             
             return None
-            
+        
         except jwt.ExpiredSignatureError:
             return None
         except jwt.InvalidTokenError:
@@ -91,6 +352,25 @@ class SupabaseJWTValidator:
         except Exception:
             return None
     
+    def validate_tokens(self, tokens: List[str]) -> Dict[str, Optional[Dict]]:
+        """
+        Validate many Supabase JWT tokens in one call.
+        
+        Repeated tokens are only validated once, and each distinct token goes
+        through validate_token(), so the verified-token cache is reused.
+        
+        Args:
+            tokens: JWT token strings, possibly with duplicates
+        
+        Returns:
+            Mapping of each distinct token to its decoded payload, or None if invalid
+        """
+        results = {}
+        for token in tokens:
+            if token not in results:
+                results[token] = self.validate_token(token)
+        return results
+    
     def extract_user_id(self, token_payload: Dict) -> Optional[str]:
         """Extract Supabase user ID from token payload."""
         # Supabase typically uses 'sub' or 'user_id' in the token
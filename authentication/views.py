@@ -1,20 +1,34 @@
-import requests
+import uuid
+from typing import Dict, Tuple
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from django.conf import settings
-from authentication.models import SupabaseUser
+from authentication.audit import get_audit_log
+from authentication.cache import get_user_cache
+from authentication.metrics import timed
+from authentication.models import AuthAuditEvent, RefreshSession, RefreshTokenInUse, SupabaseUser
+from authentication.policy import public
+from authentication.ratelimit import ratelimit
+from authentication.refresh import get_refresh_coalescer
+from authentication.routers import pin_to_primary, replica_aliases, replica_reads
+from authentication.revocation import get_revocation_list
 from authentication.serializers import (
+    IntrospectSerializer,
     LoginSerializer,
-    LoginResponseSerializer,
     LogoutSerializer,
     RefreshTokenSerializer,
-    RefreshTokenResponseSerializer,
+    login_user_data,
+    refresh_token_data,
 )
-from authentication.utils import get_jwt_validator
+from authentication.supabase_client import SupabaseUnavailable, get_supabase_client
+from authentication.utils import bearer_token, get_jwt_validator, has_internal_token
 
 
+@public
+@ratelimit('login', '20/m', key='ip')
+@ratelimit('login', '10/m', key='user')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login_view(request):
@@ -24,7 +38,10 @@ def login_view(request):
     """
     serializer = LoginSerializer(data=request.data)
     
-    if not serializer.is_valid():
+    with timed('validate'):
+        is_valid = serializer.is_valid()
+    
+    if not is_valid:
         return Response(
             {'error': 'Invalid request data', 'details': serializer.errors},
             status=status.HTTP_400_BAD_REQUEST
@@ -35,9 +52,11 @@ def login_view(request):
     
     # Validate the access token
     validator = get_jwt_validator()
-    token_payload = validator.validate_token(access_token)
+    with timed('jwt_decode'):
+        token_payload = validator.validate_token(access_token)
     
     if not token_payload:
+        get_audit_log().record(AuthAuditEvent.LOGIN_FAILED, request, detail='Invalid or expired access token')
         return Response(
             {'error': 'Invalid or expired access token'},
             status=status.HTTP_401_UNAUTHORIZED
@@ -48,63 +67,75 @@ def login_view(request):
     email = token_payload.get('email') or token_payload.get('user_metadata', {}).get('email', '')
     
     if not user_id:
+        get_audit_log().record(AuthAuditEvent.LOGIN_FAILED, request, detail='Invalid token payload')
         return Response(
             {'error': 'Invalid token payload'},
             status=status.HTTP_401_UNAUTHORIZED
         )
     
-    # Get or create user in database
-    user, created = SupabaseUser.objects.update_or_create(
-        supabase_user_id=user_id,
-        defaults={
-            'email': email,
-            'refresh_token': refresh_token,
-        }
-    )
+    device = serializer.validated_data.get('device') or request.META.get('HTTP_USER_AGENT', '')
+    
+    # Pin before writing, so no read in between can put the replica's stale row back in the user cache
+    pin_to_primary(user_id)
+    
+    # Create or update the user (single upsert, no-op if unchanged) and start a session for this device
+    with timed('db_write'):
+        user, created = SupabaseUser.objects.upsert_login(user_id, email)
+        try:
+            RefreshSession.objects.start(user, refresh_token, device)
+        except RefreshTokenInUse:
+            get_audit_log().record(AuthAuditEvent.LOGIN_FAILED, request, user_id=user_id, detail='Refresh token belongs to another user')
+            return Response(
+                {'error': 'Invalid refresh token'},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+    get_user_cache().invalidate(user.supabase_user_id)
+    get_audit_log().record(AuthAuditEvent.LOGIN, request, user_id=user_id)
     
-    response_serializer = LoginResponseSerializer(user)
     return Response(
         {
             'message': 'Login successful',
-            'user': response_serializer.data,
+            'user': login_user_data(user),
             'created': created
         },
         status=status.HTTP_200_OK
     )
 
 
+@public
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def logout_view(request):
     """
-    Public endpoint to logout and remove refresh token.
+    Public endpoint to logout and end the session of a refresh token.
     Optionally accepts a token in the header to identify the user.
     """
-    # Try to get user from request (if token was provided)
-    user = getattr(request, 'user', None)
+    # Revoke the access token so it stops working before it expires
+    access_token = bearer_token(request)
+    user_id = None
+    if access_token:
+        # Identify the user for the audit log while the token is still valid
+        validator = get_jwt_validator()
+        token_payload = validator.validate_token(access_token)
+        user_id = validator.extract_user_id(token_payload) if token_payload else None
+        with timed('db_write'):
+            get_revocation_list().revoke(access_token)
+    get_audit_log().record(AuthAuditEvent.LOGOUT, request, user_id=user_id)
     
-    if user and isinstance(user, SupabaseUser):
-        # Remove refresh token
-        user.refresh_token = None
-        user.save()
+    # End the session of the given refresh token
+    refresh_token = request.data.get('refresh_token')
+    if refresh_token:
+        with timed('db_write'):
+            RefreshSession.objects.end(refresh_token)
         return Response(
             {'message': 'Logout successful'},
             status=status.HTTP_200_OK
         )
     
-    # If no user in request, check if refresh_token is in body
-    refresh_token = request.data.get('refresh_token')
-    if refresh_token:
-        try:
-            user = SupabaseUser.objects.get(refresh_token=refresh_token)
-            user.refresh_token = None
-            user.save()
-            return Response(
-                {'message': 'Logout successful'},
-                status=status.HTTP_200_OK
-            )
-        except SupabaseUser.DoesNotExist:
-            pass
+    # Without a refresh token, log the user from the header out of every device
+    if user_id:
+        with timed('db_write'):
+            RefreshSession.objects.end_all(user_id)
     
     # If we can't identify the user, still return success
     # (idempotent operation)
@@ -114,16 +145,23 @@ def logout_view(request):
     )
 
 
+@public
+@ratelimit('refresh', '60/m', key='ip')
+@ratelimit('refresh', '10/m', key='refresh_token')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def refresh_token_view(request):
     """
     Public endpoint to refresh access token using refresh token.
     Exchanges refresh token with Supabase for new access token.
+    Concurrent refreshes of the same token share a single exchange.
     """
     serializer = RefreshTokenSerializer(data=request.data)
     
-    if not serializer.is_valid():
+    with timed('validate'):
+        is_valid = serializer.is_valid()
+    
+    if not is_valid:
         return Response(
             {'error': 'Invalid request data', 'details': serializer.errors},
             status=status.HTTP_400_BAD_REQUEST
@@ -131,58 +169,139 @@ def refresh_token_view(request):
     
     refresh_token = serializer.validated_data['refresh_token']
     
-    # Verify refresh token exists in our database
+    status_code, data = get_refresh_coalescer().run(
+        refresh_token,
+        lambda: _exchange_refresh_token(request, refresh_token)
+    )
+    return Response(data, status=status_code)
+
+
+def _exchange_refresh_token(request, refresh_token: str) -> Tuple[int, Dict]:
+    """
+    Exchange a refresh token with Supabase and store the rotated token.
+    Coalesced requests share one exchange and so one audit event.
+    
+    Returns:
+        Tuple of (HTTP status code, response data)
+    """
+    # Verify refresh token belongs to an active session
     try:
-        user = SupabaseUser.objects.get(refresh_token=refresh_token)
-    except SupabaseUser.DoesNotExist:
-        return Response(
-            {'error': 'Invalid refresh token'},
-            status=status.HTTP_401_UNAUTHORIZED
-        )
+        with timed('db_read'):
+            session = RefreshSession.objects.get_active(refresh_token)
+    except RefreshSession.DoesNotExist:
+        get_audit_log().record(AuthAuditEvent.REFRESH_FAILED, request, detail='Invalid refresh token')
+        return status.HTTP_401_UNAUTHORIZED, {'error': 'Invalid refresh token'}
+    user_id = session.user.supabase_user_id
     
     # Exchange refresh token with Supabase for new tokens
     supabase_url = getattr(settings, 'SUPABASE_URL', None)
     if not supabase_url:
-        return Response(
-            {'error': 'Supabase configuration error'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, {'error': 'Supabase configuration error'}
     
     # Call Supabase token refresh endpoint
     try:
-        response = requests.post(
-            f"{supabase_url}/auth/v1/token?grant_type=refresh_token",
-            json={'refresh_token': refresh_token},
-            headers={
-                'Content-Type': 'application/json',
-                'apikey': getattr(settings, 'SUPABASE_ANON_KEY', ''),
-            },
-            timeout=10
-        )
+        with timed('upstream'):
+            response = get_supabase_client().refresh_session(refresh_token)
         
         if response.status_code != 200:
-            return Response(
-                {'error': 'Failed to refresh token with Supabase'},
-                status=status.HTTP_401_UNAUTHORIZED
+            get_audit_log().record(
+                AuthAuditEvent.REFRESH_FAILED, request, user_id=user_id, detail='Failed to refresh token with Supabase'
             )
+            return status.HTTP_401_UNAUTHORIZED, {'error': 'Failed to refresh token with Supabase'}
         
         data = response.json()
         new_access_token = data.get('access_token')
         new_refresh_token = data.get('refresh_token', refresh_token)  # Fallback to old if not provided
         
-        # Update refresh token in database
-        user.refresh_token = new_refresh_token
-        user.save()
-        
-        response_serializer = RefreshTokenResponseSerializer({
-            'access_token': new_access_token,
-            'refresh_token': new_refresh_token,
-        })
+        # Pin first, so reads right after the rotation can't miss it on a lagging replica
+        pin_to_primary(user_id)
         
-        return Response(response_serializer.data, status=status.HTTP_200_OK)
+        # Store the rotated token on the session
+        with timed('db_write'):
+            RefreshSession.objects.rotate(session, new_refresh_token)
         
-    except requests.RequestException as e:
+        get_audit_log().record(AuthAuditEvent.REFRESH, request, user_id=user_id)
+        return status.HTTP_200_OK, refresh_token_data(new_access_token, new_refresh_token)
+    
+    except SupabaseUnavailable:
+        get_audit_log().record(
+            AuthAuditEvent.REFRESH_FAILED, request, user_id=user_id, detail='Failed to communicate with Supabase'
+        )
+        return status.HTTP_500_INTERNAL_SERVER_ERROR, {'error': 'Failed to communicate with Supabase'}
+
+
+@public  # Authenticated by the internal service token instead
+@api_view(['POST'])
+@permission_classes([AllowAny])
+def introspect_view(request):
+    """
+    Internal endpoint to validate many user tokens in one call.
+    Callers authenticate with the shared INTERNAL_SERVICE_TOKEN in the
+    X-Internal-Token header. Duplicate tokens are validated once and all
+    users are resolved with a single query, on a read replica if configured.
+    """
+    if not has_internal_token(request):
         return Response(
-            {'error': 'Failed to communicate with Supabase'},
-            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            {'error': 'Invalid internal service token'},
+            status=status.HTTP_403_FORBIDDEN
         )
+    
+    serializer = IntrospectSerializer(data=request.data)
+    
+    with timed('validate'):
+        is_valid = serializer.is_valid()
+    
+    if not is_valid:
+        return Response(
+            {'error': 'Invalid request data', 'details': serializer.errors},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    tokens = serializer.validated_data['tokens']
+    validator = get_jwt_validator()
+    payloads = validator.validate_tokens(tokens)
+    
+    # Collect the user IDs of all valid tokens so they can be fetched together
+    user_ids = {}
+    for token, payload in payloads.items():
+        if not payload:
+            continue
+        try:
+            user_ids[token] = uuid.UUID(str(validator.extract_user_id(payload)))
+        except ValueError:
+            continue
+    
+    wanted = set(user_ids.values())
+    with replica_reads():
+        users = {
+            user.supabase_user_id: user
+            for user in SupabaseUser.objects.filter(
+                supabase_user_id__in=wanted
+            ).only('supabase_user_id', 'email', 'role')
+        }
+    
+    # Users created moments ago may not have reached the replica yet
+    missing = wanted - users.keys()
+    if missing and replica_aliases():
+        users.update(
+            (user.supabase_user_id, user)
+            for user in SupabaseUser.objects.filter(
+                supabase_user_id__in=missing
+            ).only('supabase_user_id', 'email', 'role')
+        )
+    
+    results = []
+    for token in tokens:
+        user = users.get(user_ids.get(token))
+        if user is None:
+            results.append({'active': False})
+            continue
+        results.append({
+            'active': True,
+            'user_id': str(user.supabase_user_id),
+            'email': user.email,
+            'role': user.role,
+            'exp': payloads[token].get('exp'),
+        })
+    
+    return Response({'results': results}, status=status.HTTP_200_OK)
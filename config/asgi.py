@@ -9,8 +9,11 @@ https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 
 import os
 
+from django.conf import settings
 from django.core.asgi import get_asgi_application
+from config.database import disable_persistent_connections
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
+disable_persistent_connections(settings.DATABASES)
 application = get_asgi_application()
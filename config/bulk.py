@@ -0,0 +1,124 @@
+"""
+Streaming bulk loads into PostgreSQL.
+
+    with connection.cursor() as cursor:
+        for staged in copy_in_batches(cursor, 'staging', ['id', 'email'], rows, batch_size=50000):
+            print(f"{staged} rows staged")
+
+Rows are read from an iterator and sent with COPY ... FROM STDIN one batch at
+a time, so memory stays bounded by the batch size however large the input is,
+and each batch costs one round trip instead of one INSERT per row.
+"""
+import csv
+import io
+import json
+import sys
+from contextlib import contextmanager
+from itertools import islice
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Sequence
+
+
+FORMATS = ('jsonl', 'csv')
+
+
+def detect_format(path: str) -> str:
+    """Guess the export format from a file name (JSON Lines unless it ends in .csv)."""
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+@contextmanager
+def open_input(path: str):
+    """Open an export file for reading as text, or stdin for '-'."""
+    if path == '-':
+        yield sys.stdin
+        return
+    with open(path, encoding='utf-8', newline='') as f:
+        yield f
+
+
+def read_records(f: IO[str], format: str) -> Iterator[Dict]:
+    """
+    Yield one dict per record of a JSON Lines or CSV (with header row) stream.
+    
+    Raises:
+        ValueError: If a JSON line can't be parsed (with its line number)
+    """
+    if format == 'csv':
+        yield from csv.DictReader(f)
+        return
+    for line_number, line in enumerate(f, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as exc:
+            raise ValueError(f"Line {line_number}: {exc}") from exc
+
+
+def copy_rows(cursor, table: str, columns: Sequence[str], rows: Iterable[Sequence]) -> int:
+    """
+    COPY rows into a table in one statement.
+    
+    None and empty strings are sent as NULL; every other value is written
+    as text for PostgreSQL to parse into the column's type.
+    
+    Returns:
+        Number of rows sent
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    for row in rows:
+        # csv writes None as an unquoted empty field, which COPY reads as NULL
+        writer.writerow(row)
+        count += 1
+    if not count:
+        return 0
+    buffer.seek(0)
+    
+    connection = cursor.db
+    quote = connection.ops.quote_name
+    sql = f"COPY {quote(table)} ({', '.join(quote(column) for column in columns)}) FROM STDIN WITH (FORMAT csv)"
+    raw_cursor = cursor.cursor
+    # Raise Django's DatabaseError subclasses, as cursor.execute() would
+    with connection.wrap_database_errors:
+        if hasattr(raw_cursor, 'copy_expert'):
+            # psycopg2
+            raw_cursor.copy_expert(sql, buffer)
+        else:
+            # psycopg 3
+            with raw_cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+    return count
+
+
+def copy_in_batches(cursor, table: str, columns: Sequence[str], rows: Iterable[Sequence],
+                    batch_size: int = 50000) -> Iterator[int]:
+    """
+    COPY rows into a table batch_size rows at a time.
+    
+    Yields the running total of rows sent after each batch, so callers can
+    report progress while the input is still being read.
+    """
+    iterator = iter(rows)
+    total = 0
+    while True:
+        batch: List[Sequence] = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        total += copy_rows(cursor, table, columns, batch)
+        yield total
+
+
+def json_field(value) -> Optional[Dict]:
+    """A nested object from a record: already decoded (JSON Lines) or a JSON string (CSV)."""
+    if isinstance(value, dict):
+        return value
+    if isinstance(value, str) and value.strip():
+        try:
+            decoded = json.loads(value)
+        except ValueError:
+            return None
+        return decoded if isinstance(decoded, dict) else None
+    return None
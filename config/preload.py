@@ -0,0 +1,72 @@
+"""
+Entry points for gunicorn's --preload.
+
+    gunicorn config.preload:application --preload --workers 4
+    gunicorn config.preload:asgi_application --preload -k uvicorn.workers.UvicornWorker
+
+With --preload the master process imports this module once and forks the
+workers from it, so a new worker starts with Django set up, the middleware
+and URLconf built and the request-path modules imported and initialised
+instead of doing all of it itself (see `manage.py profile_startup --preload`).
+
+Nothing that can't cross a fork is left behind: database connections are
+closed, and the background threads (revocation sync, audit writer) only
+start on a worker's first request.
+"""
+import gc
+import os
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+
+from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+
+application = get_wsgi_application()
+asgi_application = get_asgi_application()
+
+
+def warm_up():
+    """Do the one-time work that would otherwise slow down each worker's first request."""
+    from django.conf import settings
+    from django.db import connections
+    from rest_framework.settings import api_settings
+    from authentication.renderers import FastJSONRenderer
+    from authentication.serializers import LoginSerializer, RefreshTokenSerializer
+    from authentication.utils import get_jwt_validator
+    
+    # DRF imports its renderer, parser and permission classes from dotted paths on first use
+    for name in (
+        'DEFAULT_RENDERER_CLASSES',
+        'DEFAULT_PARSER_CLASSES',
+        'DEFAULT_AUTHENTICATION_CLASSES',
+        'DEFAULT_PERMISSION_CLASSES',
+        'DEFAULT_CONTENT_NEGOTIATION_CLASS',
+        'DEFAULT_METADATA_CLASS',
+        'DEFAULT_VERSIONING_CLASS',
+        'DEFAULT_THROTTLE_CLASSES',
+        'EXCEPTION_HANDLER',
+    ):
+        getattr(api_settings, name)
+    FastJSONRenderer().render({})
+    
+    # Building the serializers' fields once fills DRF's per-class caches
+    LoginSerializer(data={}).is_valid()
+    RefreshTokenSerializer(data={}).is_valid()
+    
+    get_jwt_validator()
+    if getattr(settings, 'SUPABASE_ASYNC_VIEWS', False):
+        # The async clients are bound to each worker's event loop; just load the code
+        import httpx  # noqa: F401
+    else:
+        from authentication.supabase_client import get_supabase_client
+        # A requests session holds no sockets until its first call, so it can be shared by the fork
+        get_supabase_client()
+    
+    connections.close_all()
+
+
+warm_up()
+
+# Move everything loaded so far out of the garbage collector's view, so
+# collections in the workers don't touch (and copy) the pages they share
+gc.freeze()
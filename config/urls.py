@@ -15,7 +15,12 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.urls import path, include
+from authentication.batch import batch_view
+from authentication.metrics import metrics_view
 
 urlpatterns = [
     path('api/auth/', include('authentication.urls')),
+    path('api/batch/', batch_view, name='batch'),
+    path('api/games/', include('games.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
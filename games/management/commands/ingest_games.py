@@ -0,0 +1,347 @@
+import datetime
+import time
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connections, router, transaction
+from django.utils import timezone
+from config.bulk import FORMATS, copy_rows, detect_format, open_input, read_records
+from games.models import BoxScore, Game, Season, Team
+
+
+GAMES_STAGING = 'games_staging'
+GAMES_STAGING_COLUMNS = (
+    'external_id', 'season', 'date',
+    'home_team', 'home_team_name', 'home_conference',
+    'away_team', 'away_team_name', 'away_conference',
+    'home_score', 'away_score', 'neutral_site', 'status',
+)
+BOX_SCORES_STAGING = 'box_scores_staging'
+BOX_SCORES_STAGING_COLUMNS = ('game', 'team', 'points') + BoxScore.STAT_FIELDS
+
+STATUSES = dict(Game.STATUS_CHOICES)
+
+# Every number in a game record goes into a smallint column
+SMALLINT_MAX = 32767
+
+
+class InvalidRecord(ValueError):
+    pass
+
+
+def _int(value) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord(f"not a number: {value!r}")
+    if number < 0:
+        raise InvalidRecord(f"negative number: {value!r}")
+    if number > SMALLINT_MAX:
+        # Would abort the whole load at COPY time instead of skipping the record
+        raise InvalidRecord(f"number too large: {value!r}")
+    return number
+
+
+def _text(value) -> Optional[str]:
+    if value is None:
+        return None
+    return str(value).strip() or None
+
+
+def _bool(value) -> Optional[bool]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 't', 'y')
+
+
+def season_for(date: datetime.date) -> int:
+    """The season a game date belongs to: November 2025 to April 2026 is 2026."""
+    return date.year + 1 if date.month >= 7 else date.year
+
+
+class Command(BaseCommand):
+    """
+    Load game files into Team, Season, Game and BoxScore.
+    
+    Each record (a JSON Lines object or CSV row) is one game:
+        
+        game_id, date, season (optional, from the date otherwise),
+        home_team, away_team (source team ids), home_team_name, away_team_name,
+        home_conference, away_conference, home_score, away_score,
+        neutral_site, status (scheduled or final, from the scores otherwise),
+        home_<stat> / away_<stat> for the stats in BoxScore.STAT_FIELDS
+    
+    Records are streamed into temporary staging tables with COPY in batches,
+    then merged with one INSERT ... ON CONFLICT per table inside a single
+    transaction: teams and seasons first, then games keyed by their game_id, then
+    box scores keyed by (game, team). Rows that didn't change are not
+    rewritten, so reloading a whole season or re-running a nightly file is
+    idempotent and only touches what is new. A team's box score is loaded
+    when the record has any of its stats.
+    
+    Invalid records are skipped and counted; the first few are reported.
+    """
+    
+    help = 'Load game files (JSON Lines or CSV) into teams, seasons, games and box scores'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="Game files, or '-' for stdin")
+        parser.add_argument('--format', choices=FORMATS, help='Input format (default: from each file extension)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=20000,
+            help='Games sent per COPY (default: 20000)',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Stage, merge and count, then roll back')
+    
+    def handle(self, *args, **options):
+        db = router.db_for_write(Game)
+        connection = connections[db]
+        if connection.vendor != 'postgresql':
+            raise CommandError('ingest_games needs PostgreSQL (it loads with COPY)')
+        
+        self.read = 0
+        self.skipped = 0
+        staged_games = staged_box_scores = 0
+        started = time.perf_counter()
+        
+        try:
+            with transaction.atomic(using=db), connection.cursor() as cursor:
+                self._create_staging(cursor)
+                
+                for path in options['paths']:
+                    format = options['format'] or ('jsonl' if path == '-' else detect_format(path))
+                    with open_input(path) as f:
+                        records = read_records(f, format)
+                        while True:
+                            batch = list(islice(records, options['batch_size']))
+                            if not batch:
+                                break
+                            games, box_scores = self._rows(batch)
+                            staged_games += copy_rows(cursor, GAMES_STAGING, GAMES_STAGING_COLUMNS, games)
+                            staged_box_scores += copy_rows(
+                                cursor, BOX_SCORES_STAGING, BOX_SCORES_STAGING_COLUMNS, box_scores
+                            )
+                            elapsed = time.perf_counter() - started
+                            self.stdout.write(
+                                f"Staged {staged_games} games, {staged_box_scores} box scores "
+                                f"({staged_games / elapsed:,.0f} games/s, {self.skipped} skipped)"
+                            )
+                staging_time = time.perf_counter() - started
+                
+                merge_started = time.perf_counter()
+                # Temporary tables are never auto-analyzed; give the planner row counts for the joins
+                cursor.execute(f"ANALYZE {GAMES_STAGING}")
+                cursor.execute(f"ANALYZE {BOX_SCORES_STAGING}")
+                counts = [
+                    ('seasons', self._merge_seasons(cursor)),
+                    ('teams', self._merge_teams(cursor)),
+                    ('games', self._merge_games(cursor)),
+                    ('box scores', self._merge_box_scores(cursor)),
+                ]
+                merge_time = time.perf_counter() - merge_started
+                
+                if options['dry_run']:
+                    transaction.set_rollback(True, using=db)
+        except (OSError, ValueError, DatabaseError) as exc:
+            # The staging tables are rolled back with everything else
+            raise CommandError(str(exc))
+        
+        self.stdout.write(
+            f"Staged {staged_games} of {self.read} games in {staging_time:.1f}s "
+            f"({staged_games / staging_time if staging_time else 0:,.0f}/s), merged in {merge_time:.1f}s"
+        )
+        summary = ', '.join(f"{name} {created} created / {updated} updated" for name, (created, updated) in counts)
+        prefix = 'Dry run, rolled back. Would have:' if options['dry_run'] else 'Done.'
+        self.stdout.write(self.style.SUCCESS(f"{prefix} {summary}; {self.skipped} records skipped."))
+    
+    def _create_staging(self, cursor):
+        # Dropped at commit; seq keeps the input order so the last copy of a repeated game wins
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE {GAMES_STAGING} (
+                seq bigserial,
+                external_id varchar(64) NOT NULL,
+                season smallint NOT NULL,
+                date date NOT NULL,
+                home_team varchar(64) NOT NULL,
+                home_team_name varchar(255),
+                home_conference varchar(64),
+                away_team varchar(64) NOT NULL,
+                away_team_name varchar(255),
+                away_conference varchar(64),
+                home_score smallint,
+                away_score smallint,
+                neutral_site boolean,
+                status varchar(20) NOT NULL
+            ) ON COMMIT DROP
+        """)
+        stat_columns = ', '.join(f"{field} smallint" for field in BoxScore.STAT_FIELDS)
+        cursor.execute(f"""
+            CREATE TEMPORARY TABLE {BOX_SCORES_STAGING} (
+                seq bigserial,
+                game varchar(64) NOT NULL,
+                team varchar(64) NOT NULL,
+                points smallint NOT NULL,
+                {stat_columns}
+            ) ON COMMIT DROP
+        """)
+    
+    def _rows(self, records: Iterable[Dict]) -> Tuple[List[Tuple], List[Tuple]]:
+        """Turn a batch of records into game and box score staging rows, skipping invalid ones."""
+        games = []
+        box_scores = []
+        for record in records:
+            self.read += 1
+            try:
+                game, teams = self._game_row(record)
+            except InvalidRecord as exc:
+                self.skipped += 1
+                if self.skipped <= 5:
+                    self.stderr.write(f"Skipped record {self.read}: {exc}")
+                continue
+            games.append(game)
+            box_scores.extend(teams)
+        return games, box_scores
+    
+    def _game_row(self, record: Dict) -> Tuple[Tuple, List[Tuple]]:
+        external_id = _text(record.get('game_id'))
+        home_team = _text(record.get('home_team'))
+        away_team = _text(record.get('away_team'))
+        if not external_id or not home_team or not away_team:
+            raise InvalidRecord('game_id, home_team and away_team are required')
+        if home_team == away_team:
+            raise InvalidRecord(f"home_team and away_team are the same: {home_team!r}")
+        try:
+            date = datetime.date.fromisoformat(str(record.get('date') or '')[:10])
+        except ValueError:
+            raise InvalidRecord(f"invalid date: {record.get('date')!r}")
+        
+        home_score = _int(record.get('home_score'))
+        away_score = _int(record.get('away_score'))
+        status = _text(record.get('status'))
+        if status is None:
+            status = Game.STATUS_FINAL if home_score is not None and away_score is not None else Game.STATUS_SCHEDULED
+        elif status.lower() not in STATUSES:
+            raise InvalidRecord(f"unknown status: {status!r}")
+        
+        game = (
+            external_id,
+            _int(record.get('season')) or season_for(date),
+            date,
+            home_team, _text(record.get('home_team_name')), _text(record.get('home_conference')),
+            away_team, _text(record.get('away_team_name')), _text(record.get('away_conference')),
+            home_score,
+            away_score,
+            _bool(record.get('neutral_site')),
+            status.lower(),
+        )
+        
+        box_scores = []
+        for side, team, points in (('home', home_team, home_score), ('away', away_team, away_score)):
+            stats = tuple(_int(record.get(f"{side}_{field}")) for field in BoxScore.STAT_FIELDS)
+            if points is not None and any(value is not None for value in stats):
+                box_scores.append((external_id, team, points) + stats)
+        return game, box_scores
+    
+    def _merge_seasons(self, cursor) -> Tuple[int, int]:
+        table = Season._meta.db_table
+        cursor.execute(f"""
+            WITH merged AS (
+                INSERT INTO {table} (year, start_date, end_date)
+                SELECT season, MIN(date), MAX(date) FROM {GAMES_STAGING} GROUP BY season
+                ON CONFLICT (year) DO UPDATE SET
+                    start_date = LEAST({table}.start_date, EXCLUDED.start_date),
+                    end_date = GREATEST({table}.end_date, EXCLUDED.end_date)
+                WHERE {table}.start_date IS DISTINCT FROM LEAST({table}.start_date, EXCLUDED.start_date)
+                    OR {table}.end_date IS DISTINCT FROM GREATEST({table}.end_date, EXCLUDED.end_date)
+                RETURNING (xmax = 0) AS created
+            )
+            SELECT COUNT(*) FILTER (WHERE created), COUNT(*) FILTER (WHERE NOT created) FROM merged
+        """)
+        return cursor.fetchone()
+    
+    def _merge_teams(self, cursor) -> Tuple[int, int]:
+        """Add new teams and update names and conferences; missing values keep the stored ones."""
+        table = Team._meta.db_table
+        cursor.execute(f"""
+            WITH staged AS (
+                SELECT DISTINCT ON (external_id) external_id, name, conference
+                FROM (
+                    SELECT seq, home_team AS external_id, home_team_name AS name, home_conference AS conference
+                    FROM {GAMES_STAGING}
+                    UNION ALL
+                    SELECT seq, away_team, away_team_name, away_conference FROM {GAMES_STAGING}
+                ) teams
+                -- The latest record that names the team
+                ORDER BY external_id, (name IS NULL), seq DESC
+            ),
+            merged AS (
+                INSERT INTO {table} (external_id, name, conference)
+                SELECT s.external_id, COALESCE(s.name, t.name, s.external_id), COALESCE(s.conference, t.conference, '')
+                FROM staged s
+                LEFT JOIN {table} t ON t.external_id = s.external_id
+                ON CONFLICT (external_id) DO UPDATE SET
+                    name = EXCLUDED.name,
+                    conference = EXCLUDED.conference
+                WHERE ({table}.name, {table}.conference) IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.conference)
+                RETURNING (xmax = 0) AS created
+            )
+            SELECT COUNT(*) FILTER (WHERE created), COUNT(*) FILTER (WHERE NOT created) FROM merged
+        """)
+        return cursor.fetchone()
+    
+    def _merge_games(self, cursor) -> Tuple[int, int]:
+        table = Game._meta.db_table
+        columns = ('season_id', 'date', 'home_team_id', 'away_team_id', 'home_score', 'away_score', 'neutral_site', 'status')
+        cursor.execute(f"""
+            WITH merged AS (
+                INSERT INTO {table} (external_id, {', '.join(columns)}, updated_at)
+                SELECT DISTINCT ON (s.external_id)
+                    s.external_id, season.id, s.date, home.id, away.id,
+                    s.home_score, s.away_score, COALESCE(s.neutral_site, false), s.status, %s
+                FROM {GAMES_STAGING} s
+                JOIN {Season._meta.db_table} season ON season.year = s.season
+                JOIN {Team._meta.db_table} home ON home.external_id = s.home_team
+                JOIN {Team._meta.db_table} away ON away.external_id = s.away_team
+                ORDER BY s.external_id, s.seq DESC
+                ON CONFLICT (external_id) DO UPDATE SET
+                    {', '.join(f'{column} = EXCLUDED.{column}' for column in columns)},
+                    updated_at = EXCLUDED.updated_at
+                WHERE ({', '.join(f'{table}.{column}' for column in columns)})
+                    IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in columns)})
+                RETURNING (xmax = 0) AS created
+            )
+            SELECT COUNT(*) FILTER (WHERE created), COUNT(*) FILTER (WHERE NOT created) FROM merged
+        """, [timezone.now()])
+        return cursor.fetchone()
+    
+    def _merge_box_scores(self, cursor) -> Tuple[int, int]:
+        # Games whose box scores changed count as updated, so ratings pick up their possessions
+        table = BoxScore._meta.db_table
+        columns = ('points',) + BoxScore.STAT_FIELDS
+        cursor.execute(f"""
+            WITH merged AS (
+                INSERT INTO {table} (game_id, team_id, {', '.join(columns)})
+                SELECT DISTINCT ON (game.id, team.id)
+                    game.id, team.id, {', '.join(f's.{column}' for column in columns)}
+                FROM {BOX_SCORES_STAGING} s
+                JOIN {Game._meta.db_table} game ON game.external_id = s.game
+                JOIN {Team._meta.db_table} team ON team.external_id = s.team
+                ORDER BY game.id, team.id, s.seq DESC
+                ON CONFLICT (game_id, team_id) DO UPDATE SET
+                    {', '.join(f'{column} = EXCLUDED.{column}' for column in columns)}
+                WHERE ({', '.join(f'{table}.{column}' for column in columns)})
+                    IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in columns)})
+                RETURNING game_id, (xmax = 0) AS created
+            ),
+            touched AS (
+                UPDATE {Game._meta.db_table} SET updated_at = %s WHERE id IN (SELECT game_id FROM merged)
+            )
+            SELECT COUNT(*) FILTER (WHERE created), COUNT(*) FILTER (WHERE NOT created) FROM merged
+        """, [timezone.now()])
+        return cursor.fetchone()
@@ -0,0 +1,116 @@
+# Generated by Django 4.2.11 on 2026-10-17 02:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    
+    initial = True
+    
+    dependencies = [
+    ]
+    
+    operations = [
+        migrations.CreateModel(
+            name='Season',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(unique=True)),
+                ('start_date', models.DateField(blank=True, null=True)),
+                ('end_date', models.DateField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Season',
+                'verbose_name_plural': 'Seasons',
+                'db_table': 'seasons',
+            },
+        ),
+        migrations.CreateModel(
+            name='Team',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('conference', models.CharField(blank=True, default='', max_length=64)),
+            ],
+            options={
+                'verbose_name': 'Team',
+                'verbose_name_plural': 'Teams',
+                'db_table': 'teams',
+            },
+        ),
+        migrations.CreateModel(
+            name='Game',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('external_id', models.CharField(max_length=64, unique=True)),
+                ('date', models.DateField()),
+                ('home_score', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('away_score', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('neutral_site', models.BooleanField(default=False)),
+                ('status', models.CharField(choices=[('scheduled', 'Scheduled'), ('final', 'Final')], default='scheduled', max_length=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('away_team', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='away_games', to='games.team')),
+                ('home_team', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='home_games', to='games.team')),
+                ('season', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='games', to='games.season')),
+            ],
+            options={
+                'verbose_name': 'Game',
+                'verbose_name_plural': 'Games',
+                'db_table': 'games',
+            },
+        ),
+        migrations.CreateModel(
+            name='BoxScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('points', models.PositiveSmallIntegerField()),
+                ('minutes', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('fgm', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('fga', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('fg3m', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('fg3a', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('ftm', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('fta', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('oreb', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('dreb', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('ast', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('stl', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('blk', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('tov', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('pf', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('game', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='box_scores', to='games.game')),
+                ('team', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='box_scores', to='games.team')),
+            ],
+            options={
+                'verbose_name': 'Box Score',
+                'verbose_name_plural': 'Box Scores',
+                'db_table': 'box_scores',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['date'], name='games_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['season', 'date'], name='games_season_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['home_team', 'date'], name='games_home_team_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['away_team', 'date'], name='games_away_team_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='boxscore',
+            index=models.Index(fields=['team', 'game'], name='box_scores_team_game_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='boxscore',
+            constraint=models.UniqueConstraint(fields=('game', 'team'), name='box_scores_game_team_uniq'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.11 on 2026-10-17 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['updated_at'], name='games_updated_at_idx'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+from django.db import models
+
+
+class Team(models.Model):
+    """A team, identified by the id the game data source gives it."""
+    
+    external_id = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    conference = models.CharField(max_length=64, blank=True, default='')
+    
+    class Meta:
+        db_table = 'teams'
+        verbose_name = 'Team'
+        verbose_name_plural = 'Teams'
+    
+    def __str__(self):
+        return self.name
+
+
+class Season(models.Model):
+    """A season, named by the year it ends in (2025-26 is 2026)."""
+    
+    year = models.PositiveSmallIntegerField(unique=True)
+    # First and last game date loaded so far
+    start_date = models.DateField(null=True, blank=True)
+    end_date = models.DateField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'seasons'
+        verbose_name = 'Season'
+        verbose_name_plural = 'Seasons'
+    
+    def __str__(self):
+        return f"{self.year - 1}-{str(self.year)[-2:]}"
+
+
+class Game(models.Model):
+    """One game, keyed by the source's game id so reloads update it in place."""
+    
+    STATUS_SCHEDULED = 'scheduled'
+    STATUS_FINAL = 'final'
+    STATUS_CHOICES = [
+        (STATUS_SCHEDULED, 'Scheduled'),
+        (STATUS_FINAL, 'Final'),
+    ]
+    
+    external_id = models.CharField(max_length=64, unique=True)
+    # Foreign keys are indexed through the composite indexes below, which lead with them
+    season = models.ForeignKey(Season, on_delete=models.CASCADE, related_name='games', db_index=False)
+    date = models.DateField()
+    home_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='home_games', db_index=False)
+    away_team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='away_games', db_index=False)
+    home_score = models.PositiveSmallIntegerField(null=True, blank=True)
+    away_score = models.PositiveSmallIntegerField(null=True, blank=True)
+    neutral_site = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_SCHEDULED)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        db_table = 'games'
+        verbose_name = 'Game'
+        verbose_name_plural = 'Games'
+        indexes = [
+            models.Index(fields=['date'], name='games_date_idx'),
+            models.Index(fields=['season', 'date'], name='games_season_date_idx'),
+            models.Index(fields=['home_team', 'date'], name='games_home_team_date_idx'),
+            models.Index(fields=['away_team', 'date'], name='games_away_team_date_idx'),
+            # Ratings refreshes look for the games changed since their last one
+            models.Index(fields=['updated_at'], name='games_updated_at_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.external_id} ({self.date})"
+
+
+class BoxScore(models.Model):
+    """One team's totals in one game."""
+    
+    # Per-team stat columns of game files (home_fgm, away_fgm, ...); all optional
+    STAT_FIELDS = (
+        'minutes', 'fgm', 'fga', 'fg3m', 'fg3a', 'ftm', 'fta',
+        'oreb', 'dreb', 'ast', 'stl', 'blk', 'tov', 'pf',
+    )
+    
+    # Indexed by the unique constraint below, which leads with it
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='box_scores', db_index=False)
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='box_scores', db_index=False)
+    points = models.PositiveSmallIntegerField()
+    minutes = models.PositiveSmallIntegerField(null=True, blank=True)
+    fgm = models.PositiveSmallIntegerField(null=True, blank=True)
+    fga = models.PositiveSmallIntegerField(null=True, blank=True)
+    fg3m = models.PositiveSmallIntegerField(null=True, blank=True)
+    fg3a = models.PositiveSmallIntegerField(null=True, blank=True)
+    ftm = models.PositiveSmallIntegerField(null=True, blank=True)
+    fta = models.PositiveSmallIntegerField(null=True, blank=True)
+    oreb = models.PositiveSmallIntegerField(null=True, blank=True)
+    dreb = models.PositiveSmallIntegerField(null=True, blank=True)
+    ast = models.PositiveSmallIntegerField(null=True, blank=True)
+    stl = models.PositiveSmallIntegerField(null=True, blank=True)
+    blk = models.PositiveSmallIntegerField(null=True, blank=True)
+    tov = models.PositiveSmallIntegerField(null=True, blank=True)
+    pf = models.PositiveSmallIntegerField(null=True, blank=True)
+    
+    class Meta:
+        db_table = 'box_scores'
+        verbose_name = 'Box Score'
+        verbose_name_plural = 'Box Scores'
+        indexes = [
+            models.Index(fields=['team', 'game'], name='box_scores_team_game_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['game', 'team'], name='box_scores_game_team_uniq'),
+        ]
+    
+    def __str__(self):
+        return f"{self.team_id} in {self.game_id}: {self.points}"
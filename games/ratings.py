@@ -0,0 +1,346 @@
+"""
+Team strength ratings for a season, computed with NumPy.
+
+Two ratings are kept per team:
+
+- Adjusted efficiency: points scored and allowed per 100 possessions,
+  adjusted for opponents and home court. Each team-game is one observation of
+  100 * points / possessions = mu + O[offense] - D[defense] + h * home_side,
+  and O and D are the ridge-regularized least-squares solution. The normal
+  equations are accumulated straight from the games' team index arrays,
+  without building the games x teams design matrix, so new games only add
+  their terms and the ratings are re-solved from a (2 * teams + 2)-square system.
+- Elo with a margin-of-victory multiplier, applied a day at a time: all games
+  of a day are one vectorized step from the ratings before that day.
+
+A season is loaded once; later refreshes only fetch the games updated since
+(Game.updated_at, which ingest_games sets). New games are added to the normal
+equations and Elo incrementally, corrected games are swapped out of the
+normal equations, and Elo is replayed from the start only when a past day
+changed. A game that is deleted or stops being a final game of the season,
+or joins it without a new updated_at, makes the next refresh reload the season.
+"""
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, List, Optional
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+from authentication.routers import replica_reads
+from games.models import BoxScore, Game, Team
+
+
+# Possessions from box score totals: FGA - OREB + TOV + 0.475 * FTA
+FTA_POSSESSION_FACTOR = 0.475
+# Used for games without usable box scores, about the D-I average
+DEFAULT_POSSESSIONS = 68.0
+
+# Parameter layout of the efficiency model: mu, home court, then O and D per team
+MU, HOME, TEAMS_START = 0, 1, 2
+
+
+class SeasonRatings:
+    """
+    Ratings of every team with a final game in one season.
+    
+    Thread-safe: one thread refreshes while the others keep serving the
+    previous snapshot.
+    """
+    
+    ELO_START = 1500.0
+    ELO_K = 20.0
+    ELO_HOME_ADVANTAGE = 100.0
+    # Shrinks team ratings toward average; keeps early-season ratings stable and the system solvable
+    RIDGE = 1.0
+    # Games stamped shortly before the last refresh are fetched again, in case a
+    # slower load committed them after it; unchanged ones are ignored
+    WATERMARK_OVERLAP = timedelta(minutes=10)
+    
+    def __init__(self, year: int):
+        self.year = year
+        self.lock = threading.Lock()
+        self.refreshed_at: Optional[float] = None
+        self.snapshot: Optional[Dict] = None
+        self._reset()
+    
+    def _reset(self):
+        """Forget every loaded game, so the next fetch loads the season from scratch."""
+        self.watermark = None
+        self.team_ids = np.empty(0, dtype=np.int64)
+        self._team_index: Dict[int, int] = {}
+        self._teams: Dict[int, Dict] = {}
+        
+        # One entry per game, in load order
+        self._game_index: Dict[int, int] = {}
+        self.game_ids = np.empty(0, dtype=np.int64)
+        self.days = np.empty(0, dtype=np.int64)
+        self.home = np.empty(0, dtype=np.int64)
+        self.away = np.empty(0, dtype=np.int64)
+        self.home_points = np.empty(0, dtype=np.float64)
+        self.away_points = np.empty(0, dtype=np.float64)
+        self.neutral = np.empty(0, dtype=bool)
+        self.possessions = np.empty(0, dtype=np.float64)
+        
+        self._normal = np.zeros((TEAMS_START, TEAMS_START))
+        self._rhs = np.zeros(TEAMS_START)
+        self.elo = np.empty(0)
+        self._elo_day: Optional[int] = None
+    
+    def refresh(self, max_age: Optional[float] = None) -> bool:
+        """
+        Apply games updated since the last refresh, at most every max_age seconds.
+        
+        Returns:
+            True if the ratings changed
+        """
+        if max_age is None:
+            max_age = getattr(settings, 'RATINGS_REFRESH_INTERVAL', 30)
+        if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < max_age:
+            return False
+        with self.lock:
+            # Another thread may have refreshed while we waited
+            if self.refreshed_at is not None and time.monotonic() - self.refreshed_at < max_age:
+                return False
+            rows, possessions, stale = self._fetch()
+            if stale:
+                # Rare enough that reloading the season beats taking games back out of everything
+                self._reset()
+                rows, possessions, _ = self._fetch()
+                self._update(rows, possessions)
+                changed = True
+            else:
+                changed = self._update(rows, possessions)
+            if changed or self.snapshot is None:
+                self._publish()
+            self.refreshed_at = time.monotonic()
+            return changed
+    
+    def _fetch(self):
+        """
+        Load the final games updated since the watermark, with their possessions.
+        
+        Returns:
+            Tuple of (game rows, possessions by game, whether a loaded game has
+            since been deleted or stopped being a final game of this season)
+        """
+        final = Game.objects.filter(
+            season__year=self.year,
+            status=Game.STATUS_FINAL,
+            home_score__isnull=False,
+            away_score__isnull=False,
+        )
+        games = final
+        if self.watermark is not None:
+            updated = Game.objects.filter(updated_at__gt=self.watermark - self.WATERMARK_OVERLAP)
+            games = final & updated
+        
+        # Ratings can trail the primary by a few seconds
+        with replica_reads():
+            rows = list(games.values_list(
+                'pk', 'date', 'home_team_id', 'away_team_id', 'home_score', 'away_score', 'neutral_site', 'updated_at',
+            ))
+            box_scores = list(
+                BoxScore.objects.filter(game__in=games.values('pk'))
+                .values_list('game_id', 'fga', 'oreb', 'tov', 'fta')
+            )
+            stale = False
+            if self.watermark is not None:
+                # Deleted games leave no row to fetch, and games set back to scheduled, cleared or
+                # moved to another season no longer match; comparing the ids catches a delete and
+                # an add in the same window, which a count would miss
+                loaded = self._game_index.keys() | {row[0] for row in rows}
+                stale = set(final.values_list('pk', flat=True)) != loaded
+        
+        possessions: Dict[int, List[float]] = {}
+        for game_id, fga, oreb, tov, fta in box_scores:
+            if None not in (fga, oreb, tov, fta):
+                estimate = fga - oreb + tov + FTA_POSSESSION_FACTOR * fta
+                # Zeroed or partial box scores can't be right and would make the efficiency infinite
+                if estimate > 0:
+                    possessions.setdefault(game_id, []).append(estimate)
+        return rows, {game_id: sum(values) / len(values) for game_id, values in possessions.items()}, stale
+    
+    def _update(self, rows, possessions: Dict[int, float]) -> bool:
+        """Fold fetched games into the arrays, normal equations and Elo."""
+        if not rows:
+            return False
+        self.watermark = max(row[-1] for row in rows)
+        
+        game_ids, dates, home_ids, away_ids, home_points, away_points, neutral, _ = zip(*rows)
+        game_ids = np.array(game_ids, dtype=np.int64)
+        columns = {
+            'days': np.array([date.toordinal() for date in dates], dtype=np.int64),
+            'home_points': np.array(home_points, dtype=np.float64),
+            'away_points': np.array(away_points, dtype=np.float64),
+            'neutral': np.array(neutral, dtype=bool),
+            'possessions': np.array([possessions.get(pk, np.nan) for pk in game_ids.tolist()], dtype=np.float64),
+        }
+        
+        new_teams = sorted({*home_ids, *away_ids} - self._team_index.keys())
+        if new_teams:
+            self._add_teams(new_teams)
+        columns['home'] = np.array([self._team_index[pk] for pk in home_ids], dtype=np.int64)
+        columns['away'] = np.array([self._team_index[pk] for pk in away_ids], dtype=np.int64)
+        
+        positions = np.array([self._game_index.get(pk, -1) for pk in game_ids.tolist()], dtype=np.int64)
+        known = positions >= 0
+        # Games fetched again only because of the watermark overlap are left alone
+        differs = np.zeros(len(game_ids), dtype=bool)
+        for name, values in columns.items():
+            current = getattr(self, name)[positions[known]]
+            if name == 'possessions':
+                same = np.isclose(current, values[known], equal_nan=True)
+            else:
+                same = current == values[known]
+            differs[known] |= ~same
+        changed = positions[known & differs]
+        added = ~known
+        
+        if not len(changed) and not added.any():
+            return bool(new_teams)
+        
+        replay_elo = bool(new_teams) or len(changed) > 0
+        if len(changed) and not new_teams:
+            # Take the old version of corrected games out before overwriting them
+            self._accumulate(changed, -1.0)
+        for name, values in columns.items():
+            getattr(self, name)[changed] = values[known & differs]
+        
+        first_added = len(self.game_ids)
+        count = int(added.sum())
+        self.game_ids = np.concatenate([self.game_ids, game_ids[added]])
+        for name, values in columns.items():
+            setattr(self, name, np.concatenate([getattr(self, name), values[added]]))
+        for offset, pk in enumerate(game_ids[added].tolist()):
+            self._game_index[pk] = first_added + offset
+        added_rows = np.arange(first_added, first_added + count)
+        
+        if new_teams:
+            # The parameter layout grew, so rebuild the normal equations from every game
+            self._normal = np.zeros((TEAMS_START + 2 * len(self.team_ids),) * 2)
+            self._rhs = np.zeros(TEAMS_START + 2 * len(self.team_ids))
+            self._accumulate(np.arange(len(self.game_ids)), 1.0)
+        else:
+            self._accumulate(np.concatenate([changed, added_rows]), 1.0)
+        
+        if not replay_elo and self._elo_day is not None and count and self.days[added_rows].min() <= self._elo_day:
+            replay_elo = True
+        if replay_elo or self._elo_day is None:
+            self.elo = np.full(len(self.team_ids), self.ELO_START)
+            self._apply_elo(np.arange(len(self.game_ids)))
+        else:
+            self._apply_elo(added_rows)
+        return True
+    
+    def _add_teams(self, team_ids: List[int]):
+        self._team_index.update({pk: len(self.team_ids) + offset for offset, pk in enumerate(team_ids)})
+        self.team_ids = np.concatenate([self.team_ids, np.array(team_ids, dtype=np.int64)])
+        self._teams.update({
+            team['pk']: team
+            for team in Team.objects.filter(pk__in=team_ids).values('pk', 'external_id', 'name', 'conference')
+        })
+    
+    def _accumulate(self, rows: np.ndarray, sign: float):
+        """Add (sign=1) or remove (sign=-1) the games' terms of the normal equations."""
+        if not len(rows):
+            return
+        team_count = len(self.team_ids)
+        home, away = self.home[rows], self.away[rows]
+        possessions = self.possessions[rows]
+        # One infinite efficiency would turn every rating NaN for good
+        possessions = np.where(np.isfinite(possessions) & (possessions > 0), possessions, DEFAULT_POSSESSIONS)
+        home_side = np.where(self.neutral[rows], 0.0, 1.0)
+        
+        # Two observations per game: each side's offense against the other's defense
+        offense = np.concatenate([home, away])
+        defense = np.concatenate([away, home])
+        side = np.concatenate([home_side, -home_side])
+        efficiency = 100.0 * np.concatenate([self.home_points[rows], self.away_points[rows]]) / np.tile(possessions, 2)
+        
+        # The four non-zero columns of each observation's row of the design matrix, and their values
+        observations = len(offense)
+        columns = np.stack([
+            np.full(observations, MU),
+            np.full(observations, HOME),
+            TEAMS_START + offense,
+            TEAMS_START + team_count + defense,
+        ], axis=1)
+        values = np.stack([np.ones(observations), side, np.ones(observations), -np.ones(observations)], axis=1)
+        
+        np.add.at(self._normal, (columns[:, :, None], columns[:, None, :]), sign * values[:, :, None] * values[:, None, :])
+        np.add.at(self._rhs, columns, sign * values * efficiency[:, None])
+    
+    def _apply_elo(self, rows: np.ndarray):
+        """Run Elo over the given games, one vectorized step per day."""
+        if not len(rows):
+            return
+        rows = rows[np.argsort(self.days[rows], kind='stable')]
+        days = self.days[rows]
+        for day in np.split(rows, np.flatnonzero(np.diff(days)) + 1):
+            home, away = self.home[day], self.away[day]
+            difference = self.elo[home] - self.elo[away] + np.where(self.neutral[day], 0.0, self.ELO_HOME_ADVANTAGE)
+            expected = 1.0 / (1.0 + 10.0 ** (-difference / 400.0))
+            margin = self.home_points[day] - self.away_points[day]
+            home_won = (margin > 0).astype(np.float64)
+            # Bigger wins count more, less so when the favourite wins (FiveThirtyEight's multiplier)
+            winner_difference = np.where(margin > 0, difference, -difference)
+            multiplier = np.log(np.abs(margin) + 1.0) * 2.2 / (winner_difference * 0.001 + 2.2)
+            change = self.ELO_K * multiplier * (home_won - expected)
+            np.add.at(self.elo, home, change)
+            np.add.at(self.elo, away, -change)
+        self._elo_day = int(max(days.max(), self._elo_day if self._elo_day is not None else days.max()))
+    
+    def _publish(self):
+        """Solve the efficiency model and build the snapshot the API serves."""
+        team_count = len(self.team_ids)
+        teams = []
+        home_advantage = 0.0
+        if team_count:
+            regularization = np.full(TEAMS_START + 2 * team_count, self.RIDGE)
+            # Barely regularize mu and home court, only enough to stay solvable without home games
+            regularization[:TEAMS_START] = 1e-6
+            solution = np.linalg.solve(self._normal + np.diag(regularization), self._rhs)
+            mu, home_advantage = solution[MU], solution[HOME]
+            offense = mu + solution[TEAMS_START:TEAMS_START + team_count]
+            defense = mu - solution[TEAMS_START + team_count:]
+            games = np.bincount(self.home, minlength=team_count) + np.bincount(self.away, minlength=team_count)
+            
+            net = offense - defense
+            for rank, index in enumerate(np.argsort(-net, kind='stable').tolist(), start=1):
+                team = self._teams.get(int(self.team_ids[index]), {})
+                teams.append({
+                    'rank': rank,
+                    'team_id': team.get('external_id'),
+                    'name': team.get('name'),
+                    'conference': team.get('conference'),
+                    'games': int(games[index]),
+                    'adj_offense': round(float(offense[index]), 2),
+                    'adj_defense': round(float(defense[index]), 2),
+                    'adj_margin': round(float(net[index]), 2),
+                    'elo': round(float(self.elo[index]), 1),
+                })
+        
+        self.snapshot = {
+            'season': self.year,
+            'games': len(self.game_ids),
+            # Points per 100 possessions the home side gains (and the visitor loses)
+            'home_advantage': round(float(home_advantage), 2),
+            'computed_at': timezone.now(),
+            'teams': teams,
+        }
+
+
+# Singleton instances by season
+_season_ratings: Dict[int, SeasonRatings] = {}
+_season_ratings_lock = threading.Lock()
+
+
+def get_season_ratings(year: int) -> SeasonRatings:
+    """Get or create the ratings of a season, refreshed up to RATINGS_REFRESH_INTERVAL seconds ago."""
+    ratings = _season_ratings.get(year)
+    if ratings is None:
+        with _season_ratings_lock:
+            ratings = _season_ratings.setdefault(year, SeasonRatings(year))
+    ratings.refresh()
+    return ratings
@@ -0,0 +1,133 @@
+import datetime
+import json
+import math
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase
+from django.utils import timezone
+from games.models import BoxScore, Game, Season, Team
+from games.ratings import SeasonRatings
+
+
+class IngestGamesTests(TestCase):
+    
+    def ingest(self, *records):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+            f.flush()
+            call_command('ingest_games', f.name, stdout=mock.Mock(), stderr=mock.Mock())
+    
+    def test_numbers_too_large_for_their_column_skip_the_record(self):
+        self.ingest(
+            {'game_id': 'g1', 'date': '2025-11-10', 'home_team': 'a', 'away_team': 'b', 'home_score': 70, 'away_score': 60},
+            {'game_id': 'g2', 'date': '2025-11-12', 'home_team': 'a', 'away_team': 'c', 'home_score': 40000, 'away_score': 60},
+            {'game_id': 'g3', 'date': '2025-11-12', 'home_team': 'b', 'away_team': 'c', 'home_score': 70, 'away_score': 60, 'home_fga': 70000},
+        )
+        self.assertEqual(list(Game.objects.values_list('external_id', flat=True)), ['g1'])
+    
+    def test_games_of_a_team_against_itself_skip_the_record(self):
+        self.ingest(
+            {'game_id': 'g1', 'date': '2025-11-10', 'home_team': 'a', 'away_team': 'b', 'home_score': 70, 'away_score': 60},
+            {'game_id': 'g2', 'date': '2025-11-12', 'home_team': 'a', 'away_team': 'a', 'home_score': 70, 'away_score': 60},
+            {'game_id': 'g3', 'date': '2025-11-12', 'home_team': ' b', 'away_team': 'b', 'home_score': 70, 'away_score': 60},
+        )
+        self.assertEqual(list(Game.objects.values_list('external_id', flat=True)), ['g1'])
+
+
+class SeasonRatingsTests(TransactionTestCase):
+    # Some reads go to a replica when one is configured
+    databases = '__all__'
+    
+    def setUp(self):
+        self.season = Season.objects.create(year=2026)
+        self.teams = [Team.objects.create(external_id=name, name=name) for name in ('a', 'b', 'c')]
+    
+    def game(self, external_id, home, away, home_score=70, away_score=60, **fields):
+        return Game.objects.create(
+            external_id=external_id,
+            season=fields.pop('season', self.season),
+            date=fields.pop('date', datetime.date(2025, 11, 10)),
+            home_team=self.teams[home],
+            away_team=self.teams[away],
+            home_score=home_score,
+            away_score=away_score,
+            status=fields.pop('status', Game.STATUS_FINAL),
+            **fields,
+        )
+    
+    def ratings(self, ratings=None):
+        ratings = ratings or SeasonRatings(2026)
+        ratings.refresh(max_age=0)
+        return ratings
+    
+    def test_non_positive_possession_estimates_fall_back_to_the_default(self):
+        game = self.game('g1', 0, 1)
+        self.game('g2', 1, 2, date=datetime.date(2025, 11, 12))
+        for team in self.teams[:2]:
+            BoxScore.objects.create(game=game, team=team, points=70, fga=0, oreb=0, tov=0, fta=0)
+        
+        ratings = self.ratings()
+        for team in ratings.snapshot['teams']:
+            self.assertTrue(math.isfinite(team['adj_offense']), team)
+            self.assertTrue(math.isfinite(team['adj_defense']), team)
+        # Treated like a game without box scores
+        self.assertTrue(math.isnan(ratings.possessions[ratings._game_index[game.pk]]))
+    
+    def test_games_that_stop_qualifying_are_removed(self):
+        scheduled = self.game('g1', 0, 1)
+        cleared = self.game('g2', 1, 2)
+        moved = self.game('g3', 0, 2)
+        self.game('g4', 2, 0, date=datetime.date(2025, 11, 12))
+        ratings = self.ratings()
+        self.assertEqual(ratings.snapshot['games'], 4)
+        
+        scheduled.status = Game.STATUS_SCHEDULED
+        scheduled.save()
+        ratings = self.ratings(ratings)
+        self.assertEqual(ratings.snapshot['games'], 3)
+        
+        cleared.home_score = None
+        cleared.save()
+        moved.season = Season.objects.create(year=2025)
+        moved.save()
+        ratings = self.ratings(ratings)
+        self.assertEqual(ratings.snapshot['games'], 1)
+        self.assertEqual(sorted(team['games'] for team in ratings.snapshot['teams']), [1, 1])
+    
+    def test_deleted_games_are_removed(self):
+        deleted = self.game('g1', 0, 1)
+        self.game('g2', 1, 2)
+        ratings = self.ratings()
+        
+        deleted.delete()
+        ratings = self.ratings(ratings)
+        self.assertEqual(ratings.snapshot['games'], 1)
+        self.assertEqual(ratings.snapshot, self.ratings().snapshot | {'computed_at': ratings.snapshot['computed_at']})
+    
+    def test_game_deleted_while_another_arrives_unstamped(self):
+        deleted = self.game('g1', 0, 1)
+        self.game('g2', 1, 2)
+        moved = self.game('g3', 0, 2, season=Season.objects.create(year=2025))
+        Game.objects.filter(pk=moved.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        ratings = self.ratings()
+        
+        # Same number of games, but not the same games; update() leaves updated_at alone
+        deleted.delete()
+        Game.objects.filter(pk=moved.pk).update(season=self.season)
+        ratings = self.ratings(ratings)
+        self.assertEqual(ratings.snapshot['games'], 2)
+        self.assertEqual(ratings.snapshot, self.ratings().snapshot | {'computed_at': ratings.snapshot['computed_at']})
+    
+    def test_new_and_corrected_games_do_not_reload_the_season(self):
+        corrected = self.game('g1', 0, 1)
+        ratings = self.ratings()
+        
+        corrected.home_score = 80
+        corrected.save()
+        self.game('g2', 1, 2, date=datetime.date(2025, 11, 12))
+        with mock.patch.object(ratings, '_reset', wraps=ratings._reset) as reset:
+            ratings = self.ratings(ratings)
+        reset.assert_not_called()
+        self.assertEqual(ratings.snapshot['games'], 2)
@@ -0,0 +1,8 @@
+from django.urls import path
+from games import views
+
+app_name = 'games'
+
+urlpatterns = [
+    path('ratings/', views.ratings_view, name='ratings'),
+]
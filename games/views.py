@@ -0,0 +1,30 @@
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from authentication.policy import authenticated
+from games.models import Season
+from games.ratings import get_season_ratings
+
+
+@authenticated
+@api_view(['GET'])
+def ratings_view(request):
+    """
+    Team ratings of a season (?season=<end year>, default: the latest).
+    
+    Served from the in-process ratings, refreshed with newly ingested games
+    at most every RATINGS_REFRESH_INTERVAL seconds.
+    """
+    year = request.query_params.get('season')
+    if year is None:
+        year = Season.objects.order_by('-year').values_list('year', flat=True).first()
+    else:
+        try:
+            year = int(year)
+        except ValueError:
+            return Response({'error': 'season must be a year'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if year is None or not Season.objects.filter(year=year).exists():
+        return Response({'error': 'Season not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    return Response(get_season_ratings(year).snapshot)
@@ -0,0 +1,89 @@
+"""
+Gunicorn configuration for production (`./serve.sh`, or `gunicorn -c gunicorn.conf.py`).
+
+Settings come from the environment:
+    
+    GUNICORN_WORKER_CLASS   sync, gthread (default) or uvicorn (ASGI, for SUPABASE_ASYNC_VIEWS)
+    WEB_CONCURRENCY         Worker processes (default: sized from the CPUs available)
+    GUNICORN_THREADS        Threads per gthread worker (default 4)
+    PORT / GUNICORN_BIND    Listen address (default 0.0.0.0:5000)
+    GUNICORN_MAX_REQUESTS   Requests before a worker is replaced (default 1000, 0 to never)
+    GUNICORN_MAX_REQUESTS_JITTER, GUNICORN_TIMEOUT, GUNICORN_GRACEFUL_TIMEOUT, GUNICORN_KEEPALIVE
+
+The app is preloaded from config.preload in the master, so workers are forked
+with Django set up and the request path warmed up, and share those pages with
+the master until they write to them.
+"""
+import os
+
+
+def _cpu_count() -> int:
+    # Only the CPUs this process may run on, e.g. inside a container limited with cpusets
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+_worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread').lower()
+_cpus = _cpu_count()
+
+if _worker_class == 'uvicorn':
+    # One event loop per CPU; upstream waits don't hold a worker
+    wsgi_app = 'config.preload:asgi_application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    _default_workers = _cpus
+elif _worker_class == 'gthread':
+    wsgi_app = 'config.preload:application'
+    worker_class = 'gthread'
+    threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+    _default_workers = _cpus + 1
+elif _worker_class == 'sync':
+    # A sync worker is blocked for the whole of a slow Supabase refresh, so run more of them
+    wsgi_app = 'config.preload:application'
+    worker_class = 'sync'
+    _default_workers = 2 * _cpus + 1
+else:
+    raise ValueError(f"GUNICORN_WORKER_CLASS must be sync, gthread or uvicorn, not {_worker_class!r}")
+
+workers = int(os.environ.get('WEB_CONCURRENCY', str(_default_workers)))
+bind = os.environ.get('GUNICORN_BIND') or f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+# Import Django and warm up once in the master instead of in every worker
+preload_app = True
+
+# Replace workers after a while so slow leaks and fragmentation can't build up;
+# the jitter keeps them from all restarting at the same moment
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', '100'))
+
+# Kill a worker stuck longer than this; must exceed a full Supabase call (connect + read timeout)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '30'))
+# On SIGTERM (deploys, max_requests) workers finish in-flight requests for up to this long
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', '5'))
+
+# Heartbeat files in memory rather than on a possibly slow or read-only disk
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """Give the new worker its own copies of the state it must not share with its siblings."""
+    from authentication.utils import get_jwt_validator
+    get_jwt_validator().after_fork()
+    if _worker_class == 'uvicorn':
+        # The master also built the WSGI app, so this is only known once a worker is forked
+        from django.conf import settings
+        from config.database import disable_persistent_connections
+        disable_persistent_connections(settings.DATABASES)
+
+
+def worker_exit(server, worker):
+    """Write out what the worker still holds in memory before it goes away."""
+    from authentication import audit, revocation
+    if audit._audit_log is not None:
+        audit._audit_log.stop()
+    if revocation._revocation_list is not None:
+        revocation._revocation_list.stop()
@@ -30,7 +30,7 @@ echo "Installing dependencies..."
 pip install -r requirements.txt
 
 echo "Creating migrations..."
-python manage.py makemigrations authentication
+python manage.py makemigrations authentication games
 echo "Running migrations..."
 python manage.py migrate
 
@@ -0,0 +1,18 @@
+#!/bin/bash
+# Script to run the production server (gunicorn, configured in gunicorn.conf.py)
+# Pick the worker type with GUNICORN_WORKER_CLASS=sync|gthread|uvicorn
+
+# Load .env file if present (in production the variables usually come from the environment)
+if [ -f .env ]; then
+    export $(grep -v '^#' .env | xargs)
+fi
+
+# Check for virtual environment
+if [ -d "venv" ]; then
+    source venv/bin/activate
+elif [ -d ".venv" ]; then
+    source .venv/bin/activate
+fi
+
+# exec so gunicorn receives the platform's SIGTERM directly and shuts down gracefully
+exec gunicorn -c gunicorn.conf.py "$@"